@@ -0,0 +1,225 @@
+"""
+Admission control for API requests.
+
+Reads and writes are admitted through separate gates, each with its own
+concurrency limit and queue. A request that finds its queue full, or waits
+in it for longer than the queue timeout, is answered with 503 and
+Retry-After straight away, so an overloaded server sheds the excess
+quickly instead of letting every request wait on SQLite's write lock until
+it times out.
+"""
+
+import asyncio
+import time
+from collections import deque
+from typing import Callable, Deque, Dict, List, Optional
+
+from fastapi.responses import JSONResponse
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from apps.metrics.registry import Gauge, MetricsRegistry, get_metrics_registry
+from config.logging import get_logger
+from config.settings import get_settings
+
+app_settings = get_settings()
+logger = get_logger(__name__)
+
+ADMITTED_PATH_PREFIX = "/api/"
+READ_METHODS = frozenset({"GET", "HEAD", "OPTIONS"})
+QUEUE_WAIT_HEADER = b"x-queue-wait-ms"
+
+
+def service_unavailable_response(message: str, retry_after_seconds: int) -> JSONResponse:
+    return JSONResponse(
+        status_code=503,
+        content={"message": message},
+        headers={"Retry-After": str(retry_after_seconds)},
+    )
+
+
+class AdmissionRejected(Exception):
+    """Raised when a request cannot be admitted, reason is queue_full or timeout"""
+
+    def __init__(self, reason: str):
+        super().__init__(reason)
+        self.reason = reason
+
+
+class AdmissionGate:
+    """
+    Lets up to limit requests run at once and up to queue_depth more wait,
+    first come first served, for at most queue_timeout_seconds. A finishing
+    request hands its slot straight to the longest waiting one.
+
+    Only used from the event loop, so it needs no lock.
+    """
+
+    def __init__(self, limit: int, queue_depth: int, queue_timeout_seconds: float):
+        self.limit = limit
+        self.queue_depth = queue_depth
+        self.queue_timeout_seconds = queue_timeout_seconds
+        self.active = 0
+        self._waiters: Deque[asyncio.Future] = deque()
+
+    @property
+    def queued(self) -> int:
+        return len(self._waiters)
+
+    async def acquire(self) -> float:
+        """Wait for a slot and return the seconds spent queued"""
+        if self.active < self.limit and not self._waiters:
+            self.active += 1
+            return 0.0
+        if len(self._waiters) >= self.queue_depth:
+            raise AdmissionRejected("queue_full")
+
+        start = time.perf_counter()
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        try:
+            # Shielded, so a slot handed over as the timeout fires is kept
+            await asyncio.wait_for(
+                asyncio.shield(waiter), self.queue_timeout_seconds
+            )
+        except asyncio.TimeoutError:
+            if not waiter.done():
+                self._waiters.remove(waiter)
+                waiter.cancel()
+                raise AdmissionRejected("timeout")
+        except asyncio.CancelledError:
+            # The client went away while queued
+            if waiter.done():
+                self.release()
+            else:
+                self._waiters.remove(waiter)
+                waiter.cancel()
+            raise
+        return time.perf_counter() - start
+
+    def release(self) -> None:
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                # The slot passes to the waiter, active stays the same
+                waiter.set_result(None)
+                return
+        self.active -= 1
+
+
+class AdmissionControlMiddleware:
+    """
+    Admits requests under /api/ through the read gate for GET, HEAD and
+    OPTIONS and the write gate for every other method. Queue wait is
+    recorded in admission_queue_wait_seconds and returned in an
+    X-Queue-Wait-Ms header.
+    """
+
+    def __init__(
+        self,
+        app: ASGIApp,
+        read_gate: Optional[AdmissionGate] = None,
+        write_gate: Optional[AdmissionGate] = None,
+        retry_after_seconds: Optional[int] = None,
+        registry: Optional[MetricsRegistry] = None,
+    ):
+        self.app = app
+        queue_timeout_seconds = app_settings.admission_queue_timeout_ms / 1000
+        self.gates: Dict[str, AdmissionGate] = {
+            "read": read_gate
+            or AdmissionGate(
+                limit=app_settings.admission_read_limit,
+                queue_depth=app_settings.admission_read_queue_depth,
+                queue_timeout_seconds=queue_timeout_seconds,
+            ),
+            "write": write_gate
+            or AdmissionGate(
+                limit=app_settings.admission_write_limit,
+                queue_depth=app_settings.admission_write_queue_depth,
+                queue_timeout_seconds=queue_timeout_seconds,
+            ),
+        }
+        self.retry_after_seconds = (
+            app_settings.admission_retry_after_seconds
+            if retry_after_seconds is None
+            else retry_after_seconds
+        )
+        registry = registry or get_metrics_registry()
+        self.queue_wait = registry.histogram(
+            "admission_queue_wait_seconds",
+            "Time admitted requests spent queued, by request class.",
+            ("class",),
+        )
+        self.rejected = registry.counter(
+            "admission_rejected_total",
+            "Requests turned away with 503, by request class and reason.",
+            ("class", "reason"),
+        )
+        registry.register_collector(admission_metrics_collector(self.gates))
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http" or not scope["path"].startswith(
+            ADMITTED_PATH_PREFIX
+        ):
+            await self.app(scope, receive, send)
+            return
+
+        request_class = "read" if scope["method"] in READ_METHODS else "write"
+        gate = self.gates[request_class]
+        try:
+            wait_seconds = await gate.acquire()
+        except AdmissionRejected as exc:
+            self.rejected.inc(request_class, exc.reason)
+            logger.warning(
+                "Rejected %s request, %s queue %s",
+                request_class,
+                request_class,
+                "full" if exc.reason == "queue_full" else "wait timed out",
+            )
+            response = service_unavailable_response(
+                "Server is busy, retry later", self.retry_after_seconds
+            )
+            await response(scope, receive, send)
+            return
+        self.queue_wait.observe(wait_seconds, request_class)
+
+        async def send_with_queue_wait(message: Message) -> None:
+            if message["type"] == "http.response.start":
+                headers = list(message.get("headers", []))
+                headers.append(
+                    (QUEUE_WAIT_HEADER, f"{wait_seconds * 1000:.3f}".encode())
+                )
+                message = {**message, "headers": headers}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_queue_wait)
+        finally:
+            gate.release()
+
+
+def admission_metrics_collector(
+    gates: Dict[str, AdmissionGate],
+) -> Callable[[], List[str]]:
+    """Metrics registry collector reporting admitted and queued requests"""
+
+    def collect() -> List[str]:
+        lines = []
+        for name, documentation, attribute in (
+            (
+                "admission_in_flight",
+                "Admitted requests currently running, by request class.",
+                "active",
+            ),
+            (
+                "admission_queued",
+                "Requests waiting for admission, by request class.",
+                "queued",
+            ),
+        ):
+            gauge = Gauge(name, documentation, ("class",))
+            for request_class, gate in gates.items():
+                gauge.set(getattr(gate, attribute), request_class)
+            lines.extend(gauge.render())
+        return lines
+
+    return collect
@@ -0,0 +1,259 @@
+"""
+Group commit for single book writes.
+
+Concurrent create_book, update_book and delete_book calls are queued and
+applied by one of the callers, the leader, in a single transaction. Each
+write runs in its own savepoint, so a failing write is rolled back and
+raised to its caller alone while the rest of the batch commits.
+"""
+
+import threading
+import time
+from typing import Any, Callable, Iterator, List, Optional
+
+from pydantic import BaseModel
+
+from apps.books.models import (
+    BOOK_SORT,
+    BookChangeModel,
+    BookModel,
+    BookVersionModel,
+    NewBookModel,
+)
+from apps.books.repositories import BookRepository
+from apps.metrics.registry import Counter
+from db.pool import ConnectionPool
+
+
+class BookWriteBatchStatsModel(BaseModel):
+    batches: int
+    writes: int
+    largest_batch: int
+
+
+class _PendingWrite:
+    __slots__ = ("call", "result", "error", "done", "lead")
+
+    def __init__(self, call: Callable[[], Any]):
+        self.call = call
+        self.result: Any = None
+        self.error: Optional[BaseException] = None
+        self.done = threading.Event()
+        # Set instead of done when this write's caller has to lead the
+        # next batch
+        self.lead = False
+
+
+class BatchingBookRepository(BookRepository):
+    """
+    Wraps a repository and coalesces its single book writes. pool must be
+    the connection pool the wrapped repository writes through, so its
+    writes join the batch transaction.
+
+    The first caller to find no batch in progress becomes the leader. It
+    waits up to max_wait_ms for more writes, or until max_batch_size are
+    queued, commits them together and hands leadership to the oldest
+    write still queued. Writes queued while a batch commits form the next
+    batch, so batches grow with the number of concurrent writers. Reads
+    and bulk writes go straight to the wrapped repository.
+    """
+
+    def __init__(
+        self,
+        book_repository: BookRepository,
+        pool: ConnectionPool,
+        max_batch_size: int,
+        max_wait_ms: float,
+    ):
+        self.book_repository = book_repository
+        self.pool = pool
+        self.max_batch_size = max_batch_size
+        self.max_wait_seconds = max_wait_ms / 1000
+        self._condition = threading.Condition()
+        self._queue: List[_PendingWrite] = []
+        self._leading = False
+        self._batches = 0
+        self._writes = 0
+        self._largest_batch = 0
+
+    def _submit(self, call: Callable[[], Any]) -> Any:
+        write = _PendingWrite(call)
+        with self._condition:
+            self._queue.append(write)
+            write.lead = not self._leading
+            self._leading = True
+            if len(self._queue) >= self.max_batch_size:
+                self._condition.notify()
+
+        if not write.lead:
+            write.done.wait()
+        if write.lead:
+            self._lead()
+            write.done.wait()
+        if write.error is not None:
+            raise write.error
+        return write.result
+
+    def _lead(self) -> None:
+        with self._condition:
+            deadline = time.monotonic() + self.max_wait_seconds
+            while len(self._queue) < self.max_batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._condition.wait(remaining)
+            batch = self._queue[:self.max_batch_size]
+            del self._queue[:self.max_batch_size]
+
+        try:
+            self._commit(batch)
+        finally:
+            with self._condition:
+                self._batches += 1
+                self._writes += len(batch)
+                self._largest_batch = max(self._largest_batch, len(batch))
+                if self._queue:
+                    next_leader = self._queue[0]
+                    next_leader.lead = True
+                    next_leader.done.set()
+                else:
+                    self._leading = False
+            for write in batch:
+                write.lead = False
+                write.done.set()
+
+    def _commit(self, batch: List[_PendingWrite]) -> None:
+        if len(batch) == 1:
+            # A lone write runs exactly as it would without batching
+            write = batch[0]
+            try:
+                write.result = write.call()
+            except Exception as exc:
+                write.error = exc
+            return
+
+        pool = self.pool
+        try:
+            with pool.writer():
+                for write in batch:
+                    try:
+                        # Nested writer() blocks run in a savepoint
+                        with pool.writer():
+                            write.result = write.call()
+                    except Exception as exc:
+                        write.error = exc
+        except BaseException as exc:
+            # Nothing in the batch was committed
+            for write in batch:
+                write.result = None
+                write.error = exc
+            if not isinstance(exc, Exception):
+                raise
+
+    def stats(self) -> BookWriteBatchStatsModel:
+        with self._condition:
+            return BookWriteBatchStatsModel(
+                batches=self._batches,
+                writes=self._writes,
+                largest_batch=self._largest_batch,
+            )
+
+    def all_books(self) -> List[BookModel]:
+        return self.book_repository.all_books()
+
+    def books_page(
+        self,
+        after_id: Optional[int],
+        limit: int,
+        author: Optional[str] = None,
+        title_prefix: Optional[str] = None,
+        sort: BOOK_SORT = "id",
+        after_key: Optional[str] = None,
+    ) -> List[BookModel]:
+        return self.book_repository.books_page(
+            after_id=after_id,
+            limit=limit,
+            author=author,
+            title_prefix=title_prefix,
+            sort=sort,
+            after_key=after_key,
+        )
+
+    def iter_books(self, chunk_size: int) -> Iterator[BookModel]:
+        return self.book_repository.iter_books(chunk_size=chunk_size)
+
+    def search_books(self, query: str, limit: int, offset: int) -> List[BookModel]:
+        return self.book_repository.search_books(
+            query=query, limit=limit, offset=offset
+        )
+
+    def book(self, id: int) -> Optional[BookModel]:
+        return self.book_repository.book(id=id)
+
+    def books_by_ids(self, ids: List[int]) -> List[BookModel]:
+        return self.book_repository.books_by_ids(ids=ids)
+
+    def book_version(self, id: int) -> Optional[BookVersionModel]:
+        return self.book_repository.book_version(id=id)
+
+    def book_changes(self, since: int, limit: int) -> List[BookChangeModel]:
+        return self.book_repository.book_changes(since=since, limit=limit)
+
+    def create_book(
+        self,
+        title: str,
+        description: Optional[str],
+        author: str,
+    ) -> BookModel:
+        return self._submit(
+            lambda: self.book_repository.create_book(
+                title=title, description=description, author=author
+            )
+        )
+
+    def create_books(self, books: List[NewBookModel]) -> List[BookModel]:
+        return self.book_repository.create_books(books=books)
+
+    def update_book(
+        self,
+        id: int,
+        title: Optional[str],
+        description: Optional[str],
+        author: Optional[str],
+    ) -> Optional[BookModel]:
+        return self._submit(
+            lambda: self.book_repository.update_book(
+                id=id, title=title, description=description, author=author
+            )
+        )
+
+    def delete_book(self, id: int) -> bool:
+        return self._submit(lambda: self.book_repository.delete_book(id=id))
+
+
+def write_batch_metrics_collector(
+    batching_repository: BatchingBookRepository,
+) -> Callable[[], List[str]]:
+    """Metrics registry collector reporting how writes were batched"""
+
+    def collect() -> List[str]:
+        stats = batching_repository.stats()
+        lines = []
+        for name, documentation, value in (
+            (
+                "book_write_batches_total",
+                "Transactions committed for single book writes.",
+                stats.batches,
+            ),
+            (
+                "book_batched_writes_total",
+                "Single book writes committed in those transactions.",
+                stats.writes,
+            ),
+        ):
+            counter = Counter(name, documentation)
+            counter.inc(amount=value)
+            lines.extend(counter.render())
+        return lines
+
+    return collect
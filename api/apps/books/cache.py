@@ -0,0 +1,257 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Iterator, List, Optional, Tuple
+
+from pydantic import BaseModel
+
+from apps.books.models import (
+    BOOK_SORT,
+    BookChangeModel,
+    BookModel,
+    BookVersionModel,
+    NewBookModel,
+)
+from apps.books.repositories import BookRepository
+from apps.metrics.registry import Counter, Gauge
+
+
+class CacheStatsModel(BaseModel):
+    hits: int
+    misses: int
+    evictions: int
+    expirations: int
+    invalidations: int
+    size: int
+    max_entries: int
+
+
+class CachedBookRepository(BookRepository):
+    """
+    Read-through LRU cache with a TTL for single book lookups, wrapping any
+    other BookRepository. Writes go straight to the wrapped repository and
+    drop the affected entries.
+    """
+
+    def __init__(
+        self,
+        book_repository: BookRepository,
+        max_entries: int,
+        ttl_seconds: float,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.book_repository = book_repository
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[int, Tuple[float, BookModel]]" = OrderedDict()
+        # Bumped on every invalidation so a lookup that raced with a write
+        # does not put the stale row it read back into the cache
+        self._generation = 0
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+        self._expirations = 0
+        self._invalidations = 0
+
+    def _get(self, id: int) -> Tuple[Optional[BookModel], int]:
+        with self._lock:
+            entry = self._entries.get(id)
+            if entry is not None:
+                expires_at, book = entry
+                if expires_at > self._clock():
+                    self._entries.move_to_end(id)
+                    self._hits += 1
+                    return book, self._generation
+                del self._entries[id]
+                self._expirations += 1
+            self._misses += 1
+            return None, self._generation
+
+    def _put(self, book: BookModel, generation: int) -> None:
+        with self._lock:
+            if generation != self._generation:
+                return
+            self._entries[book.id] = (self._clock() + self.ttl_seconds, book)
+            self._entries.move_to_end(book.id)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self._evictions += 1
+
+    def invalidate(self, *ids: int) -> None:
+        with self._lock:
+            self._generation += 1
+            for id in ids:
+                if self._entries.pop(id, None) is not None:
+                    self._invalidations += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._generation += 1
+            self._invalidations += len(self._entries)
+            self._entries.clear()
+
+    def stats(self) -> CacheStatsModel:
+        with self._lock:
+            return CacheStatsModel(
+                hits=self._hits,
+                misses=self._misses,
+                evictions=self._evictions,
+                expirations=self._expirations,
+                invalidations=self._invalidations,
+                size=len(self._entries),
+                max_entries=self.max_entries,
+            )
+
+    def all_books(self) -> List[BookModel]:
+        return self.book_repository.all_books()
+
+    def books_page(
+        self,
+        after_id: Optional[int],
+        limit: int,
+        author: Optional[str] = None,
+        title_prefix: Optional[str] = None,
+        sort: BOOK_SORT = "id",
+        after_key: Optional[str] = None,
+    ) -> List[BookModel]:
+        return self.book_repository.books_page(
+            after_id=after_id,
+            limit=limit,
+            author=author,
+            title_prefix=title_prefix,
+            sort=sort,
+            after_key=after_key,
+        )
+
+    def iter_books(self, chunk_size: int) -> Iterator[BookModel]:
+        return self.book_repository.iter_books(chunk_size=chunk_size)
+
+    def search_books(self, query: str, limit: int, offset: int) -> List[BookModel]:
+        return self.book_repository.search_books(
+            query=query, limit=limit, offset=offset
+        )
+
+    def book(self, id: int) -> Optional[BookModel]:
+        book, generation = self._get(id)
+        if book is not None:
+            return book
+
+        book = self.book_repository.book(id=id)
+        if book is not None:
+            self._put(book, generation)
+        return book
+
+    def books_by_ids(self, ids: List[int]) -> List[BookModel]:
+        books = {}
+        missing_ids = []
+        generation = None
+        for id in ids:
+            book, lookup_generation = self._get(id)
+            if generation is None:
+                generation = lookup_generation
+            if book is not None:
+                books[id] = book
+            else:
+                missing_ids.append(id)
+
+        if missing_ids:
+            for book in self.book_repository.books_by_ids(ids=missing_ids):
+                books[book.id] = book
+                self._put(book, generation)
+        return [books[id] for id in ids if id in books]
+
+    def book_version(self, id: int) -> Optional[BookVersionModel]:
+        book, _ = self._get(id)
+        if book is not None:
+            return BookVersionModel(
+                id=book.id, version=book.version, updated_at=book.updated_at
+            )
+        return self.book_repository.book_version(id=id)
+
+    def book_changes(self, since: int, limit: int) -> List[BookChangeModel]:
+        return self.book_repository.book_changes(since=since, limit=limit)
+
+    def create_book(
+        self,
+        title: str,
+        description: Optional[str],
+        author: str,
+    ) -> BookModel:
+        book = self.book_repository.create_book(
+            title=title, description=description, author=author
+        )
+        self.invalidate(book.id)
+        return book
+
+    def create_books(self, books: List[NewBookModel]) -> List[BookModel]:
+        created_books = self.book_repository.create_books(books=books)
+        self.invalidate(*(book.id for book in created_books))
+        return created_books
+
+    def update_book(
+        self,
+        id: int,
+        title: Optional[str],
+        description: Optional[str],
+        author: Optional[str],
+    ) -> Optional[BookModel]:
+        try:
+            return self.book_repository.update_book(
+                id=id, title=title, description=description, author=author
+            )
+        finally:
+            self.invalidate(id)
+
+    def delete_book(self, id: int) -> bool:
+        try:
+            return self.book_repository.delete_book(id=id)
+        finally:
+            self.invalidate(id)
+
+
+def cache_metrics_collector(
+    cached_repository: CachedBookRepository,
+) -> Callable[[], List[str]]:
+    """Metrics registry collector reporting how the book cache is used"""
+
+    def collect() -> List[str]:
+        stats = cached_repository.stats()
+        lines = []
+        for name, documentation, value in (
+            (
+                "book_cache_hits_total",
+                "Single book lookups answered from the cache.",
+                stats.hits,
+            ),
+            (
+                "book_cache_misses_total",
+                "Single book lookups read from the wrapped repository.",
+                stats.misses,
+            ),
+            (
+                "book_cache_evictions_total",
+                "Books evicted to stay within the size limit.",
+                stats.evictions,
+            ),
+            (
+                "book_cache_expirations_total",
+                "Books dropped once their TTL ran out.",
+                stats.expirations,
+            ),
+            (
+                "book_cache_invalidations_total",
+                "Books dropped because they were written.",
+                stats.invalidations,
+            ),
+        ):
+            counter = Counter(name, documentation)
+            counter.inc(amount=value)
+            lines.extend(counter.render())
+        gauge = Gauge("book_cache_entries", "Books currently in the cache.")
+        gauge.set(stats.size)
+        lines.extend(gauge.render())
+        return lines
+
+    return collect
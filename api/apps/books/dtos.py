@@ -1,5 +1,9 @@
+from typing import List, Optional
+
 from pydantic import BaseModel
 
+from apps.books.models import BOOK_CHANGE_OPERATION
+
 
 class GetBookResponseDto(BaseModel):
     id: int
@@ -15,6 +19,28 @@ class ListBookResponseDto(BaseModel):
     author: str
 
 
+class LookupBooksRequestDto(BaseModel):
+    ids: List[int]
+
+
+class LookupBooksResponseDto(BaseModel):
+    books: List[GetBookResponseDto]
+    missing_ids: List[int]
+
+
+class BookChangeResponseDto(BaseModel):
+    seq: int
+    id: int
+    operation: BOOK_CHANGE_OPERATION
+    changed_at: float
+    book: Optional[GetBookResponseDto] = None
+
+
+class BookChangesResponseDto(BaseModel):
+    changes: List[BookChangeResponseDto]
+    next_since: int
+
+
 class CreateBookRequestDto(BaseModel):
     title: str
     description: str | None = None
@@ -28,6 +54,16 @@ class CreateBookResponseDto(BaseModel):
     author: str
 
 
+class BulkCreateBookErrorDto(BaseModel):
+    index: int
+    message: str
+
+
+class BulkCreateBooksResponseDto(BaseModel):
+    created: List[CreateBookResponseDto]
+    errors: List[BulkCreateBookErrorDto]
+
+
 class UpdateBookRequestDto(BaseModel):
     title: str | None = None
     description: str | None = None
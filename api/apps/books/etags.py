@@ -0,0 +1,66 @@
+import hashlib
+from email.utils import formatdate, parsedate_to_datetime
+from typing import Dict, Iterable, Optional
+
+from fastapi import Request
+
+from apps.books.models import BookModel
+
+
+def book_etag(id: int, version: int) -> str:
+    return f'W/"{id}-{version}"'
+
+
+def books_etag(books: Iterable[BookModel], next_cursor: Optional[int]) -> str:
+    """
+    A page only changes when a book on it is added, removed or modified, so
+    its ids and versions are enough to identify it.
+    """
+    digest = hashlib.blake2b(digest_size=16)
+    for book in books:
+        digest.update(f"{book.id}:{book.version};".encode())
+    digest.update(f"next:{next_cursor}".encode())
+    return f'W/"{digest.hexdigest()}"'
+
+
+def validator_headers(etag: str, updated_at: float) -> Dict[str, str]:
+    headers = {"ETag": etag}
+    if updated_at:
+        headers["Last-Modified"] = formatdate(updated_at, usegmt=True)
+    return headers
+
+
+def _opaque_tag(etag: str) -> str:
+    return etag.strip().removeprefix("W/")
+
+
+def is_not_modified(
+    request: Request,
+    etag: str,
+    updated_at: Optional[float] = None,
+) -> bool:
+    """
+    Evaluate If-None-Match, or If-Modified-Since when no entity tags were
+    sent, using weak comparison as GET requests allow.
+    """
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        tags = {_opaque_tag(tag) for tag in if_none_match.split(",")}
+        return "*" in tags or _opaque_tag(etag) in tags
+
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since is None or not updated_at:
+        return False
+    try:
+        since = parsedate_to_datetime(if_modified_since).timestamp()
+    except (TypeError, ValueError):
+        return False
+    # HTTP dates have one second resolution
+    return int(updated_at) <= since
+
+
+def has_conditional_headers(request: Request) -> bool:
+    return (
+        "if-none-match" in request.headers
+        or "if-modified-since" in request.headers
+    )
@@ -0,0 +1,59 @@
+import csv
+import io
+import json
+from typing import Iterable, Iterator, Literal
+
+from apps.books.models import BookModel
+
+EXPORT_FORMAT = Literal["ndjson", "csv"]
+EXPORT_FIELDS = ("id", "title", "description", "author")
+EXPORT_MEDIA_TYPES = {
+    "ndjson": "application/x-ndjson",
+    "csv": "text/csv",
+}
+
+
+def _chunks(lines: Iterable[str], chunk_size: int) -> Iterator[str]:
+    buffer = []
+    for line in lines:
+        buffer.append(line)
+        if len(buffer) >= chunk_size:
+            yield "".join(buffer)
+            buffer = []
+    if buffer:
+        yield "".join(buffer)
+
+
+def _ndjson_lines(books: Iterable[BookModel]) -> Iterator[str]:
+    for book in books:
+        yield json.dumps(book.model_dump(include=set(EXPORT_FIELDS))) + "\n"
+
+
+def _csv_lines(books: Iterable[BookModel]) -> Iterator[str]:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+
+    def flush() -> str:
+        line = buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+        return line
+
+    writer.writerow(EXPORT_FIELDS)
+    yield flush()
+    for book in books:
+        writer.writerow([getattr(book, field) for field in EXPORT_FIELDS])
+        yield flush()
+
+
+def export_books(
+    books: Iterable[BookModel],
+    export_format: EXPORT_FORMAT,
+    chunk_size: int,
+) -> Iterator[str]:
+    """
+    Lazily render books in the requested format, grouping rows into chunks so
+    the response is written in a few large pieces rather than row by row.
+    """
+    lines = _csv_lines(books) if export_format == "csv" else _ndjson_lines(books)
+    return _chunks(lines, chunk_size)
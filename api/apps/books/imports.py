@@ -0,0 +1,300 @@
+"""
+Bulk import of books from CSV or newline delimited JSON files.
+
+Rows are streamed from the file, validated with the same rules as
+BookService.new_book and inserted in chunks, one transaction per chunk.
+The position in the file is committed with every chunk, so an interrupted
+import can resume from the last committed row without duplicating books.
+"""
+
+import csv
+import itertools
+import json
+import os
+import time
+from typing import (
+    Any,
+    Callable,
+    Iterator,
+    List,
+    Optional,
+    TextIO,
+    Tuple,
+)
+
+from pydantic import BaseModel
+
+from apps.books.exports import EXPORT_FORMAT
+from apps.books.models import BookErrorModel
+from apps.books.repositories import SQLiteBookRepository
+from apps.books.services import BookService
+from apps.exceptions import BusinessRuleException
+from config.settings import get_settings
+from db.pool import ConnectionPool
+from db.setup import drop_books_indexes, rebuild_books_indexes
+
+app_settings = get_settings()
+
+IMPORT_FORMATS = {
+    ".csv": "csv",
+    ".jsonl": "ndjson",
+    ".ndjson": "ndjson",
+}
+_REQUIRED_CSV_FIELDS = ("title", "author")
+_INVALID_JSON = object()
+
+
+class BookImportError(Exception):
+    """Raised when a file cannot be imported at all"""
+    pass
+
+
+class InvalidBookImportRowError(BusinessRuleException):
+    """Raised when a row is not a set of book fields"""
+    pass
+
+
+class BookImportProgressModel(BaseModel):
+    rows: int = 0
+    inserted: int = 0
+    rejected: int = 0
+    # Rows already imported by an earlier, interrupted run
+    resumed_rows: int = 0
+    seconds: float = 0.0
+    finished: bool = False
+
+    @property
+    def rows_per_second(self) -> float:
+        if self.seconds <= 0:
+            return 0.0
+        return (self.rows - self.resumed_rows) / self.seconds
+
+
+def import_format_for(path: str) -> EXPORT_FORMAT:
+    extension = os.path.splitext(path)[1].lower()
+    if extension not in IMPORT_FORMATS:
+        raise BookImportError(
+            f"Cannot tell the format of {path}, "
+            f"expected one of {', '.join(IMPORT_FORMATS)}"
+        )
+    return IMPORT_FORMATS[extension]  # type: ignore[return-value]
+
+
+def _csv_rows(file: TextIO) -> Iterator[Any]:
+    reader = csv.DictReader(file)
+    missing = [
+        field for field in _REQUIRED_CSV_FIELDS
+        if field not in (reader.fieldnames or ())
+    ]
+    if missing:
+        raise BookImportError(
+            f"CSV header is missing the {', '.join(missing)} column"
+        )
+    return iter(reader)
+
+
+def _ndjson_rows(file: TextIO) -> Iterator[Any]:
+    for line in file:
+        if not line.strip():
+            continue
+        try:
+            yield json.loads(line)
+        except ValueError:
+            yield _INVALID_JSON
+
+
+def _book_values(
+    book_service: BookService,
+    row: Any,
+) -> Tuple[str, str, str]:
+    if row is _INVALID_JSON:
+        raise InvalidBookImportRowError("Row needs to be valid JSON")
+    if not isinstance(row, dict):
+        raise InvalidBookImportRowError("Row needs to be a JSON object")
+    title = row.get("title")
+    description = row.get("description")
+    author = row.get("author")
+    book_service.validate_new_book(
+        title=title, description=description, author=author
+    )
+    return title, description or "", author
+
+
+def _create_import_progress(connection) -> None:
+    connection.execute(
+        """
+        CREATE TABLE IF NOT EXISTS book_imports(
+            source TEXT PRIMARY KEY,
+            rows INTEGER NOT NULL,
+            inserted INTEGER NOT NULL,
+            rejected INTEGER NOT NULL,
+            indexes_dropped INTEGER NOT NULL,
+            finished INTEGER NOT NULL
+        );
+        """
+    )
+
+
+def _save_progress(
+    connection,
+    source: str,
+    progress: BookImportProgressModel,
+    indexes_dropped: bool,
+) -> None:
+    connection.execute(
+        """
+        INSERT INTO book_imports
+            (source, rows, inserted, rejected, indexes_dropped, finished)
+        VALUES (?, ?, ?, ?, ?, ?)
+        ON CONFLICT(source) DO UPDATE SET
+            rows = excluded.rows,
+            inserted = excluded.inserted,
+            rejected = excluded.rejected,
+            indexes_dropped = excluded.indexes_dropped,
+            finished = excluded.finished
+        """,
+        (
+            source,
+            progress.rows,
+            progress.inserted,
+            progress.rejected,
+            indexes_dropped,
+            progress.finished,
+        ),
+    )
+
+
+def import_books(
+    path: str,
+    db_path: Optional[str] = None,
+    import_format: Optional[EXPORT_FORMAT] = None,
+    chunk_size: Optional[int] = None,
+    rebuild_indexes: bool = False,
+    resume: bool = False,
+    on_progress: Optional[Callable[[BookImportProgressModel], None]] = None,
+    on_error: Optional[Callable[[BookErrorModel], None]] = None,
+) -> BookImportProgressModel:
+    """
+    Import every book in path into the database at db_path. Rows that fail
+    validation are skipped and passed to on_error with their 1-based row
+    number. on_progress is called after every committed chunk.
+
+    With resume, an earlier import of the same file carries on after the
+    last committed row. With rebuild_indexes, the secondary and search
+    indexes are dropped for the load and rebuilt once at the end, which is
+    much faster for large files but leaves search incomplete until the
+    import finishes, so it is meant for imports run while the API is down.
+    """
+    import_format = import_format or import_format_for(path)
+    chunk_size = chunk_size or app_settings.books_import_chunk_size
+    source = os.path.abspath(path)
+    # Every chunk would be reported as a slow query
+    pool = ConnectionPool(db_path or app_settings.db_url, query_tracing=False)
+    try:
+        with open(path, newline="", encoding="utf-8-sig") as file:
+            rows = (
+                _csv_rows(file) if import_format == "csv" else _ndjson_rows(file)
+            )
+            return _import_rows(
+                pool,
+                source,
+                rows,
+                chunk_size=chunk_size,
+                rebuild_indexes=rebuild_indexes,
+                resume=resume,
+                on_progress=on_progress,
+                on_error=on_error,
+            )
+    finally:
+        pool.close()
+
+
+def _import_rows(
+    pool: ConnectionPool,
+    source: str,
+    rows: Iterator[Any],
+    chunk_size: int,
+    rebuild_indexes: bool,
+    resume: bool,
+    on_progress: Optional[Callable[[BookImportProgressModel], None]],
+    on_error: Optional[Callable[[BookErrorModel], None]],
+) -> BookImportProgressModel:
+    book_service = BookService(
+        book_repository=SQLiteBookRepository(pool.db_path)
+    )
+    insert_query = (
+        "INSERT INTO books (title, description, author, updated_at) "
+        "VALUES (?, ?, ?, ?)"
+    )
+
+    with pool.writer() as connection:
+        _create_import_progress(connection)
+        saved = connection.execute(
+            "SELECT rows, inserted, rejected, indexes_dropped, finished "
+            "FROM book_imports WHERE source = ?",
+            (source,),
+        ).fetchone()
+
+    progress = BookImportProgressModel()
+    # Dropped indexes have to be rebuilt even if the import starts over
+    indexes_dropped = saved is not None and bool(saved[3])
+    if resume and saved is not None:
+        progress = BookImportProgressModel(
+            rows=saved[0],
+            inserted=saved[1],
+            rejected=saved[2],
+            resumed_rows=saved[0],
+            finished=bool(saved[4]),
+        )
+        if progress.finished:
+            return progress
+
+    start = time.perf_counter()
+    if rebuild_indexes and not indexes_dropped:
+        with pool.writer() as connection:
+            drop_books_indexes(connection)
+            indexes_dropped = True
+            _save_progress(connection, source, progress, indexes_dropped)
+
+    def commit(chunk: List[Tuple[str, str, str, float]], rows_read: int) -> None:
+        progress.rows += rows_read
+        progress.inserted += len(chunk)
+        with pool.writer() as connection:
+            connection.executemany(insert_query, chunk)
+            _save_progress(connection, source, progress, indexes_dropped)
+        progress.seconds = time.perf_counter() - start
+        if on_progress is not None:
+            on_progress(progress)
+
+    chunk: List[Tuple[str, str, str, float]] = []
+    chunk_rows = 0
+    updated_at = time.time()
+    # Rows committed by an earlier run are parsed again but not inserted
+    rows = itertools.islice(rows, progress.resumed_rows, None)
+    for number, row in enumerate(rows, start=progress.resumed_rows + 1):
+        chunk_rows += 1
+        try:
+            title, description, author = _book_values(book_service, row)
+        except BusinessRuleException as exc:
+            progress.rejected += 1
+            if on_error is not None:
+                on_error(BookErrorModel(index=number, message=str(exc)))
+        else:
+            chunk.append((title, description, author, updated_at))
+        if chunk_rows == chunk_size:
+            commit(chunk, chunk_rows)
+            chunk = []
+            chunk_rows = 0
+            updated_at = time.time()
+
+    progress.finished = not indexes_dropped
+    commit(chunk, chunk_rows)
+
+    if indexes_dropped:
+        with pool.writer() as connection:
+            rebuild_books_indexes(connection)
+            progress.finished = True
+            _save_progress(connection, source, progress, indexes_dropped=False)
+
+    progress.seconds = time.perf_counter() - start
+    return progress
@@ -0,0 +1,457 @@
+"""
+BookRepository kept entirely in process memory.
+
+Selected with a db_url of memory://, optionally followed by the path of a
+SQLite database to hydrate it from at startup, e.g. memory://db/dev.db.
+Writes are not persisted.
+"""
+
+import bisect
+import math
+import re
+import string
+import threading
+import time
+from collections import Counter
+from typing import (
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    Mapping,
+    Optional,
+    Sequence,
+    Set,
+    Tuple,
+)
+
+from apps.books.models import (
+    BOOK_SORT,
+    BOOK_CHANGE_OPERATION,
+    BookChangeModel,
+    BookModel,
+    BookVersionModel,
+    NewBookModel,
+)
+from apps.books.repositories import _MAX_CHARACTER, BookRepository
+
+MEMORY_URL_SCHEME = "memory://"
+
+# SQLite's unicode61 tokenizer splits on everything but letters and digits
+_WORD_PATTERN = re.compile(r"[^\W_]+")
+# COLLATE NOCASE only folds ASCII letters
+_NOCASE = str.maketrans(string.ascii_uppercase, string.ascii_lowercase)
+# Same BM25 parameters as FTS5's bm25()
+_BM25_K1 = 1.2
+_BM25_B = 0.75
+
+
+def is_memory_url(db_url: str) -> bool:
+    return db_url.startswith(MEMORY_URL_SCHEME)
+
+
+def memory_source_path(db_url: str) -> Optional[str]:
+    """SQLite database a memory:// repository is hydrated from, if any"""
+    return db_url[len(MEMORY_URL_SCHEME):] or None
+
+
+def nocase(value: str) -> str:
+    return value.translate(_NOCASE)
+
+
+def _words(book: BookModel) -> List[str]:
+    text = f"{book.title} {book.description} {book.author}"
+    return _WORD_PATTERN.findall(text.lower())
+
+
+def _ids_after(
+    entries: List[Tuple[str, int]],
+    after: Optional[Tuple[str, int]],
+) -> Iterator[int]:
+    low = 0 if after is None else bisect.bisect_right(entries, after)
+    return (id for _, id in entries[low:])
+
+
+def _sorted_candidates(
+    books: Mapping[int, BookModel],
+    ids: Sequence[int],
+    titles: Sequence[Tuple[str, int]],
+    authors: Sequence[Tuple[str, int]],
+    after_id: Optional[int],
+    author: Optional[str],
+    title_prefix: Optional[str],
+    sort: BOOK_SORT,
+    after_key: Optional[str] = None,
+) -> Iterator[int]:
+    """Ids in sort order after the cursor, narrowed by an index if possible"""
+    if sort == "id":
+        start = -1 if after_id is None else after_id
+        if author is not None:
+            key = nocase(author)
+            low = bisect.bisect_left(authors, (key, start + 1))
+            high = bisect.bisect_left(authors, (key, math.inf))
+            return (id for _, id in authors[low:high])
+        if title_prefix is not None:
+            low = bisect.bisect_left(titles, (title_prefix, -1))
+            high = bisect.bisect_left(titles, (title_prefix + _MAX_CHARACTER, -1))
+            return iter(sorted(id for _, id in titles[low:high] if id > start))
+        low = bisect.bisect_right(ids, start)
+        return (ids[position] for position in range(low, len(ids)))
+
+    def sort_key(id: int) -> Tuple[str, int]:
+        book = books[id]
+        return (book.title if sort == "title" else nocase(book.author), id)
+
+    if after_id is None:
+        after = None
+    elif after_key is None:
+        after = sort_key(after_id)
+    else:
+        after = (after_key if sort == "title" else nocase(after_key), after_id)
+    # When only the other column is filtered, it is cheaper to collect the
+    # matches from that column's index and sort them, as SQLite does
+    if sort == "title" and author is not None:
+        key = nocase(author)
+        low = bisect.bisect_left(authors, (key, -1))
+        high = bisect.bisect_left(authors, (key, math.inf))
+        matches = [
+            sort_key(id)
+            for _, id in authors[low:high]
+            if title_prefix is None or books[id].title.startswith(title_prefix)
+        ]
+        return _ids_after(sorted(matches), after)
+    if sort == "author" and author is None and title_prefix is not None:
+        low = bisect.bisect_left(titles, (title_prefix, -1))
+        high = bisect.bisect_left(titles, (title_prefix + _MAX_CHARACTER, -1))
+        matches = [sort_key(id) for _, id in titles[low:high]]
+        return _ids_after(sorted(matches), after)
+
+    if sort == "title":
+        index = titles
+        first_key = title_prefix
+    else:
+        index = authors
+        first_key = None if author is None else nocase(author)
+    low = 0 if first_key is None else bisect.bisect_left(index, (first_key, -1))
+    if after is not None:
+        low = max(low, bisect.bisect_right(index, after))
+    return (index[position][1] for position in range(low, len(index)))
+
+
+def books_page_from_indexes(
+    books: Mapping[int, BookModel],
+    ids: Sequence[int],
+    titles: Sequence[Tuple[str, int]],
+    authors: Sequence[Tuple[str, int]],
+    after_id: Optional[int],
+    limit: int,
+    author: Optional[str] = None,
+    title_prefix: Optional[str] = None,
+    sort: BOOK_SORT = "id",
+    after_key: Optional[str] = None,
+) -> List[BookModel]:
+    """
+    Keyset page over books held in memory, with the same results as the
+    SQLite query. ids is sorted, titles holds sorted (title, id) pairs and
+    authors sorted (case folded author, id) pairs. For sorts other than id,
+    after_key is the title or author of the book with after_id, looked up
+    when not given.
+    """
+    if (
+        sort != "id"
+        and after_id is not None
+        and after_key is None
+        and after_id not in books
+    ):
+        return []
+
+    author_key = None if author is None else nocase(author)
+    page = []
+    candidates = _sorted_candidates(
+        books,
+        ids,
+        titles,
+        authors,
+        after_id,
+        author,
+        title_prefix,
+        sort,
+        after_key,
+    )
+    for id in candidates:
+        book = books[id]
+        # Once the sort key leaves the filtered range nothing after it can
+        # match
+        if title_prefix is not None and not book.title.startswith(title_prefix):
+            if sort == "title":
+                break
+            continue
+        if author_key is not None and nocase(book.author) != author_key:
+            if sort == "author":
+                break
+            continue
+        page.append(book)
+        if len(page) == limit:
+            break
+    return page
+
+
+class InMemoryBookRepository(BookRepository):
+    """
+    Books in a dict keyed by id, with sorted indexes for id, title and
+    case-insensitive author order plus an inverted word index for search,
+    mirroring the indexes of the SQLite schema. A single lock guards every
+    read and write, so readers always see a consistent set of indexes.
+    """
+
+    def __init__(self, books: Iterable[BookModel] = ()):
+        self._lock = threading.Lock()
+        self._books: Dict[int, BookModel] = {}
+        self._ids: List[int] = []
+        self._titles: List[Tuple[str, int]] = []
+        self._authors: List[Tuple[str, int]] = []
+        self._words: Dict[str, Set[int]] = {}
+        self._word_counts: Dict[int, int] = {}
+        self._total_words = 0
+        self._next_id = 1
+        # (book id, operation, changed at), the sequence number is position + 1
+        self._changes: List[Tuple[int, BOOK_CHANGE_OPERATION, float]] = []
+        self.load(books)
+
+    def load(self, books: Iterable[BookModel]) -> None:
+        """Add existing books, keeping their ids and versions"""
+        with self._lock:
+            for book in books:
+                previous = self._books.get(book.id)
+                if previous is not None:
+                    self._unindex_words(previous)
+                self._books[book.id] = book
+                self._index_words(book)
+                self._next_id = max(self._next_id, book.id + 1)
+                self._changes.append(
+                    (
+                        book.id,
+                        "insert" if previous is None else "update",
+                        book.updated_at,
+                    )
+                )
+            # One sort each instead of an insort per book
+            entries = self._books.values()
+            self._ids = sorted(self._books)
+            self._titles = sorted((book.title, book.id) for book in entries)
+            self._authors = sorted(
+                (nocase(book.author), book.id) for book in entries
+            )
+
+    def _add(self, book: BookModel) -> None:
+        self._books[book.id] = book
+        bisect.insort(self._ids, book.id)
+        bisect.insort(self._titles, (book.title, book.id))
+        bisect.insort(self._authors, (nocase(book.author), book.id))
+        self._index_words(book)
+        self._next_id = max(self._next_id, book.id + 1)
+
+    def _remove(self, id: int) -> Optional[BookModel]:
+        book = self._books.pop(id, None)
+        if book is None:
+            return None
+        self._ids.pop(bisect.bisect_left(self._ids, id))
+        self._titles.pop(bisect.bisect_left(self._titles, (book.title, id)))
+        self._authors.pop(
+            bisect.bisect_left(self._authors, (nocase(book.author), id))
+        )
+        self._unindex_words(book)
+        return book
+
+    def _index_words(self, book: BookModel) -> None:
+        words = _words(book)
+        for word in set(words):
+            self._words.setdefault(word, set()).add(book.id)
+        self._word_counts[book.id] = len(words)
+        self._total_words += len(words)
+
+    def _unindex_words(self, book: BookModel) -> None:
+        for word in set(_words(book)):
+            ids = self._words[word]
+            ids.discard(book.id)
+            if not ids:
+                del self._words[word]
+        self._total_words -= self._word_counts.pop(book.id)
+
+    def all_books(self) -> List[BookModel]:
+        with self._lock:
+            return [self._books[id] for id in self._ids]
+
+    def books_page(
+        self,
+        after_id: Optional[int],
+        limit: int,
+        author: Optional[str] = None,
+        title_prefix: Optional[str] = None,
+        sort: BOOK_SORT = "id",
+        after_key: Optional[str] = None,
+    ) -> List[BookModel]:
+        with self._lock:
+            return books_page_from_indexes(
+                self._books,
+                self._ids,
+                self._titles,
+                self._authors,
+                after_id=after_id,
+                limit=limit,
+                author=author,
+                title_prefix=title_prefix,
+                sort=sort,
+                after_key=after_key,
+            )
+
+    def iter_books(self, chunk_size: int) -> Iterator[BookModel]:
+        # Books are replaced rather than changed, so a copy is a consistent view
+        books = self.all_books()
+        for start in range(0, len(books), chunk_size):
+            yield from books[start:start + chunk_size]
+
+    def search_books(self, query: str, limit: int, offset: int) -> List[BookModel]:
+        terms = list(dict.fromkeys(_WORD_PATTERN.findall(query.lower())))
+        if not terms:
+            return []
+
+        with self._lock:
+            postings = [self._words.get(term, set()) for term in terms]
+            matches = set.intersection(*sorted(postings, key=len))
+            if not matches:
+                return []
+
+            book_count = len(self._books)
+            average_words = self._total_words / book_count
+            idfs = [
+                math.log(
+                    (book_count - len(ids) + 0.5) / (len(ids) + 0.5) + 1
+                )
+                for ids in postings
+            ]
+            ranked = []
+            for id in matches:
+                word_counts = Counter(_words(self._books[id]))
+                length_norm = _BM25_K1 * (
+                    1 - _BM25_B
+                    + _BM25_B * self._word_counts[id] / average_words
+                )
+                score = sum(
+                    idf
+                    * word_counts[term]
+                    * (_BM25_K1 + 1)
+                    / (word_counts[term] + length_norm)
+                    for term, idf in zip(terms, idfs)
+                )
+                ranked.append((-score, id))
+            ranked.sort()
+            return [self._books[id] for _, id in ranked[offset:offset + limit]]
+
+    def book(self, id: int) -> Optional[BookModel]:
+        with self._lock:
+            return self._books.get(id)
+
+    def books_by_ids(self, ids: List[int]) -> List[BookModel]:
+        with self._lock:
+            return [self._books[id] for id in ids if id in self._books]
+
+    def book_version(self, id: int) -> Optional[BookVersionModel]:
+        book = self.book(id)
+        if book is None:
+            return None
+        return BookVersionModel(
+            id=book.id, version=book.version, updated_at=book.updated_at
+        )
+
+    def book_changes(self, since: int, limit: int) -> List[BookChangeModel]:
+        with self._lock:
+            changes = self._changes[since:since + limit]
+            return [
+                BookChangeModel(
+                    seq=seq,
+                    id=id,
+                    operation=operation,
+                    changed_at=changed_at,
+                    book=None if operation == "delete" else self._books.get(id),
+                )
+                for seq, (id, operation, changed_at) in enumerate(
+                    changes, start=since + 1
+                )
+            ]
+
+    def _new_book(
+        self,
+        title: str,
+        description: Optional[str],
+        author: str,
+        updated_at: float,
+    ) -> BookModel:
+        book = BookModel(
+            id=self._next_id,
+            title=title,
+            description=description or "",
+            author=author,
+            updated_at=updated_at,
+        )
+        self._add(book)
+        self._changes.append((book.id, "insert", updated_at))
+        return book
+
+    def create_book(
+        self,
+        title: str,
+        description: Optional[str],
+        author: str,
+    ) -> BookModel:
+        with self._lock:
+            return self._new_book(title, description, author, time.time())
+
+    def create_books(self, books: List[NewBookModel]) -> List[BookModel]:
+        updated_at = time.time()
+        with self._lock:
+            return [
+                self._new_book(book.title, book.description, book.author, updated_at)
+                for book in books
+            ]
+
+    def update_book(
+        self,
+        id: int,
+        title: Optional[str],
+        description: Optional[str],
+        author: Optional[str],
+    ) -> Optional[BookModel]:
+        update_fields = {}
+        if title:
+            update_fields["title"] = title
+        if description:
+            update_fields["description"] = description
+        if author:
+            update_fields["author"] = author
+        if not update_fields:
+            return None
+
+        with self._lock:
+            book = self._remove(id)
+            if book is None:
+                return None
+            updated_book = book.model_copy(
+                update={
+                    **update_fields,
+                    "version": book.version + 1,
+                    "updated_at": time.time(),
+                }
+            )
+            self._add(updated_book)
+            self._changes.append(
+                (updated_book.id, "update", updated_book.updated_at)
+            )
+            return updated_book
+
+    def delete_book(self, id: int) -> bool:
+        with self._lock:
+            if self._remove(id) is None:
+                return False
+            self._changes.append((id, "delete", time.time()))
+            return True
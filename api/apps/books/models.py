@@ -1,4 +1,9 @@
-from pydantic import BaseModel
+from typing import List, Literal, Optional
+
+from pydantic import BaseModel, Field
+
+BOOK_SORT = Literal["id", "title", "author"]
+BOOK_CHANGE_OPERATION = Literal["insert", "update", "delete"]
 
 
 class BookModel(BaseModel):
@@ -6,3 +11,60 @@ class BookModel(BaseModel):
     title: str
     description: str
     author: str
+    # Kept out of serialized output so a BookModel renders exactly like the
+    # response DTOs, see apps.books.serializers
+    version: int = Field(default=1, exclude=True)
+    updated_at: float = Field(default=0.0, exclude=True)
+
+
+class BookVersionModel(BaseModel):
+    id: int
+    version: int
+    updated_at: float
+
+
+class BookPageModel(BaseModel):
+    books: List[BookModel]
+    next_after_id: Optional[int] = None
+    # Title or author of the book with next_after_id when sorted by them
+    next_after_key: Optional[str] = None
+
+
+class BookSearchPageModel(BaseModel):
+    books: List[BookModel]
+    next_offset: Optional[int] = None
+
+
+class BookLookupModel(BaseModel):
+    books: List[BookModel]
+    missing_ids: List[int]
+
+
+class BookChangeModel(BaseModel):
+    seq: int
+    id: int
+    operation: BOOK_CHANGE_OPERATION
+    changed_at: float
+    # Current state of the book, None once it has been deleted
+    book: Optional[BookModel] = None
+
+
+class BookChangesPageModel(BaseModel):
+    changes: List[BookChangeModel]
+    next_since: int
+
+
+class NewBookModel(BaseModel):
+    title: str
+    description: Optional[str] = None
+    author: str
+
+
+class BookErrorModel(BaseModel):
+    index: int
+    message: str
+
+
+class BulkCreatedBooksModel(BaseModel):
+    books: List[BookModel]
+    errors: List[BookErrorModel]
@@ -0,0 +1,181 @@
+"""
+List pages kept in memory already serialized and gzip compressed.
+
+GET /api/v1/books/ answers a repeated request from here without a query,
+serialization or compression. A single write can move books onto or off
+any page, so BookService drops every page whenever it changes a book. This
+pays off for catalogues that are read far more often than they change.
+"""
+
+import gzip
+import threading
+from collections import OrderedDict
+from typing import Callable, Hashable, List, Optional, Tuple
+
+from fastapi import Request
+from pydantic import BaseModel
+
+from apps.books.etags import books_etag
+from apps.books.models import BookPageModel
+from apps.books.serializers import render_books
+from apps.metrics.registry import Counter, Gauge
+
+
+class BookPageCacheStatsModel(BaseModel):
+    hits: int
+    misses: int
+    invalidations: int
+    size: int
+    max_entries: int
+
+
+class RenderedBookPage:
+    __slots__ = (
+        "body",
+        "gzip_body",
+        "etag",
+        "updated_at",
+        "next_after_id",
+        "next_after_key",
+    )
+
+    def __init__(
+        self,
+        body: bytes,
+        gzip_body: Optional[bytes],
+        etag: str,
+        updated_at: float,
+        next_after_id: Optional[int],
+        next_after_key: Optional[str] = None,
+    ):
+        self.body = body
+        # None when the body is too small to be worth compressing
+        self.gzip_body = gzip_body
+        self.etag = etag
+        self.updated_at = updated_at
+        self.next_after_id = next_after_id
+        self.next_after_key = next_after_key
+
+
+def render_books_page(
+    page: BookPageModel,
+    gzip_min_size: Optional[int] = None,
+    gzip_level: int = 6,
+) -> RenderedBookPage:
+    """Serialize a page, and compress it too unless gzip_min_size is None"""
+    body = render_books(page.books)
+    gzip_body = None
+    if gzip_min_size is not None and len(body) >= gzip_min_size:
+        # mtime=0 gives the same bytes for the same page every time
+        gzip_body = gzip.compress(body, compresslevel=gzip_level, mtime=0)
+    return RenderedBookPage(
+        body=body,
+        gzip_body=gzip_body,
+        etag=books_etag(page.books, page.next_after_id),
+        updated_at=max((book.updated_at for book in page.books), default=0),
+        next_after_id=page.next_after_id,
+        next_after_key=page.next_after_key,
+    )
+
+
+def accepts_gzip(request: Request) -> bool:
+    for coding in request.headers.get("accept-encoding", "").split(","):
+        name, _, parameters = coding.partition(";")
+        if name.strip().lower() not in ("gzip", "*"):
+            continue
+        quality = parameters.strip().lower()
+        if quality.startswith("q="):
+            try:
+                return float(quality[2:]) > 0
+            except ValueError:
+                return False
+        return True
+    return False
+
+
+class BookPageCache:
+    """
+    LRU cache of rendered pages keyed by the list query. Callers read the
+    generation along with a miss and pass it back to put, so a page read
+    while a write committed is not cached after that write invalidated it.
+    """
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._pages: "OrderedDict[Hashable, RenderedBookPage]" = OrderedDict()
+        self._generation = 0
+        self._hits = 0
+        self._misses = 0
+        self._invalidations = 0
+
+    def get(self, key: Hashable) -> Tuple[Optional[RenderedBookPage], int]:
+        with self._lock:
+            page = self._pages.get(key)
+            if page is None:
+                self._misses += 1
+            else:
+                self._pages.move_to_end(key)
+                self._hits += 1
+            return page, self._generation
+
+    def put(self, key: Hashable, page: RenderedBookPage, generation: int) -> None:
+        with self._lock:
+            if generation != self._generation:
+                return
+            self._pages[key] = page
+            self._pages.move_to_end(key)
+            while len(self._pages) > self.max_entries:
+                self._pages.popitem(last=False)
+
+    def invalidate(self) -> None:
+        with self._lock:
+            self._generation += 1
+            self._invalidations += 1
+            self._pages.clear()
+
+    def stats(self) -> BookPageCacheStatsModel:
+        with self._lock:
+            return BookPageCacheStatsModel(
+                hits=self._hits,
+                misses=self._misses,
+                invalidations=self._invalidations,
+                size=len(self._pages),
+                max_entries=self.max_entries,
+            )
+
+
+def page_cache_metrics_collector(
+    page_cache: BookPageCache,
+) -> Callable[[], List[str]]:
+    """Metrics registry collector reporting how the list page cache is used"""
+
+    def collect() -> List[str]:
+        stats = page_cache.stats()
+        lines = []
+        for name, documentation, value in (
+            (
+                "book_page_cache_hits_total",
+                "List requests answered with a cached page.",
+                stats.hits,
+            ),
+            (
+                "book_page_cache_misses_total",
+                "List requests that had to query and render the page.",
+                stats.misses,
+            ),
+            (
+                "book_page_cache_invalidations_total",
+                "Times every cached page was dropped after a write.",
+                stats.invalidations,
+            ),
+        ):
+            counter = Counter(name, documentation)
+            counter.inc(amount=value)
+            lines.extend(counter.render())
+        gauge = Gauge("book_page_cache_entries", "List pages currently cached.")
+        gauge.set(stats.size)
+        lines.extend(gauge.render())
+        return lines
+
+    return collect
@@ -1,78 +1,335 @@
-import sqlite3
+import re
+import time
 
 from abc import ABC, abstractmethod
-from typing import List, Optional
+from typing import Any, Iterator, List, Optional, Tuple
 
-from apps.books.models import BookModel
+from apps.books.models import (
+    BOOK_SORT,
+    BookChangeModel,
+    BookModel,
+    BookVersionModel,
+    NewBookModel,
+)
 from config.settings import get_settings
+from db.pool import get_connection_pool
 
 app_settings = get_settings()
 
+_SEARCH_TOKEN_PATTERN = re.compile(r"\w+")
+_BOOK_COLUMNS = "id, title, description, author, version, updated_at"
+# Four bound parameters per row stays well below SQLite's variable limit
+_INSERT_BATCH_SIZE = 500
+_SORT_COLUMNS = {
+    "id": "id",
+    "title": "title",
+    "author": "author COLLATE NOCASE",
+}
+# Sorts after every string that starts with a given prefix
+_MAX_CHARACTER = "\U0010ffff"
+
+
+def _book_from_row(row: Tuple[Any, ...]) -> BookModel:
+    return BookModel(
+        id=row[0],
+        title=row[1],
+        description=row[2],
+        author=row[3],
+        version=row[4],
+        updated_at=row[5],
+    )
+
+
+def _books_page_query(
+    limit: int,
+    after_id: Optional[int] = None,
+    after_key: Optional[str] = None,
+    author: Optional[str] = None,
+    title_prefix: Optional[str] = None,
+    sort: BOOK_SORT = "id",
+) -> Tuple[str, List[Any]]:
+    """
+    Build a keyset pagination query that every filter and sort combination
+    can answer from an index. For sorts other than id, after_key is the sort
+    column value of the book with after_id.
+    """
+    conditions = []
+    params: List[Any] = []
+    if author is not None:
+        conditions.append("author = ? COLLATE NOCASE")
+        params.append(author)
+    if title_prefix is not None:
+        conditions.append("title >= ? AND title < ?")
+        params.extend([title_prefix, title_prefix + _MAX_CHARACTER])
+
+    sort_column = _SORT_COLUMNS[sort]
+    if sort == "id" and title_prefix is not None and author is None:
+        # Unary + keeps SQLite on the title index instead of walking the
+        # table in id order, testing every row against the prefix
+        conditions.append("+id > ?")
+        params.append(-1 if after_id is None else after_id)
+    elif sort == "id":
+        conditions.append("id > ?")
+        params.append(-1 if after_id is None else after_id)
+    elif after_id is not None:
+        # The redundant range lets SQLite seek the index instead of scanning
+        conditions.append(f"{sort_column} >= ? AND ({sort_column}, id) > (?, ?)")
+        params.extend([after_key, after_key, after_id])
+
+    query = "SELECT id, title, description, author, version, updated_at FROM books"
+    if conditions:
+        query += " WHERE " + " AND ".join(conditions)
+    if sort == "id":
+        query += " ORDER BY id LIMIT ?"
+    else:
+        query += f" ORDER BY {sort_column}, id LIMIT ?"
+    params.append(limit)
+    return query, params
+
+
+def _fts_match_query(query: str) -> Optional[str]:
+    """
+    Turn free text into an FTS5 query that matches all of its words, quoting
+    every word so user input can never be parsed as FTS5 syntax.
+    """
+    tokens = _SEARCH_TOKEN_PATTERN.findall(query)
+    if not tokens:
+        return None
+    return " ".join(f'"{token}"' for token in tokens)
+
 class BookRepository(ABC):
     @abstractmethod
     def all_books(self) -> List[BookModel]:
         raise NotImplementedError
 
+    @abstractmethod
+    def books_page(
+            self,
+            after_id: Optional[int],
+            limit: int,
+            author: Optional[str] = None,
+            title_prefix: Optional[str] = None,
+            sort: BOOK_SORT = "id",
+            after_key: Optional[str] = None) -> List[BookModel]:
+        raise NotImplementedError
+
+    @abstractmethod
+    def iter_books(self, chunk_size: int) -> Iterator[BookModel]:
+        raise NotImplementedError
+
+    @abstractmethod
+    def search_books(self, query: str, limit: int, offset: int) -> List[BookModel]:
+        raise NotImplementedError
+
     @abstractmethod
     def book(self, id: int) -> Optional[BookModel]:
         raise NotImplementedError
 
+    @abstractmethod
+    def books_by_ids(self, ids: List[int]) -> List[BookModel]:
+        # Ids are unique, books come back in their order and missing ids are skipped
+        raise NotImplementedError
+
+    @abstractmethod
+    def book_version(self, id: int) -> Optional[BookVersionModel]:
+        raise NotImplementedError
+
+    @abstractmethod
+    def book_changes(self, since: int, limit: int) -> List[BookChangeModel]:
+        raise NotImplementedError
+
     @abstractmethod
     def create_book(self, title: str, description: Optional[str], author: str) -> BookModel:
         raise NotImplementedError
 
+    @abstractmethod
+    def create_books(self, books: List[NewBookModel]) -> List[BookModel]:
+        raise NotImplementedError
+
     @abstractmethod
     def update_book(
             self,
             id: int,
             title: Optional[str],
             description: Optional[str],
-            author: Optional[str]) -> BookModel:
+            author: Optional[str]) -> Optional[BookModel]:
         raise NotImplementedError
 
     @abstractmethod
-    def delete_book(self, id: int) -> None:
+    def delete_book(self, id: int) -> bool:
         raise NotImplementedError
 
 class SQLiteBookRepository(BookRepository):
     def __init__(self, db_path: Optional[str] = None):
         self.db_path = db_path or app_settings.db_url
+        self.pool = get_connection_pool(self.db_path)
 
     def all_books(self) -> List[BookModel]:
-        with sqlite3.connect(self.db_path) as db_connection:
+        with self.pool.reader() as db_connection:
             db_cursor = db_connection.cursor()
-            query = "SELECT id, title, description, author FROM books;"
+            query = (
+                "SELECT id, title, description, author, version, updated_at "
+                "FROM books"
+            )
             result = db_cursor.execute(query)
             books = result.fetchall()
 
-        return [
-            BookModel(
-                id=book[0],
-                title=book[1],
-                description=book[2],
-                author=book[3],
+        return [_book_from_row(book) for book in books]
+
+    def books_page(
+        self,
+        after_id: Optional[int],
+        limit: int,
+        author: Optional[str] = None,
+        title_prefix: Optional[str] = None,
+        sort: BOOK_SORT = "id",
+        after_key: Optional[str] = None,
+    ) -> List[BookModel]:
+        with self.pool.reader() as db_connection:
+            db_cursor = db_connection.cursor()
+            if after_id is not None and sort != "id" and after_key is None:
+                # Cursors without their sort key need the book to still exist
+                get_sort_key_query = f"SELECT {sort} FROM books WHERE id = ?"
+                after_book = db_cursor.execute(
+                    get_sort_key_query,
+                    (after_id,),
+                ).fetchone()
+                if not after_book:
+                    return []
+                after_key = after_book[0]
+
+            query, params = _books_page_query(
+                limit=limit,
+                after_id=after_id,
+                after_key=after_key,
+                author=author,
+                title_prefix=title_prefix,
+                sort=sort,
             )
-            for book in books
-        ]
+            result = db_cursor.execute(query, params)
+            books = result.fetchall()
+
+        return [_book_from_row(book) for book in books]
+
+    def iter_books(
+        self,
+        chunk_size: int,
+    ) -> Iterator[BookModel]:
+        with self.pool.dedicated_reader() as db_connection:
+            db_cursor = db_connection.cursor()
+            query = (
+                "SELECT id, title, description, author, version, updated_at "
+                "FROM books ORDER BY id"
+            )
+            db_cursor.execute(query)
+            while books := db_cursor.fetchmany(chunk_size):
+                for book in books:
+                    yield _book_from_row(book)
+
+    def search_books(
+        self,
+        query: str,
+        limit: int,
+        offset: int,
+    ) -> List[BookModel]:
+        match_query = _fts_match_query(query)
+        if match_query is None:
+            return []
+
+        with self.pool.reader() as db_connection:
+            db_cursor = db_connection.cursor()
+            search_query = (
+                "SELECT books.id, books.title, books.description, books.author, "
+                "books.version, books.updated_at "
+                "FROM books_fts JOIN books ON books.id = books_fts.rowid "
+                "WHERE books_fts MATCH ? "
+                "ORDER BY bm25(books_fts), books.id LIMIT ? OFFSET ?"
+            )
+            result = db_cursor.execute(search_query, (match_query, limit, offset))
+            books = result.fetchall()
+
+        return [_book_from_row(book) for book in books]
 
     def book(
         self,
         id: int,
     ) -> Optional[BookModel]:
-        with sqlite3.connect(self.db_path) as db_connection:
+        with self.pool.reader() as db_connection:
             db_cursor = db_connection.cursor()
-            query = "SELECT id, title, description, author FROM books WHERE id=?"
+            query = (
+                "SELECT id, title, description, author, version, updated_at "
+                "FROM books WHERE id=?"
+            )
             result = db_cursor.execute(query, (id,))
             book = result.fetchone()
             if not book:
                 return None
 
-        return BookModel(
-            id=book[0],
-            title=book[1],
-            description=book[2],
-            author=book[3],
-        )
+        return _book_from_row(book)
+
+    def books_by_ids(
+        self,
+        ids: List[int],
+    ) -> List[BookModel]:
+        if not ids:
+            return []
+
+        with self.pool.reader() as db_connection:
+            db_cursor = db_connection.cursor()
+            query = (
+                f"SELECT {_BOOK_COLUMNS} FROM books "
+                f"WHERE id IN ({', '.join(['?'] * len(ids))})"
+            )
+            result = db_cursor.execute(query, ids)
+            books = {book[0]: book for book in result.fetchall()}
+
+        return [_book_from_row(books[id]) for id in ids if id in books]
+
+    def book_version(
+        self,
+        id: int,
+    ) -> Optional[BookVersionModel]:
+        with self.pool.reader() as db_connection:
+            db_cursor = db_connection.cursor()
+            query = "SELECT id, version, updated_at FROM books WHERE id=?"
+            result = db_cursor.execute(query, (id,))
+            book = result.fetchone()
+            if not book:
+                return None
+
+        return BookVersionModel(id=book[0], version=book[1], updated_at=book[2])
+
+    def book_changes(
+        self,
+        since: int,
+        limit: int,
+    ) -> List[BookChangeModel]:
+        with self.pool.reader() as db_connection:
+            db_cursor = db_connection.cursor()
+            query = (
+                "SELECT book_changes.seq, book_changes.book_id, "
+                "book_changes.operation, book_changes.changed_at, "
+                "books.id, books.title, books.description, books.author, "
+                "books.version, books.updated_at "
+                "FROM book_changes LEFT JOIN books "
+                "ON books.id = book_changes.book_id "
+                # A delete never carries a book, whatever holds its id now
+                "AND book_changes.operation != 'delete' "
+                "WHERE book_changes.seq > ? ORDER BY book_changes.seq LIMIT ?"
+            )
+            result = db_cursor.execute(query, (since, limit))
+            changes = result.fetchall()
+
+        return [
+            BookChangeModel(
+                seq=change[0],
+                id=change[1],
+                operation=change[2],
+                changed_at=change[3],
+                book=None if change[4] is None else _book_from_row(change[4:]),
+            )
+            for change in changes
+        ]
 
     def create_book(
         self,
@@ -81,10 +338,11 @@ class SQLiteBookRepository(BookRepository):
         author: str,
     ) -> BookModel:
         description = description or ""
-        with sqlite3.connect(self.db_path) as db_connection:
+        with self.pool.writer() as db_connection:
             db_cursor = db_connection.cursor()
             insert_query = (
-                "INSERT INTO books (title, description, author) VALUES (?, ?, ?)"
+                "INSERT INTO books (title, description, author, updated_at) "
+                f"VALUES (?, ?, ?, ?) RETURNING {_BOOK_COLUMNS}"
             )
             db_cursor.execute(
                 insert_query,
@@ -92,25 +350,46 @@ class SQLiteBookRepository(BookRepository):
                     title,
                     description,
                     author,
+                    time.time(),
                 ),
             )
-            book_id = db_cursor.lastrowid
-            get_book_by_id_query = (
-                "SELECT id, title, description, author FROM books WHERE id = ?"
-            )
-            db_cursor.execute(
-                get_book_by_id_query,
-                (book_id,),
-            )
             book = db_cursor.fetchone()
-            db_connection.commit()
 
-        return BookModel(
-            id=book[0],
-            title=book[1],
-            description=book[2],
-            author=book[3],
-        )
+        return _book_from_row(book)
+
+    def create_books(
+        self,
+        books: List[NewBookModel],
+    ) -> List[BookModel]:
+        created_books = []
+        updated_at = time.time()
+        with self.pool.writer() as db_connection:
+            db_cursor = db_connection.cursor()
+            for start in range(0, len(books), _INSERT_BATCH_SIZE):
+                batch = books[start:start + _INSERT_BATCH_SIZE]
+                # One multi-row statement per batch, so ids come back
+                # without a second query
+                insert_query = (
+                    "INSERT INTO books (title, description, author, updated_at) "
+                    f"VALUES {', '.join(['(?, ?, ?, ?)'] * len(batch))} "
+                    f"RETURNING {_BOOK_COLUMNS}"
+                )
+                params = [
+                    value
+                    for book in batch
+                    for value in (
+                        book.title,
+                        book.description or "",
+                        book.author,
+                        updated_at,
+                    )
+                ]
+                db_cursor.execute(insert_query, params)
+                created_books.extend(db_cursor.fetchall())
+
+        # RETURNING does not guarantee row order
+        created_books.sort(key=lambda book: book[0])
+        return [_book_from_row(book) for book in created_books]
 
     def update_book(
         self,
@@ -128,56 +407,38 @@ class SQLiteBookRepository(BookRepository):
         if author:
             update_fields["author"] = author
 
-        with sqlite3.connect(self.db_path) as db_connection:
-            db_cursor = db_connection.cursor()
-            get_book_by_id_query = (
-                "SELECT id, title, description, author FROM books WHERE id=?"
-            )
-
-            result = db_cursor.execute(
-                get_book_by_id_query,
-                (id,),
-            )
-            book = result.fetchone()
-            if not book:
-                return None
-
-            field_names = [f"{k} = ?" for k in update_fields.keys()]
-            params = [v for v in update_fields.values()]
+        field_names = [f"{k} = ?" for k in update_fields.keys()]
+        params = [v for v in update_fields.values()]
 
-            if not field_names:
-                return None
+        if not field_names:
+            return None
 
+        with self.pool.writer() as db_connection:
+            db_cursor = db_connection.cursor()
             update_book_by_id_query = (
-                f"UPDATE books SET {', '.join(field_names)} WHERE id = ?"
+                f"UPDATE books SET {', '.join(field_names)}, "
+                "version = version + 1, updated_at = ? WHERE id = ? "
+                f"RETURNING {_BOOK_COLUMNS}"
             )
-            params.append(book[0])
+            params.append(time.time())
+            params.append(id)
 
             db_cursor.execute(update_book_by_id_query, tuple(params))
-            db_connection.commit()
-
-            updated_book = db_cursor.execute(
-                get_book_by_id_query,
-                (id,),
-            ).fetchone()
-
-            return BookModel(
-                id=updated_book[0],
-                title=updated_book[1],
-                description=updated_book[2],
-                author=updated_book[3],
-            )
+            updated_book = db_cursor.fetchone()
+            if not updated_book:
+                return None
 
+        return _book_from_row(updated_book)
 
     def delete_book(
         self,
         id: int,
-    ) -> None:
-        with sqlite3.connect(self.db_path) as db_connection:
+    ) -> bool:
+        with self.pool.writer() as db_connection:
             db_cursor = db_connection.cursor()
             delete_book_by_id_query = "DELETE FROM books WHERE id = ?"
             db_cursor.execute(
                 delete_book_by_id_query,
                 (id,),
             )
-            db_connection.commit()
+            return db_cursor.rowcount > 0
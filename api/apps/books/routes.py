@@ -1,40 +1,313 @@
-from typing import List
+from functools import lru_cache
+from typing import Any, List, Optional
+from urllib.parse import quote
 
-from fastapi import APIRouter, Depends, status
+from fastapi import APIRouter, Body, Depends, Query, Request, Response, status
+from fastapi.responses import StreamingResponse
 
+from apps.books.batching import (
+    BatchingBookRepository,
+    write_batch_metrics_collector,
+)
+from apps.books.cache import CachedBookRepository, cache_metrics_collector
 from apps.books.dtos import (
+    BookChangeResponseDto,
+    BookChangesResponseDto,
+    BulkCreateBookErrorDto,
+    BulkCreateBooksResponseDto,
     CreateBookRequestDto,
     CreateBookResponseDto,
     GetBookResponseDto,
     ListBookResponseDto,
+    LookupBooksRequestDto,
+    LookupBooksResponseDto,
     UpdateBookRequestDto,
     UpdateBookResponseDto,
 )
-from apps.books.repositories import SQLiteBookRepository
-from apps.books.services import BookService
+from apps.books.etags import (
+    book_etag,
+    has_conditional_headers,
+    is_not_modified,
+    validator_headers,
+)
+from apps.books.exports import EXPORT_FORMAT, EXPORT_MEDIA_TYPES, export_books
+from apps.books.memory import (
+    InMemoryBookRepository,
+    is_memory_url,
+    memory_source_path,
+)
+from apps.books.models import BOOK_SORT
+from apps.books.page_cache import (
+    BookPageCache,
+    accepts_gzip,
+    page_cache_metrics_collector,
+    render_books_page,
+)
+from apps.books.repositories import BookRepository, SQLiteBookRepository
+from apps.books.serializers import JSONBytesResponse, render_book, render_books
+from apps.books.services import AsyncBookService, BookService
+from apps.books.snapshot import SnapshotBookRepository, snapshot_metrics_collector
 from apps.exceptions import HTTP404Exception
+from apps.metrics.registry import get_metrics_registry
+from config.settings import get_settings
+from db.executor import get_database_executor
+
+app_settings = get_settings()
 
 router = APIRouter(
     prefix="/books",
 )
 
 
-def new_book_service():
-    return BookService(book_repository=SQLiteBookRepository())
+@lru_cache
+def get_book_repository() -> BookRepository:
+    if is_memory_url(app_settings.db_url):
+        memory_repository = InMemoryBookRepository()
+        source_path = memory_source_path(app_settings.db_url)
+        if source_path is not None:
+            memory_repository.load(
+                SQLiteBookRepository(db_path=source_path).iter_books(
+                    chunk_size=app_settings.books_export_chunk_size
+                )
+            )
+        return memory_repository
+
+    sqlite_repository = SQLiteBookRepository()
+    book_repository: BookRepository = sqlite_repository
+    if app_settings.book_write_batch_enabled:
+        # Innermost, so the layers above only see writes once committed
+        batching_repository = BatchingBookRepository(
+            book_repository=sqlite_repository,
+            pool=sqlite_repository.pool,
+            max_batch_size=app_settings.book_write_batch_max_size,
+            max_wait_ms=app_settings.book_write_batch_max_wait_ms,
+        )
+        get_metrics_registry().register_collector(
+            write_batch_metrics_collector(batching_repository)
+        )
+        book_repository = batching_repository
+    if app_settings.book_snapshot_enabled:
+        # The snapshot already answers every lookup the cache would
+        snapshot_repository = SnapshotBookRepository(
+            book_repository=book_repository,
+            chunk_size=app_settings.books_export_chunk_size,
+        )
+        get_metrics_registry().register_collector(
+            snapshot_metrics_collector(snapshot_repository)
+        )
+        return snapshot_repository
+    if app_settings.book_cache_enabled:
+        cached_repository = CachedBookRepository(
+            book_repository=book_repository,
+            max_entries=app_settings.book_cache_max_entries,
+            ttl_seconds=app_settings.book_cache_ttl_seconds,
+        )
+        get_metrics_registry().register_collector(
+            cache_metrics_collector(cached_repository)
+        )
+        book_repository = cached_repository
+    return book_repository
+
+
+@lru_cache
+def get_book_page_cache() -> Optional[BookPageCache]:
+    if not app_settings.book_list_cache_enabled:
+        return None
+    page_cache = BookPageCache(
+        max_entries=app_settings.book_list_cache_max_entries
+    )
+    get_metrics_registry().register_collector(
+        page_cache_metrics_collector(page_cache)
+    )
+    return page_cache
+
+
+async def new_book_service():
+    return BookService(
+        book_repository=get_book_repository(), page_cache=get_book_page_cache()
+    )
+
+
+async def new_async_book_service(
+    book_service: BookService = Depends(new_book_service),
+):
+    return AsyncBookService(
+        book_service=book_service, executor=get_database_executor()
+    )
 
 
 @router.get("/", response_model=List[ListBookResponseDto])
-def get_books(service: BookService = Depends(new_book_service)):
-    books = service.all_books()
-    return [ListBookResponseDto(**book.model_dump()) for book in books]
+async def get_books(
+    request: Request,
+    after_id: Optional[int] = Query(default=None, ge=0),
+    limit: int = Query(
+        default=app_settings.books_page_default_limit,
+        ge=1,
+        le=app_settings.books_page_max_limit,
+    ),
+    author: Optional[str] = Query(default=None, min_length=1),
+    title_prefix: Optional[str] = Query(default=None, min_length=1),
+    sort: BOOK_SORT = Query(default="id"),
+    after_key: Optional[str] = Query(default=None),
+    service: AsyncBookService = Depends(new_async_book_service),
+):
+    page_cache = service.page_cache
+    cache_key = (after_id, limit, author, title_prefix, sort, after_key)
+    gzip_min_size = (
+        app_settings.response_gzip_min_size
+        if app_settings.response_gzip_enabled
+        else None
+    )
+    rendered, generation = (
+        page_cache.get(cache_key) if page_cache is not None else (None, 0)
+    )
+    if rendered is None:
+        page = await service.books_page(
+            after_id=after_id,
+            limit=limit,
+            author=author,
+            title_prefix=title_prefix,
+            sort=sort,
+            after_key=after_key,
+        )
+        rendered = render_books_page(
+            page,
+            # Nothing keeps an uncached page, so only compress it for a
+            # client that takes gzip
+            gzip_min_size=(
+                gzip_min_size
+                if page_cache is not None or accepts_gzip(request)
+                else None
+            ),
+            gzip_level=app_settings.response_gzip_level,
+        )
+        if page_cache is not None:
+            page_cache.put(cache_key, rendered, generation)
+
+    headers = validator_headers(etag=rendered.etag, updated_at=rendered.updated_at)
+    if gzip_min_size is not None and len(rendered.body) >= gzip_min_size:
+        # Set here only, GZipMiddleware skips this route
+        headers["Vary"] = "Accept-Encoding"
+    if rendered.next_after_id is not None:
+        next_url = request.url.include_query_params(
+            after_id=rendered.next_after_id, limit=limit
+        )
+        if rendered.next_after_key is not None:
+            next_url = next_url.include_query_params(
+                after_key=rendered.next_after_key
+            )
+            headers["X-Next-Key"] = quote(rendered.next_after_key)
+        headers["X-Next-Cursor"] = str(rendered.next_after_id)
+        headers["Link"] = f'<{next_url}>; rel="next"'
+    # Deletes do not move Last-Modified, so only the ETag is trusted here
+    if is_not_modified(request, headers["ETag"]):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+
+    if rendered.gzip_body is None or not accepts_gzip(request):
+        return JSONBytesResponse(rendered.body, headers=headers)
+    headers["Content-Encoding"] = "gzip"
+    return JSONBytesResponse(rendered.gzip_body, headers=headers)
+
+
+@router.get("/search", response_model=List[ListBookResponseDto])
+async def search_books(
+    request: Request,
+    q: str = Query(min_length=1),
+    limit: int = Query(
+        default=app_settings.books_page_default_limit,
+        ge=1,
+        le=app_settings.books_page_max_limit,
+    ),
+    offset: int = Query(default=0, ge=0),
+    service: AsyncBookService = Depends(new_async_book_service),
+):
+    page = await service.search_books(query=q, limit=limit, offset=offset)
+    headers = {}
+    if page.next_offset is not None:
+        next_url = request.url.include_query_params(
+            offset=page.next_offset, limit=limit
+        )
+        headers["X-Next-Offset"] = str(page.next_offset)
+        headers["Link"] = f'<{next_url}>; rel="next"'
+    return JSONBytesResponse(render_books(page.books), headers=headers)
+
+
+@router.get("/changes", response_model=BookChangesResponseDto)
+async def get_book_changes(
+    since: int = Query(default=0, ge=0),
+    limit: int = Query(
+        default=app_settings.books_page_default_limit,
+        ge=1,
+        le=app_settings.books_page_max_limit,
+    ),
+    service: AsyncBookService = Depends(new_async_book_service),
+):
+    page = await service.book_changes(since=since, limit=limit)
+    return BookChangesResponseDto(
+        changes=[
+            BookChangeResponseDto(
+                seq=change.seq,
+                id=change.id,
+                operation=change.operation,
+                changed_at=change.changed_at,
+                book=(
+                    None
+                    if change.book is None
+                    else GetBookResponseDto(**change.book.model_dump())
+                ),
+            )
+            for change in page.changes
+        ],
+        next_since=page.next_since,
+    )
+
+
+@router.get("/export", response_class=StreamingResponse)
+async def export_all_books(
+    export_format: EXPORT_FORMAT = Query(default="ndjson", alias="format"),
+    service: AsyncBookService = Depends(new_async_book_service),
+):
+    content = export_books(
+        books=service.export_books(),
+        export_format=export_format,
+        chunk_size=app_settings.books_export_chunk_size,
+    )
+    return StreamingResponse(
+        service.executor.iterate(content),
+        media_type=EXPORT_MEDIA_TYPES[export_format],
+        headers={
+            "Content-Disposition": f'attachment; filename="books.{export_format}"'
+        },
+    )
 
 
 @router.get("/{book_id}", response_model=GetBookResponseDto)
-def get_book(book_id: int, service: BookService = Depends(new_book_service)):
-    book = service.book(id=book_id)
+async def get_book(
+    book_id: int,
+    request: Request,
+    service: AsyncBookService = Depends(new_async_book_service),
+):
+    if has_conditional_headers(request):
+        # Answer revalidation from the version alone, without the full row
+        version = await service.book_version(id=book_id)
+        if not version:
+            raise HTTP404Exception(detail=f"Book with id: {book_id} not found")
+        etag = book_etag(id=version.id, version=version.version)
+        if is_not_modified(request, etag, version.updated_at):
+            return Response(
+                status_code=status.HTTP_304_NOT_MODIFIED,
+                headers=validator_headers(etag, version.updated_at),
+            )
+
+    book = await service.book(id=book_id)
     if not book:
         raise HTTP404Exception(detail=f"Book with id: {book_id} not found")
-    return GetBookResponseDto(**book.model_dump())
+    return JSONBytesResponse(
+        render_book(book),
+        headers=validator_headers(
+            book_etag(id=book.id, version=book.version), book.updated_at
+        ),
+    )
 
 
 @router.post(
@@ -42,25 +315,72 @@ def get_book(book_id: int, service: BookService = Depends(new_book_service)):
     response_model=CreateBookResponseDto,
     status_code=status.HTTP_201_CREATED,
 )
-def create_book(
+async def create_book(
     create_book_request_dto: CreateBookRequestDto,
-    service: BookService = Depends(new_book_service),
+    service: AsyncBookService = Depends(new_async_book_service),
 ):
-    book = service.new_book(
+    book = await service.new_book(
         title=create_book_request_dto.title,
         description=create_book_request_dto.description,
         author=create_book_request_dto.author,
     )
-    return CreateBookResponseDto(**book.model_dump())
+    return JSONBytesResponse(
+        render_book(book), status_code=status.HTTP_201_CREATED
+    )
+
+
+@router.post(
+    "/bulk",
+    response_model=BulkCreateBooksResponseDto,
+    status_code=status.HTTP_201_CREATED,
+    # Items are taken as raw JSON so each is validated on its own and
+    # reported in errors, instead of one bad item failing the request
+    openapi_extra={
+        "requestBody": {
+            "required": True,
+            "content": {
+                "application/json": {
+                    "schema": {
+                        "type": "array",
+                        "items": {
+                            "$ref": "#/components/schemas/CreateBookRequestDto"
+                        },
+                    }
+                }
+            },
+        }
+    },
+)
+async def create_books(
+    create_book_request_items: List[Any] = Body(),
+    service: AsyncBookService = Depends(new_async_book_service),
+):
+    result = await service.new_books(books=create_book_request_items)
+    return BulkCreateBooksResponseDto(
+        created=[CreateBookResponseDto(**book.model_dump()) for book in result.books],
+        errors=[BulkCreateBookErrorDto(**error.model_dump()) for error in result.errors],
+    )
+
+
+@router.post("/lookup", response_model=LookupBooksResponseDto)
+async def lookup_books(
+    lookup_books_request_dto: LookupBooksRequestDto,
+    service: AsyncBookService = Depends(new_async_book_service),
+):
+    result = await service.lookup_books(ids=lookup_books_request_dto.ids)
+    return LookupBooksResponseDto(
+        books=[GetBookResponseDto(**book.model_dump()) for book in result.books],
+        missing_ids=result.missing_ids,
+    )
 
 
 @router.patch("/{book_id}", response_model=UpdateBookResponseDto)
-def update_book(
+async def update_book(
     book_id: int,
     update_book_dto: UpdateBookRequestDto,
-    service: BookService = Depends(new_book_service),
+    service: AsyncBookService = Depends(new_async_book_service),
 ):
-    updated_book = service.update_book(
+    updated_book = await service.update_book(
         id=book_id,
         title=update_book_dto.title,
         description=update_book_dto.description,
@@ -69,10 +389,12 @@ def update_book(
     if not updated_book:
         raise HTTP404Exception(detail=f"Book with id: {book_id} not found")
 
-    return UpdateBookResponseDto(**updated_book.model_dump())
+    return JSONBytesResponse(render_book(updated_book))
 
 @router.delete("/{book_id}", status_code=status.HTTP_204_NO_CONTENT)
-def delete_book(
-    book_id: int, service: BookService = Depends(new_book_service)
+async def delete_book(
+    book_id: int,
+    service: AsyncBookService = Depends(new_async_book_service),
 ):
-    service.remove_book(id=book_id)
+    if not await service.remove_book(id=book_id):
+        raise HTTP404Exception(detail=f"Book with id: {book_id} not found")
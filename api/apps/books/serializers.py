@@ -0,0 +1,31 @@
+"""
+Fast path serialization for book responses.
+
+Book endpoints declare their response DTOs for validation and OpenAPI, but
+building a DTO per book and letting FastAPI validate and encode it again
+costs more than the query on large pages. Every BookModel field that is not
+part of those DTOs is excluded from serialization, so BookModels can be
+dumped straight to JSON bytes in a single call.
+"""
+
+from typing import List
+
+from fastapi import Response
+from pydantic import TypeAdapter
+
+from apps.books.models import BookModel
+
+_book_adapter = TypeAdapter(BookModel)
+_books_adapter = TypeAdapter(List[BookModel])
+
+
+class JSONBytesResponse(Response):
+    media_type = "application/json"
+
+
+def render_book(book: BookModel) -> bytes:
+    return _book_adapter.dump_json(book)
+
+
+def render_books(books: List[BookModel]) -> bytes:
+    return _books_adapter.dump_json(books)
@@ -1,9 +1,28 @@
-from typing import List, Optional
+from typing import Any, Iterator, List, Optional, get_args
 
-from apps.books.models import BookModel
+from apps.books.models import (
+    BOOK_SORT,
+    BookChangesPageModel,
+    BookErrorModel,
+    BookLookupModel,
+    BookModel,
+    BookPageModel,
+    BookSearchPageModel,
+    BookVersionModel,
+    BulkCreatedBooksModel,
+    NewBookModel,
+)
+from apps.books.page_cache import BookPageCache
 from apps.books.repositories import BookRepository
 from apps.exceptions import BusinessRuleException
-from apps.validators import is_non_negative_strict_integer
+from apps.validators import (
+    is_non_negative_strict_integer,
+    is_positive_strict_integer,
+)
+from config.settings import get_settings
+from db.executor import DatabaseExecutor
+
+app_settings = get_settings()
 
 
 class InvalidBookIdValueError(BusinessRuleException):
@@ -22,20 +41,149 @@ class InvalidBookAuthorValueError(BusinessRuleException):
     """Raised when book author is not a string"""
     pass
 
+class InvalidBookPageLimitValueError(BusinessRuleException):
+    """Raised when page limit is out of range"""
+    pass
+
+class InvalidBookSortValueError(BusinessRuleException):
+    """Raised when sort field is not supported"""
+    pass
+
+class InvalidBookSearchQueryValueError(BusinessRuleException):
+    """Raised when search query is not a non blank string"""
+    pass
+
+class InvalidBookSearchOffsetValueError(BusinessRuleException):
+    """Raised when search offset is invalid"""
+    pass
+
+class InvalidBookBatchSizeValueError(BusinessRuleException):
+    """Raised when a batch of books is empty or too large"""
+    pass
+
+class InvalidBookChangesSinceValueError(BusinessRuleException):
+    """Raised when change feed position is invalid"""
+    pass
+
+class InvalidBookPageCursorValueError(BusinessRuleException):
+    """Raised when a page cursor's sort key is invalid"""
+    pass
+
+class InvalidBookBatchItemError(BusinessRuleException):
+    """Raised when an item of a batch of books is not an object"""
+    pass
+
 class BookService():
-    def __init__(self, book_repository: BookRepository):
+    def __init__(self, book_repository: BookRepository, page_cache: Optional[BookPageCache] = None):
         self.book_repository = book_repository
+        self.page_cache = page_cache
+
+    def _books_changed(self) -> None:
+        # Called after the write, so a page read before it commits cannot
+        # be cached once it has
+        if self.page_cache is not None:
+            self.page_cache.invalidate()
 
     def all_books(self) -> List[BookModel]:
         return self.book_repository.all_books()
 
+    def books_page(
+            self,
+            after_id: Optional[int],
+            limit: int,
+            author: Optional[str] = None,
+            title_prefix: Optional[str] = None,
+            sort: BOOK_SORT = "id",
+            after_key: Optional[str] = None) -> BookPageModel:
+        if after_id is not None and not is_non_negative_strict_integer(after_id):
+            raise InvalidBookIdValueError("Book ID needs to be a non negative integer")
+        max_limit = app_settings.books_page_max_limit
+        if not is_positive_strict_integer(limit) or limit > max_limit:
+            raise InvalidBookPageLimitValueError(f"Page limit needs to be an integer between 1 and {max_limit}")
+        if author is not None and not isinstance(author, str):
+            raise InvalidBookAuthorValueError("Book author needs to be text")
+        if title_prefix is not None and not isinstance(title_prefix, str):
+            raise InvalidBookTitleValueError("Book title needs to be text")
+        if sort not in get_args(BOOK_SORT):
+            raise InvalidBookSortValueError(f"Books can only be sorted by {', '.join(get_args(BOOK_SORT))}")
+        if after_key is not None and (not isinstance(after_key, str) or after_id is None):
+            raise InvalidBookPageCursorValueError("Page cursor key needs to be text and come with after_id")
+        if sort == "id":
+            after_key = None
+
+        # One extra row tells us whether there is a next page
+        books = self.book_repository.books_page(
+            after_id=after_id,
+            limit=limit + 1,
+            author=author,
+            title_prefix=title_prefix,
+            sort=sort,
+            after_key=after_key,
+        )
+        if len(books) <= limit:
+            return BookPageModel(books=books)
+
+        books = books[:limit]
+        last_book = books[-1]
+        # The sort key travels with the cursor, so the next page does not
+        # depend on that book still existing
+        next_after_key = None
+        if sort == "title":
+            next_after_key = last_book.title
+        elif sort == "author":
+            next_after_key = last_book.author
+        return BookPageModel(books=books, next_after_id=last_book.id, next_after_key=next_after_key)
+
+    def search_books(self, query: str, limit: int, offset: int) -> BookSearchPageModel:
+        if not isinstance(query, str) or not query.strip():
+            raise InvalidBookSearchQueryValueError("Search query needs to be non blank text")
+        max_limit = app_settings.books_page_max_limit
+        if not is_positive_strict_integer(limit) or limit > max_limit:
+            raise InvalidBookPageLimitValueError(f"Page limit needs to be an integer between 1 and {max_limit}")
+        if not is_non_negative_strict_integer(offset):
+            raise InvalidBookSearchOffsetValueError("Search offset needs to be a non negative integer")
+
+        books = self.book_repository.search_books(query=query, limit=limit + 1, offset=offset)
+        if len(books) <= limit:
+            return BookSearchPageModel(books=books)
+
+        return BookSearchPageModel(books=books[:limit], next_offset=offset + limit)
+
+    def book_changes(self, since: int, limit: int) -> BookChangesPageModel:
+        if not is_non_negative_strict_integer(since):
+            raise InvalidBookChangesSinceValueError("Change feed position needs to be a non negative integer")
+        max_limit = app_settings.books_page_max_limit
+        if not is_positive_strict_integer(limit) or limit > max_limit:
+            raise InvalidBookPageLimitValueError(f"Page limit needs to be an integer between 1 and {max_limit}")
+
+        changes = self.book_repository.book_changes(since=since, limit=limit)
+        next_since = changes[-1].seq if changes else since
+        return BookChangesPageModel(changes=changes, next_since=next_since)
+
+    def export_books(self) -> Iterator[BookModel]:
+        return self.book_repository.iter_books(chunk_size=app_settings.books_export_chunk_size)
+
     def book(self, id: int) -> Optional[BookModel]:
         if not is_non_negative_strict_integer(id):
             raise InvalidBookIdValueError("Book ID needs to be a non negative integer")
 
         return self.book_repository.book(id=id)
 
-    def new_book(self, title: str, description: Optional[str], author: str) -> BookModel:
+    def lookup_books(self, ids: List[int]) -> BookLookupModel:
+        max_ids = app_settings.books_lookup_max_ids
+        if not 0 < len(ids) <= max_ids:
+            raise InvalidBookBatchSizeValueError(f"Book lookup needs to contain between 1 and {max_ids} ids")
+        for id in ids:
+            if not is_non_negative_strict_integer(id):
+                raise InvalidBookIdValueError("Book ID needs to be a non negative integer")
+
+        # Each book is returned once, at the position it was first asked for
+        unique_ids = list(dict.fromkeys(ids))
+        books = self.book_repository.books_by_ids(ids=unique_ids)
+        found_ids = {book.id for book in books}
+        return BookLookupModel(books=books, missing_ids=[id for id in unique_ids if id not in found_ids])
+
+    def validate_new_book(self, title: str, description: Optional[str], author: str) -> None:
         if not isinstance(title, str):
             raise InvalidBookTitleValueError("Book title needs to be text")
         if description is not None and not isinstance(description, str):
@@ -43,7 +191,56 @@ class BookService():
         if not isinstance(author, str):
             raise InvalidBookAuthorValueError("Book author needs to be text")
 
-        return self.book_repository.create_book(title=title, description=description, author=author)
+    def book_version(self, id: int) -> Optional[BookVersionModel]:
+        if not is_non_negative_strict_integer(id):
+            raise InvalidBookIdValueError("Book ID needs to be a non negative integer")
+
+        return self.book_repository.book_version(id=id)
+
+    def new_book(self, title: str, description: Optional[str], author: str) -> BookModel:
+        self.validate_new_book(title=title, description=description, author=author)
+
+        try:
+            return self.book_repository.create_book(title=title, description=description, author=author)
+        finally:
+            self._books_changed()
+
+    def new_book_from_item(self, item: Any) -> NewBookModel:
+        """Validate one item of a batch, a NewBookModel or a decoded JSON value"""
+        if isinstance(item, NewBookModel):
+            item = item.__dict__
+        if not isinstance(item, dict):
+            raise InvalidBookBatchItemError("Book needs to be a JSON object")
+        title = item.get("title")
+        description = item.get("description")
+        author = item.get("author")
+        self.validate_new_book(title=title, description=description, author=author)
+        return NewBookModel(title=title, description=description, author=author)
+
+    def new_books(self, books: List[Any]) -> BulkCreatedBooksModel:
+        """
+        Create every valid item of the batch in one call and report the
+        others by index, so one bad item does not fail the rest
+        """
+        max_items = app_settings.books_bulk_max_items
+        if not 0 < len(books) <= max_items:
+            raise InvalidBookBatchSizeValueError(f"Book batch needs to contain between 1 and {max_items} books")
+
+        valid_books = []
+        errors = []
+        for index, item in enumerate(books):
+            try:
+                valid_books.append(self.new_book_from_item(item))
+            except BusinessRuleException as exc:
+                errors.append(BookErrorModel(index=index, message=str(exc)))
+
+        created_books = []
+        if valid_books:
+            try:
+                created_books = self.book_repository.create_books(books=valid_books)
+            finally:
+                self._books_changed()
+        return BulkCreatedBooksModel(books=created_books, errors=errors)
 
     def update_book(self, id: int, title: Optional[str], description: Optional[str], author: Optional[str]) -> Optional[BookModel]:
         if not is_non_negative_strict_integer(id):
@@ -56,11 +253,77 @@ class BookService():
         if author is not None and not isinstance(author, str):
             raise InvalidBookAuthorValueError("Book author needs to be text")
 
-        return self.book_repository.update_book(id=id, title=title, description=description, author=author)
+        try:
+            return self.book_repository.update_book(id=id, title=title, description=description, author=author)
+        finally:
+            self._books_changed()
 
 
-    def remove_book(self, id: int) -> None:
+    def remove_book(self, id: int) -> bool:
         if not is_non_negative_strict_integer(id):
             raise InvalidBookIdValueError("Book ID needs to be a non negative integer")
 
-        self.book_repository.delete_book(id=id)
+        try:
+            return self.book_repository.delete_book(id=id)
+        finally:
+            self._books_changed()
+
+
+class AsyncBookService():
+    """Runs BookService calls on the database executor for async handlers"""
+    def __init__(self, book_service: BookService, executor: DatabaseExecutor):
+        self.book_service = book_service
+        self.executor = executor
+        self.page_cache = book_service.page_cache
+
+    async def all_books(self) -> List[BookModel]:
+        return await self.executor.run(self.book_service.all_books)
+
+    async def books_page(
+            self,
+            after_id: Optional[int],
+            limit: int,
+            author: Optional[str] = None,
+            title_prefix: Optional[str] = None,
+            sort: BOOK_SORT = "id",
+            after_key: Optional[str] = None) -> BookPageModel:
+        return await self.executor.run(
+            self.book_service.books_page,
+            after_id=after_id,
+            limit=limit,
+            author=author,
+            title_prefix=title_prefix,
+            sort=sort,
+            after_key=after_key,
+        )
+
+    async def search_books(self, query: str, limit: int, offset: int) -> BookSearchPageModel:
+        return await self.executor.run(self.book_service.search_books, query=query, limit=limit, offset=offset)
+
+    async def book_changes(self, since: int, limit: int) -> BookChangesPageModel:
+        return await self.executor.run(self.book_service.book_changes, since=since, limit=limit)
+
+    def export_books(self) -> Iterator[BookModel]:
+        # Lazy, nothing is read until the caller iterates it on the executor
+        return self.book_service.export_books()
+
+    async def book(self, id: int) -> Optional[BookModel]:
+        return await self.executor.run(self.book_service.book, id=id)
+
+    async def lookup_books(self, ids: List[int]) -> BookLookupModel:
+        return await self.executor.run(self.book_service.lookup_books, ids=ids)
+
+    async def book_version(self, id: int) -> Optional[BookVersionModel]:
+        return await self.executor.run(self.book_service.book_version, id=id)
+
+    async def new_book(self, title: str, description: Optional[str], author: str) -> BookModel:
+        return await self.executor.run(self.book_service.new_book, title=title, description=description, author=author)
+
+    async def new_books(self, books: List[Any]) -> BulkCreatedBooksModel:
+        return await self.executor.run(self.book_service.new_books, books=books)
+
+    async def update_book(self, id: int, title: Optional[str], description: Optional[str], author: Optional[str]) -> Optional[BookModel]:
+        return await self.executor.run(self.book_service.update_book, id=id, title=title, description=description, author=author)
+
+    async def remove_book(self, id: int) -> bool:
+        return await self.executor.run(self.book_service.remove_book, id=id)
@@ -0,0 +1,639 @@
+"""
+Immutable in-memory snapshot of the catalogue for list and get reads.
+
+Readers take whatever snapshot is current, a single attribute read, and
+never touch SQLite or a lock. Writers apply their changes to the wrapped
+repository and then swap in a new snapshot with the delta applied. The
+books and indexes are split into chunks, so the new snapshot shares every
+chunk the delta does not touch with the old one.
+"""
+
+import bisect
+import itertools
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from typing import (
+    Callable,
+    Container,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    Mapping,
+    Optional,
+    Sequence,
+    Set,
+    Tuple,
+    TypeVar,
+)
+
+from pydantic import BaseModel
+
+from apps.books.memory import books_page_from_indexes, nocase
+from apps.books.models import (
+    BOOK_SORT,
+    BookChangeModel,
+    BookModel,
+    BookVersionModel,
+    NewBookModel,
+)
+from apps.books.repositories import BookRepository
+from apps.metrics.registry import Gauge
+from config.logging import get_logger
+
+logger = get_logger(__name__)
+
+# A (key, id) index entry and the list slot pointing at it
+_INDEX_ENTRY_BYTES = sys.getsizeof((None, None)) + 8
+# Entries per index chunk when built, chunks are split at twice this. A
+# write copies the chunks it touches and a tuple with one slot per chunk
+_CHUNK_SIZE = 1024
+# Books are bucketed by id >> _BUCKET_BITS, a write copies the buckets it
+# touches and the dict of buckets
+_BUCKET_BITS = 10
+
+T = TypeVar("T")
+
+
+def _book_size(book: BookModel) -> int:
+    """Approximate bytes held by one book, its fields and its index entries"""
+    return (
+        sys.getsizeof(book)
+        + sys.getsizeof(book.__dict__)
+        + sum(sys.getsizeof(value) for value in book.__dict__.values())
+        + 2 * _INDEX_ENTRY_BYTES
+    )
+
+
+class BookSnapshotStatsModel(BaseModel):
+    books: int
+    memory_bytes: int
+    age_seconds: float
+    last_update_age_seconds: float
+    updates: int
+
+
+class SortedChunks(Sequence[T]):
+    """
+    Immutable sorted sequence held as a tuple of sorted chunks. Positional
+    lookups bisect the chunk offsets first, so bisect works on it as on a
+    list. with_changes rebuilds only the chunks it touches.
+    """
+
+    __slots__ = ("chunks", "maxes", "offsets", "length")
+
+    def __init__(self, chunks: Tuple[Tuple[T, ...], ...] = ()):
+        self.chunks = chunks
+        self.maxes = tuple(chunk[-1] for chunk in chunks)
+        self.offsets = tuple(
+            itertools.accumulate((len(chunk) for chunk in chunks), initial=0)
+        )
+        self.length = self.offsets[-1]
+
+    @classmethod
+    def build(cls, items: Iterable[T]) -> "SortedChunks[T]":
+        items = sorted(items)
+        return cls(
+            tuple(
+                tuple(items[start:start + _CHUNK_SIZE])
+                for start in range(0, len(items), _CHUNK_SIZE)
+            )
+        )
+
+    def __len__(self) -> int:
+        return self.length
+
+    def __iter__(self) -> Iterator[T]:
+        return itertools.chain.from_iterable(self.chunks)
+
+    def __getitem__(self, position):
+        if isinstance(position, slice):
+            start, stop, step = position.indices(self.length)
+            if step != 1:
+                return list(self)[position]
+            return list(self._range(start, stop))
+        if position < 0:
+            position += self.length
+        if not 0 <= position < self.length:
+            raise IndexError("SortedChunks index out of range")
+        chunk = bisect.bisect_right(self.offsets, position) - 1
+        return self.chunks[chunk][position - self.offsets[chunk]]
+
+    def _range(self, start: int, stop: int) -> Iterator[T]:
+        if start >= stop:
+            return
+        chunk = bisect.bisect_right(self.offsets, start) - 1
+        position = start - self.offsets[chunk]
+        remaining = stop - start
+        while remaining > 0:
+            items = self.chunks[chunk][position:position + remaining]
+            yield from items
+            remaining -= len(items)
+            chunk += 1
+            position = 0
+
+    def with_changes(
+        self, removed: Iterable[T], added: Iterable[T]
+    ) -> "SortedChunks[T]":
+        chunks = list(self.chunks)
+        maxes = list(self.maxes)
+        for item in removed:
+            index = bisect.bisect_left(maxes, item)
+            if index == len(chunks):
+                continue
+            chunk = chunks[index]
+            position = bisect.bisect_left(chunk, item)
+            if chunk[position] != item:
+                continue
+            chunk = chunk[:position] + chunk[position + 1:]
+            if chunk:
+                chunks[index] = chunk
+                maxes[index] = chunk[-1]
+            else:
+                del chunks[index]
+                del maxes[index]
+        for item in added:
+            if not chunks:
+                chunks.append((item,))
+                maxes.append(item)
+                continue
+            index = min(bisect.bisect_left(maxes, item), len(chunks) - 1)
+            chunk = chunks[index]
+            position = bisect.bisect_left(chunk, item)
+            chunk = chunk[:position] + (item,) + chunk[position:]
+            if len(chunk) > 2 * _CHUNK_SIZE:
+                half = len(chunk) // 2
+                chunks[index:index + 1] = [chunk[:half], chunk[half:]]
+                maxes[index:index + 1] = [chunk[half - 1], chunk[-1]]
+            else:
+                chunks[index] = chunk
+                maxes[index] = chunk[-1]
+        return SortedChunks(tuple(chunks))
+
+
+class BookBuckets(Mapping[int, BookModel]):
+    """Immutable id to book mapping held as a dict of small dicts"""
+
+    __slots__ = ("buckets", "length")
+
+    def __init__(self, buckets: Dict[int, Dict[int, BookModel]], length: int):
+        self.buckets = buckets
+        self.length = length
+
+    @classmethod
+    def build(cls, books: Iterable[BookModel]) -> "BookBuckets":
+        buckets: Dict[int, Dict[int, BookModel]] = {}
+        length = 0
+        for book in books:
+            bucket = buckets.setdefault(book.id >> _BUCKET_BITS, {})
+            length += book.id not in bucket
+            bucket[book.id] = book
+        return cls(buckets, length)
+
+    def __getitem__(self, id: int) -> BookModel:
+        bucket = self.buckets.get(id >> _BUCKET_BITS)
+        if bucket is None:
+            raise KeyError(id)
+        return bucket[id]
+
+    def get(self, id: int, default=None):
+        bucket = self.buckets.get(id >> _BUCKET_BITS)
+        if bucket is None:
+            return default
+        return bucket.get(id, default)
+
+    def __contains__(self, id: object) -> bool:
+        bucket = self.buckets.get(id >> _BUCKET_BITS)  # type: ignore[operator]
+        return bucket is not None and id in bucket
+
+    def __iter__(self) -> Iterator[int]:
+        return itertools.chain.from_iterable(self.buckets.values())
+
+    def __len__(self) -> int:
+        return self.length
+
+    def with_changes(
+        self, removed_ids: Iterable[int], added: Iterable[BookModel]
+    ) -> "BookBuckets":
+        buckets = dict(self.buckets)
+        copied: Set[int] = set()
+        length = self.length
+
+        def bucket_for(id: int) -> Dict[int, BookModel]:
+            key = id >> _BUCKET_BITS
+            if key not in copied:
+                buckets[key] = dict(buckets.get(key, {}))
+                copied.add(key)
+            return buckets[key]
+
+        for id in removed_ids:
+            bucket = bucket_for(id)
+            if bucket.pop(id, None) is not None:
+                length -= 1
+            if not bucket:
+                del buckets[id >> _BUCKET_BITS]
+                copied.discard(id >> _BUCKET_BITS)
+        for book in added:
+            bucket = bucket_for(book.id)
+            length += book.id not in bucket
+            bucket[book.id] = book
+        return BookBuckets(buckets, length)
+
+
+class BookSnapshot:
+    """
+    One immutable version of the catalogue with the same indexes as
+    InMemoryBookRepository. with_changes returns a new snapshot and leaves
+    this one untouched, so it can be read without locking.
+    """
+
+    __slots__ = (
+        "books",
+        "ids",
+        "titles",
+        "authors",
+        "memory_bytes",
+        "loaded_at",
+        "updated_at",
+        "updates",
+    )
+
+    def __init__(
+        self,
+        books: BookBuckets,
+        ids: SortedChunks[int],
+        titles: SortedChunks[Tuple[str, int]],
+        authors: SortedChunks[Tuple[str, int]],
+        memory_bytes: int,
+        loaded_at: float,
+        updated_at: float,
+        updates: int,
+    ):
+        self.books = books
+        self.ids = ids
+        self.titles = titles
+        self.authors = authors
+        self.memory_bytes = memory_bytes
+        self.loaded_at = loaded_at
+        self.updated_at = updated_at
+        self.updates = updates
+
+    @classmethod
+    def build(
+        cls,
+        books: Iterable[BookModel],
+        clock: Callable[[], float] = time.monotonic,
+    ) -> "BookSnapshot":
+        books_by_id = {book.id: book for book in books}
+        entries = books_by_id.values()
+        now = clock()
+        return cls(
+            books=BookBuckets.build(entries),
+            ids=SortedChunks.build(books_by_id),
+            titles=SortedChunks.build(
+                (book.title, book.id) for book in entries
+            ),
+            authors=SortedChunks.build(
+                (nocase(book.author), book.id) for book in entries
+            ),
+            memory_bytes=sum(_book_size(book) for book in entries),
+            loaded_at=now,
+            updated_at=now,
+            updates=0,
+        )
+
+    def with_changes(
+        self,
+        upserted: Iterable[BookModel] = (),
+        deleted_ids: Iterable[int] = (),
+        ignored_ids: Container[int] = (),
+        clock: Callable[[], float] = time.monotonic,
+    ) -> "BookSnapshot":
+        """
+        Deletes are applied before upserts. An upsert is skipped when its id
+        is in ignored_ids or the snapshot already holds that book at the
+        same or a later version, so deltas can arrive out of order.
+        """
+        changed: Dict[int, Optional[BookModel]] = {}
+        for id in deleted_ids:
+            changed[id] = None
+        for book in upserted:
+            if book.id in ignored_ids:
+                continue
+            if book.id in changed:
+                held = changed[book.id]
+            else:
+                held = self.books.get(book.id)
+            if held is not None and held.version >= book.version:
+                continue
+            changed[book.id] = book
+        removed = [
+            self.books[id]
+            for id, book in changed.items()
+            if id in self.books and self.books[id] is not book
+        ]
+        added = [
+            book
+            for book in changed.values()
+            if book is not None and self.books.get(book.id) is not book
+        ]
+        if not removed and not added:
+            return self
+
+        return BookSnapshot(
+            books=self.books.with_changes(
+                (book.id for book in removed), added
+            ),
+            ids=self.ids.with_changes(
+                (book.id for book in removed), (book.id for book in added)
+            ),
+            titles=self.titles.with_changes(
+                ((book.title, book.id) for book in removed),
+                ((book.title, book.id) for book in added),
+            ),
+            authors=self.authors.with_changes(
+                ((nocase(book.author), book.id) for book in removed),
+                ((nocase(book.author), book.id) for book in added),
+            ),
+            memory_bytes=self.memory_bytes
+            - sum(_book_size(book) for book in removed)
+            + sum(_book_size(book) for book in added),
+            loaded_at=self.loaded_at,
+            updated_at=clock(),
+            updates=self.updates + 1,
+        )
+
+
+class SnapshotBookRepository(BookRepository):
+    """
+    Serves all_books, books_page, book, books_by_ids and book_version from
+    a BookSnapshot and everything else from the wrapped repository. Until
+    load is called every read goes to the wrapped repository.
+
+    Writes run concurrently and the lock is only held to swap in the
+    snapshot with their delta applied, retrying when another write swapped
+    first. Deltas may therefore be applied in a different order than they
+    were committed. Upserts older than the book held are skipped, and the
+    ids of deleted books are remembered while other writes are in flight,
+    so an update that committed before a delete cannot bring the book
+    back. Changes made to the database by other processes are only picked
+    up by the next load.
+    """
+
+    def __init__(
+        self,
+        book_repository: BookRepository,
+        chunk_size: int,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.book_repository = book_repository
+        self.chunk_size = chunk_size
+        self._clock = clock
+        self._swap_lock = threading.Lock()
+        self._snapshot: Optional[BookSnapshot] = None
+        # Deltas applied while load builds a snapshot, replayed onto it
+        self._pending: Optional[List[Tuple[List[BookModel], List[int]]]] = None
+        self._deleted_ids: Set[int] = set()
+        self._writes_in_flight = 0
+
+    def load(self) -> None:
+        start = time.perf_counter()
+        with self._swap_lock:
+            self._pending = []
+        try:
+            snapshot = BookSnapshot.build(
+                self.book_repository.iter_books(chunk_size=self.chunk_size),
+                clock=self._clock,
+            )
+        except BaseException:
+            with self._swap_lock:
+                self._pending = None
+            raise
+        with self._swap_lock:
+            for upserted, deleted_ids in self._pending or ():
+                snapshot = snapshot.with_changes(
+                    upserted=upserted,
+                    deleted_ids=deleted_ids,
+                    ignored_ids=self._deleted_ids,
+                    clock=self._clock,
+                )
+            self._pending = None
+            self._snapshot = snapshot
+        logger.info(
+            "Loaded book snapshot with %d books, about %.1f MiB, in %.0f ms",
+            len(snapshot.ids),
+            snapshot.memory_bytes / (1024 * 1024),
+            (time.perf_counter() - start) * 1000,
+        )
+
+    @contextmanager
+    def _write(self) -> Iterator[None]:
+        with self._swap_lock:
+            self._writes_in_flight += 1
+        try:
+            yield
+        finally:
+            with self._swap_lock:
+                self._writes_in_flight -= 1
+                # A write started from here on cannot see a deleted book
+                if not self._writes_in_flight:
+                    self._deleted_ids.clear()
+
+    def _apply(
+        self,
+        upserted: Iterable[BookModel] = (),
+        deleted_ids: Iterable[int] = (),
+    ) -> None:
+        upserted = list(upserted)
+        deleted_ids = list(deleted_ids)
+        while True:
+            snapshot = self._snapshot
+            changed = snapshot
+            if snapshot is not None:
+                changed = snapshot.with_changes(
+                    upserted=upserted,
+                    deleted_ids=deleted_ids,
+                    ignored_ids=self._deleted_ids,
+                    clock=self._clock,
+                )
+            with self._swap_lock:
+                if self._snapshot is not snapshot:
+                    continue
+                if self._pending is not None:
+                    self._pending.append(
+                        (
+                            [
+                                book
+                                for book in upserted
+                                if book.id not in self._deleted_ids
+                            ],
+                            deleted_ids,
+                        )
+                    )
+                self._deleted_ids.update(deleted_ids)
+                self._snapshot = changed
+                return
+
+    def stats(self) -> Optional[BookSnapshotStatsModel]:
+        snapshot = self._snapshot
+        if snapshot is None:
+            return None
+        now = self._clock()
+        return BookSnapshotStatsModel(
+            books=len(snapshot.ids),
+            memory_bytes=snapshot.memory_bytes,
+            age_seconds=now - snapshot.loaded_at,
+            last_update_age_seconds=now - snapshot.updated_at,
+            updates=snapshot.updates,
+        )
+
+    def all_books(self) -> List[BookModel]:
+        snapshot = self._snapshot
+        if snapshot is None:
+            return self.book_repository.all_books()
+        return [snapshot.books[id] for id in snapshot.ids]
+
+    def books_page(
+        self,
+        after_id: Optional[int],
+        limit: int,
+        author: Optional[str] = None,
+        title_prefix: Optional[str] = None,
+        sort: BOOK_SORT = "id",
+        after_key: Optional[str] = None,
+    ) -> List[BookModel]:
+        snapshot = self._snapshot
+        if snapshot is None:
+            return self.book_repository.books_page(
+                after_id=after_id,
+                limit=limit,
+                author=author,
+                title_prefix=title_prefix,
+                sort=sort,
+                after_key=after_key,
+            )
+        return books_page_from_indexes(
+            snapshot.books,
+            snapshot.ids,
+            snapshot.titles,
+            snapshot.authors,
+            after_id=after_id,
+            limit=limit,
+            author=author,
+            title_prefix=title_prefix,
+            sort=sort,
+            after_key=after_key,
+        )
+
+    def iter_books(self, chunk_size: int) -> Iterator[BookModel]:
+        return self.book_repository.iter_books(chunk_size=chunk_size)
+
+    def search_books(self, query: str, limit: int, offset: int) -> List[BookModel]:
+        return self.book_repository.search_books(
+            query=query, limit=limit, offset=offset
+        )
+
+    def book(self, id: int) -> Optional[BookModel]:
+        snapshot = self._snapshot
+        if snapshot is None:
+            return self.book_repository.book(id=id)
+        return snapshot.books.get(id)
+
+    def books_by_ids(self, ids: List[int]) -> List[BookModel]:
+        snapshot = self._snapshot
+        if snapshot is None:
+            return self.book_repository.books_by_ids(ids=ids)
+        return [snapshot.books[id] for id in ids if id in snapshot.books]
+
+    def book_version(self, id: int) -> Optional[BookVersionModel]:
+        snapshot = self._snapshot
+        if snapshot is None:
+            return self.book_repository.book_version(id=id)
+        book = snapshot.books.get(id)
+        if book is None:
+            return None
+        return BookVersionModel(
+            id=book.id, version=book.version, updated_at=book.updated_at
+        )
+
+    def book_changes(self, since: int, limit: int) -> List[BookChangeModel]:
+        return self.book_repository.book_changes(since=since, limit=limit)
+
+    def create_book(
+        self,
+        title: str,
+        description: Optional[str],
+        author: str,
+    ) -> BookModel:
+        with self._write():
+            book = self.book_repository.create_book(
+                title=title, description=description, author=author
+            )
+            self._apply(upserted=[book])
+        return book
+
+    def create_books(self, books: List[NewBookModel]) -> List[BookModel]:
+        with self._write():
+            created_books = self.book_repository.create_books(books=books)
+            self._apply(upserted=created_books)
+        return created_books
+
+    def update_book(
+        self,
+        id: int,
+        title: Optional[str],
+        description: Optional[str],
+        author: Optional[str],
+    ) -> Optional[BookModel]:
+        with self._write():
+            updated_book = self.book_repository.update_book(
+                id=id, title=title, description=description, author=author
+            )
+            if updated_book is not None:
+                self._apply(upserted=[updated_book])
+        return updated_book
+
+    def delete_book(self, id: int) -> bool:
+        with self._write():
+            deleted = self.book_repository.delete_book(id=id)
+            if deleted:
+                self._apply(deleted_ids=[id])
+        return deleted
+
+
+def snapshot_metrics_collector(
+    snapshot_repository: SnapshotBookRepository,
+) -> Callable[[], List[str]]:
+    """Metrics registry collector reporting the size and age of the snapshot"""
+
+    def collect() -> List[str]:
+        stats = snapshot_repository.stats()
+        if stats is None:
+            return []
+        lines = []
+        for name, documentation, value in (
+            ("book_snapshot_books", "Books in the snapshot.", stats.books),
+            (
+                "book_snapshot_memory_bytes",
+                "Approximate memory held by the snapshot.",
+                stats.memory_bytes,
+            ),
+            (
+                "book_snapshot_age_seconds",
+                "Seconds since the snapshot was loaded.",
+                stats.age_seconds,
+            ),
+            (
+                "book_snapshot_last_update_age_seconds",
+                "Seconds since a write last changed the snapshot.",
+                stats.last_update_age_seconds,
+            ),
+        ):
+            gauge = Gauge(name, documentation)
+            gauge.set(value)
+            lines.extend(gauge.render())
+        return lines
+
+    return collect
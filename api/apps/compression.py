@@ -0,0 +1,33 @@
+"""
+Response compression.
+
+Routes that negotiate Content-Encoding themselves, such as the book list,
+which serves pages compressed ahead of time, are passed through untouched.
+They set Vary themselves, on 304 responses as well, and GZipMiddleware
+would add it a second time to the bodies it leaves uncompressed.
+"""
+
+from typing import Iterable
+
+from fastapi.middleware.gzip import GZipMiddleware
+from starlette.types import ASGIApp, Receive, Scope, Send
+
+
+class NegotiatedGZipMiddleware(GZipMiddleware):
+    def __init__(
+        self,
+        app: ASGIApp,
+        negotiated_paths: Iterable[str] = (),
+        minimum_size: int = 500,
+        compresslevel: int = 9,
+    ):
+        super().__init__(
+            app, minimum_size=minimum_size, compresslevel=compresslevel
+        )
+        self.negotiated_paths = frozenset(negotiated_paths)
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] == "http" and scope["path"] in self.negotiated_paths:
+            await self.app(scope, receive, send)
+            return
+        await super().__call__(scope, receive, send)
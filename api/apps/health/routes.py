@@ -0,0 +1,17 @@
+from fastapi import APIRouter, Request, Response, status
+
+router = APIRouter(prefix="/health", tags=["health"])
+
+
+@router.get("/live", include_in_schema=False)
+async def get_liveness():
+    return {"status": "ok"}
+
+
+@router.get("/ready", include_in_schema=False)
+async def get_readiness(request: Request, response: Response):
+    # Set by the lifespan once the database is initialized and warmed up
+    if not getattr(request.app.state, "ready", False):
+        response.status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+        return {"status": "unavailable"}
+    return {"status": "ready"}
@@ -0,0 +1,166 @@
+import time
+import uuid
+from typing import Optional
+
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from apps.metrics.registry import MetricsRegistry, get_metrics_registry
+from config.logging import bind_request_context, get_logger
+from config.settings import get_settings
+from db.tracing import collect_query_stats
+
+app_settings = get_settings()
+logger = get_logger("api.requests")
+
+UNMATCHED_ROUTE = "unmatched"
+REQUEST_ID_HEADER = b"x-request-id"
+MAX_REQUEST_ID_LENGTH = 128
+
+
+class MetricsMiddleware:
+    """
+    Records request counts, in-flight requests and latency per route
+    template, e.g. /api/v1/books/{book_id}, so raw paths never become labels.
+
+    Written as plain ASGI middleware rather than BaseHTTPMiddleware, which
+    would add a task and a memory stream to every request.
+    """
+
+    def __init__(self, app: ASGIApp, registry: Optional[MetricsRegistry] = None):
+        self.app = app
+        registry = registry or get_metrics_registry()
+        self.requests = registry.counter(
+            "http_requests_total",
+            "Total HTTP requests by method, route and status code.",
+            ("method", "route", "status"),
+        )
+        self.in_progress = registry.gauge(
+            "http_requests_in_progress",
+            "HTTP requests currently being served.",
+            ("method",),
+        )
+        self.latency = registry.histogram(
+            "http_request_duration_seconds",
+            "HTTP request latency by method and route.",
+            ("method", "route"),
+        )
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        method = scope["method"]
+        status_code = 500
+
+        async def send_with_status(message: Message) -> None:
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        self.in_progress.inc(method)
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            duration = time.perf_counter() - start
+            self.in_progress.dec(method)
+            # The router stores the matched route in the shared scope
+            route = scope.get("route")
+            route_path = getattr(route, "path", UNMATCHED_ROUTE)
+            self.requests.inc(method, route_path, str(status_code))
+            self.latency.observe(duration, method, route_path)
+
+
+class QueryStatsMiddleware:
+    """
+    Debug aid that reports how many SQL statements a request ran and how
+    long they took in X-DB-Query-Count and X-DB-Query-Time-Ms headers.
+    Statements run after the response has started, such as those of a
+    streamed export, are not included.
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        async def send_with_query_stats(message: Message) -> None:
+            if message["type"] == "http.response.start":
+                headers = list(message.get("headers", []))
+                headers.append((b"x-db-query-count", str(stats.count).encode()))
+                headers.append(
+                    (
+                        b"x-db-query-time-ms",
+                        f"{stats.total_seconds * 1000:.3f}".encode(),
+                    )
+                )
+                message = {**message, "headers": headers}
+            await send(message)
+
+        with collect_query_stats() as stats:
+            await self.app(scope, receive, send_with_query_stats)
+
+
+def _request_id(scope: Scope) -> str:
+    for name, value in scope["headers"]:
+        if name == REQUEST_ID_HEADER:
+            request_id = value.decode("latin-1")
+            if (
+                len(request_id) <= MAX_REQUEST_ID_LENGTH
+                and request_id.isprintable()
+            ):
+                return request_id
+            break
+    return uuid.uuid4().hex
+
+
+class RequestLoggingMiddleware:
+    """
+    Tags every log record emitted while serving a request with its request
+    id, taken from X-Request-ID or generated, and its route. The id is echoed
+    back in X-Request-ID. With log_requests, each request is also logged
+    once it completes, with its status and duration.
+    """
+
+    def __init__(self, app: ASGIApp, log_requests: Optional[bool] = None):
+        self.app = app
+        self.log_requests = (
+            app_settings.log_requests if log_requests is None else log_requests
+        )
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        request_id = _request_id(scope)
+        status_code = 500
+
+        async def send_with_request_id(message: Message) -> None:
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+                headers = list(message.get("headers", []))
+                headers.append((REQUEST_ID_HEADER, request_id.encode("latin-1")))
+                message = {**message, "headers": headers}
+            await send(message)
+
+        start = time.perf_counter()
+        with bind_request_context(request_id, scope):
+            try:
+                await self.app(scope, receive, send_with_request_id)
+            finally:
+                if self.log_requests:
+                    duration_ms = (time.perf_counter() - start) * 1000
+                    logger.info(
+                        "%s %s %d",
+                        scope["method"],
+                        scope["path"],
+                        status_code,
+                        extra={"duration_ms": round(duration_ms, 3)},
+                    )
@@ -0,0 +1,268 @@
+"""
+In-process metrics rendered in the Prometheus text exposition format.
+
+Metrics are plain dictionaries keyed by label values and guarded by a lock
+each, so recording a sample costs a few dictionary operations and no
+external service is needed to scrape them.
+"""
+
+import bisect
+import math
+import threading
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+LabelValues = Tuple[str, ...]
+
+DEFAULT_LATENCY_BUCKETS = (
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+)
+
+
+def _format_value(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+def _escape_label_value(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str]) -> str:
+    if not names:
+        return ""
+    pairs = ",".join(
+        f'{name}="{_escape_label_value(value)}"'
+        for name, value in zip(names, values)
+    )
+    return "{" + pairs + "}"
+
+
+class _Metric:
+    type_name = "untyped"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        label_names: Sequence[str] = (),
+    ):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(label_names)
+        self._lock = threading.Lock()
+
+    def _check_labels(self, label_values: LabelValues) -> None:
+        if len(label_values) != len(self.label_names):
+            raise ValueError(
+                f"{self.name} expects labels {self.label_names}, "
+                f"got {label_values}"
+            )
+
+    def _sample_lines(self) -> List[str]:
+        raise NotImplementedError
+
+    def render(self) -> List[str]:
+        return [
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} {self.type_name}",
+            *self._sample_lines(),
+        ]
+
+
+class Counter(_Metric):
+    type_name = "counter"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        label_names: Sequence[str] = (),
+    ):
+        super().__init__(name, documentation, label_names)
+        self._values: Dict[LabelValues, float] = {}
+
+    def inc(self, *label_values: str, amount: float = 1.0) -> None:
+        self._check_labels(label_values)
+        with self._lock:
+            self._values[label_values] = (
+                self._values.get(label_values, 0.0) + amount
+            )
+
+    def value(self, *label_values: str) -> float:
+        with self._lock:
+            return self._values.get(label_values, 0.0)
+
+    def _sample_lines(self) -> List[str]:
+        with self._lock:
+            values = sorted(self._values.items())
+        return [
+            f"{self.name}{_format_labels(self.label_names, labels)} "
+            f"{_format_value(value)}"
+            for labels, value in values
+        ]
+
+
+class Gauge(Counter):
+    type_name = "gauge"
+
+    def dec(self, *label_values: str, amount: float = 1.0) -> None:
+        self.inc(*label_values, amount=-amount)
+
+    def set(self, value: float, *label_values: str) -> None:
+        self._check_labels(label_values)
+        with self._lock:
+            self._values[label_values] = value
+
+
+class Histogram(_Metric):
+    type_name = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        label_names: Sequence[str] = (),
+        buckets: Sequence[float] = DEFAULT_LATENCY_BUCKETS,
+    ):
+        super().__init__(name, documentation, label_names)
+        self.buckets = tuple(sorted(buckets))
+        # Per label values: count per bucket (plus +Inf), sum, count
+        self._values: Dict[LabelValues, Tuple[List[int], List[float]]] = {}
+
+    def observe(self, value: float, *label_values: str) -> None:
+        self._check_labels(label_values)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._values.get(label_values)
+            if series is None:
+                series = ([0] * (len(self.buckets) + 1), [0.0, 0.0])
+                self._values[label_values] = series
+            bucket_counts, totals = series
+            bucket_counts[index] += 1
+            totals[0] += value
+            totals[1] += 1
+
+    def count(self, *label_values: str) -> int:
+        with self._lock:
+            series = self._values.get(label_values)
+            return 0 if series is None else int(series[1][1])
+
+    def _sample_lines(self) -> List[str]:
+        with self._lock:
+            values = sorted(
+                (labels, (list(counts), list(totals)))
+                for labels, (counts, totals) in self._values.items()
+            )
+        bucket_label_names = self.label_names + ("le",)
+        lines = []
+        for labels, (bucket_counts, totals) in values:
+            cumulative = 0
+            bounds = self.buckets + (math.inf,)
+            for bound, bucket_count in zip(bounds, bucket_counts):
+                cumulative += bucket_count
+                bucket_labels = _format_labels(
+                    bucket_label_names,
+                    labels + (_format_value(bound),),
+                )
+                lines.append(f"{self.name}_bucket{bucket_labels} {cumulative}")
+            formatted_labels = _format_labels(self.label_names, labels)
+            lines.append(
+                f"{self.name}_sum{formatted_labels} {_format_value(totals[0])}"
+            )
+            lines.append(
+                f"{self.name}_count{formatted_labels} {_format_value(totals[1])}"
+            )
+        return lines
+
+
+class MetricsRegistry:
+    """
+    Named metrics plus collectors that produce extra exposition lines, such
+    as gauges read from another component, when the registry is rendered.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._metrics: Dict[str, _Metric] = {}
+        self._collectors: List[Callable[[], List[str]]] = []
+
+    def _get_or_create(self, metric_type: type, name: str, *args, **kwargs):
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = metric_type(name, *args, **kwargs)
+                self._metrics[name] = metric
+            elif type(metric) is not metric_type:
+                raise ValueError(
+                    f"{name} is already registered as a {metric.type_name}"
+                )
+            return metric
+
+    def counter(
+        self,
+        name: str,
+        documentation: str,
+        label_names: Sequence[str] = (),
+    ) -> Counter:
+        return self._get_or_create(Counter, name, documentation, label_names)
+
+    def gauge(
+        self,
+        name: str,
+        documentation: str,
+        label_names: Sequence[str] = (),
+    ) -> Gauge:
+        return self._get_or_create(Gauge, name, documentation, label_names)
+
+    def histogram(
+        self,
+        name: str,
+        documentation: str,
+        label_names: Sequence[str] = (),
+        buckets: Sequence[float] = DEFAULT_LATENCY_BUCKETS,
+    ) -> Histogram:
+        return self._get_or_create(
+            Histogram, name, documentation, label_names, buckets
+        )
+
+    def register_collector(self, collector: Callable[[], List[str]]) -> None:
+        with self._lock:
+            self._collectors.append(collector)
+
+    def render(self) -> str:
+        with self._lock:
+            metrics = list(self._metrics.values())
+            collectors = list(self._collectors)
+        lines: List[str] = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        for collector in collectors:
+            lines.extend(collector())
+        return "\n".join(lines) + "\n"
+
+
+_registry: Optional[MetricsRegistry] = None
+_registry_lock = threading.Lock()
+
+
+def get_metrics_registry() -> MetricsRegistry:
+    global _registry
+    with _registry_lock:
+        if _registry is None:
+            _registry = MetricsRegistry()
+        return _registry
@@ -0,0 +1,15 @@
+from fastapi import APIRouter, Response
+
+from apps.metrics.registry import get_metrics_registry
+
+PROMETHEUS_MEDIA_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+router = APIRouter(tags=["metrics"])
+
+
+@router.get("/metrics", include_in_schema=False)
+async def get_metrics():
+    return Response(
+        content=get_metrics_registry().render(),
+        media_type=PROMETHEUS_MEDIA_TYPE,
+    )
@@ -5,3 +5,6 @@ from apps.books.routes import router as books_router
 api_v1_router = APIRouter(prefix="/api/v1")
 
 api_v1_router.include_router(books_router)
+
+# Served compressed ahead of time, see apps.compression
+BOOKS_LIST_PATH = f"{api_v1_router.prefix}{books_router.prefix}/"
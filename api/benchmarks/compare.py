@@ -0,0 +1,63 @@
+"""
+Compare two benchmark result files and flag throughput regressions.
+
+    uv run python -m benchmarks.compare before.json after.json --threshold 10
+"""
+
+import argparse
+import json
+import sys
+from typing import Dict, Tuple
+
+from benchmarks.timing import BenchmarkResult
+
+
+def _load(path: str) -> Dict[Tuple[str, int], BenchmarkResult]:
+    with open(path) as results_file:
+        report = json.load(results_file)
+    results = (BenchmarkResult(**result) for result in report["results"])
+    return {(result.name, result.size): result for result in results}
+
+
+def _change(before: float, after: float) -> float:
+    return (after - before) / before * 100 if before else 0.0
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("baseline")
+    parser.add_argument("candidate")
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=10.0,
+        help="Percentage drop in ops/sec reported as a regression",
+    )
+    args = parser.parse_args()
+
+    baseline = _load(args.baseline)
+    candidate = _load(args.candidate)
+    regressions = []
+    print(f"{'benchmark':<40} {'size':>9} {'ops/s':>10} {'p50':>9} {'p99':>9}")
+    for key in sorted(baseline.keys() & candidate.keys()):
+        before, after = baseline[key], candidate[key]
+        ops_change = _change(before.ops_per_sec, after.ops_per_sec)
+        print(
+            f"{key[0]:<40} {key[1]:>9} "
+            f"{ops_change:>+9.1f}% "
+            f"{_change(before.p50_ms, after.p50_ms):>+8.1f}% "
+            f"{_change(before.p99_ms, after.p99_ms):>+8.1f}%"
+        )
+        if ops_change < -args.threshold:
+            regressions.append(key)
+
+    for name, size in sorted(baseline.keys() ^ candidate.keys()):
+        print(f"{name:<40} {size:>9}  only in one of the runs")
+
+    if regressions:
+        print(f"{len(regressions)} benchmark(s) regressed by more than {args.threshold}%")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
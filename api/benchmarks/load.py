@@ -0,0 +1,255 @@
+"""
+Load test serve.py with different worker counts against the same seeded
+SQLite database and report throughput and latency for each.
+
+    uv run python -m benchmarks.load --workers 1 2 4 --size 100000
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import multiprocessing
+import os
+import random
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from typing import List, Tuple
+
+import httpx
+
+from benchmarks.seed import seed_database
+from benchmarks.timing import BenchmarkResult, summarize
+from db.pool import close_connection_pools
+
+READY_TIMEOUT_SECONDS = 60
+
+# One line per request would swamp the results
+logging.getLogger("httpx").setLevel(logging.WARNING)
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+async def _client_load(
+    base_url: str,
+    size: int,
+    concurrency: int,
+    duration: float,
+    write_ratio: float,
+    seed: int,
+) -> Tuple[List[float], int]:
+    samples: List[float] = []
+    errors = 0
+    deadline = time.perf_counter() + duration
+    book_data = {"title": "Title", "description": "Description", "author": "Author"}
+
+    async with httpx.AsyncClient(
+        base_url=base_url,
+        limits=httpx.Limits(max_connections=concurrency),
+        timeout=30,
+    ) as client:
+
+        async def user(generator: random.Random) -> None:
+            nonlocal errors
+            while time.perf_counter() < deadline:
+                roll = generator.random()
+                start = time.perf_counter()
+                if roll < write_ratio:
+                    response = await client.post("/api/v1/books/", json=book_data)
+                elif roll < 0.8:
+                    book_id = generator.randrange(1, size + 1)
+                    response = await client.get(f"/api/v1/books/{book_id}")
+                else:
+                    author = f"author%20{generator.randrange(1000)}"
+                    response = await client.get(
+                        f"/api/v1/books/?limit=20&author={author}"
+                    )
+                samples.append(time.perf_counter() - start)
+                if response.status_code >= 400:
+                    errors += 1
+
+        await asyncio.gather(
+            *(user(random.Random(seed * 1000 + n)) for n in range(concurrency))
+        )
+    return samples, errors
+
+
+def _client(arguments: Tuple) -> Tuple[List[float], int]:
+    return asyncio.run(_client_load(*arguments))
+
+
+def _start_server(db_path: str, workers: int, port: int) -> subprocess.Popen:
+    env = {
+        **os.environ,
+        "DB_URL": db_path,
+        "SERVER_WORKERS": str(workers),
+        "SERVER_PORT": str(port),
+        "SERVER_HOST": "127.0.0.1",
+        "LOG_LEVEL": "WARNING",
+    }
+    server = subprocess.Popen(
+        [sys.executable, "serve.py"],
+        env=env,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    deadline = time.monotonic() + READY_TIMEOUT_SECONDS
+    while time.monotonic() < deadline:
+        if server.poll() is not None:
+            raise RuntimeError(f"serve.py exited with {server.returncode}")
+        try:
+            response = httpx.get(f"http://127.0.0.1:{port}/health/ready")
+            if response.status_code == 200:
+                return server
+        except httpx.TransportError:
+            pass
+        time.sleep(0.1)
+    server.terminate()
+    raise RuntimeError("serve.py did not become ready in time")
+
+
+def _run_load(
+    base_url: str,
+    size: int,
+    clients: int,
+    concurrency: int,
+    duration: float,
+    write_ratio: float,
+) -> Tuple[List[float], int]:
+    arguments = [
+        (base_url, size, concurrency, duration, write_ratio, seed)
+        for seed in range(clients)
+    ]
+    with multiprocessing.get_context("spawn").Pool(clients) as pool:
+        outcomes = pool.map(_client, arguments)
+    samples = [sample for client_samples, _ in outcomes for sample in client_samples]
+    return samples, sum(errors for _, errors in outcomes)
+
+
+def run(
+    worker_counts: List[int],
+    size: int,
+    clients: int,
+    concurrency: int,
+    duration: float,
+    warmup: float,
+    write_ratio: float,
+    data_dir: str,
+) -> List[BenchmarkResult]:
+    seeded_path = os.path.join(data_dir, f"books-{size}.db")
+    seed_database(seeded_path, size)
+    close_connection_pools()
+
+    results = []
+    for workers in worker_counts:
+        work_dir = tempfile.mkdtemp()
+        db_path = os.path.join(work_dir, "books.db")
+        shutil.copyfile(seeded_path, db_path)
+        port = _free_port()
+        server = _start_server(db_path, workers, port)
+        try:
+            base_url = f"http://127.0.0.1:{port}"
+            # Lets every worker finish starting and fill its page cache
+            _run_load(base_url, size, clients, concurrency, warmup, write_ratio)
+            start = time.perf_counter()
+            samples, errors = _run_load(
+                base_url, size, clients, concurrency, duration, write_ratio
+            )
+            elapsed = time.perf_counter() - start
+        finally:
+            server.terminate()
+            server.wait()
+            shutil.rmtree(work_dir)
+
+        if errors:
+            print(f"{workers} workers: {errors} requests failed", file=sys.stderr)
+        result = summarize(f"load.workers_{workers}", size, samples)
+        results.append(
+            result.model_copy(update={"ops_per_sec": len(samples) / elapsed})
+        )
+    return results
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--size", type=int, default=100_000)
+    parser.add_argument(
+        "--clients",
+        type=int,
+        default=os.cpu_count() or 1,
+        help="Load generating processes",
+    )
+    parser.add_argument(
+        "--concurrency", type=int, default=32, help="Requests in flight per client"
+    )
+    parser.add_argument("--duration", type=float, default=10.0)
+    parser.add_argument("--warmup", type=float, default=2.0)
+    parser.add_argument(
+        "--write-ratio",
+        type=float,
+        default=0.0,
+        help="Share of requests that create a book; writes do not scale with workers",
+    )
+    parser.add_argument("--data-dir", default="benchmarks/.data")
+    parser.add_argument("--output")
+    args = parser.parse_args()
+
+    cores = os.cpu_count() or 1
+    if cores < max(args.workers) + args.clients:
+        print(
+            f"Only {cores} cores for up to {max(args.workers)} workers and "
+            f"{args.clients} load generating clients, these results cannot "
+            "show how throughput scales with workers",
+            file=sys.stderr,
+        )
+
+    results = run(
+        args.workers,
+        args.size,
+        args.clients,
+        args.concurrency,
+        args.duration,
+        args.warmup,
+        args.write_ratio,
+        args.data_dir,
+    )
+    for result in results:
+        print(
+            f"{result.name:<20} {result.ops_per_sec:>10.0f} req/s  "
+            f"p50 {result.p50_ms:8.3f}ms  "
+            f"p95 {result.p95_ms:8.3f}ms  "
+            f"p99 {result.p99_ms:8.3f}ms"
+        )
+
+    if args.output:
+        os.makedirs(os.path.dirname(args.output) or ".", exist_ok=True)
+        with open(args.output, "w") as output:
+            json.dump(
+                {
+                    "metadata": {
+                        "created_at": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+                        "cpu_count": os.cpu_count(),
+                        "clients": args.clients,
+                        "concurrency": args.concurrency,
+                        "duration": args.duration,
+                        "write_ratio": args.write_ratio,
+                    },
+                    "results": [result.model_dump() for result in results],
+                },
+                output,
+                indent=2,
+            )
+        print(f"Saved results to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,250 @@
+"""
+Benchmark the repository, service and HTTP layers against seeded SQLite
+databases and save the results as JSON.
+
+    uv run python -m benchmarks.run --sizes 1000 100000 --output before.json
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import shutil
+import sqlite3
+import subprocess
+import tempfile
+import time
+from typing import List, Optional
+
+import httpx
+
+from apps.books.page_cache import BookPageCache
+from apps.books.repositories import SQLiteBookRepository
+from apps.books.routes import new_book_service
+from apps.books.services import BookService
+from benchmarks.seed import seed_database
+from benchmarks.timing import BenchmarkResult, measure, measure_async
+from db.pool import close_connection_pools
+from main import app
+
+LAYERS = ("repository", "service", "http")
+
+
+def _random_ids(size: int, count: int, seed: int = 7) -> List[int]:
+    generator = random.Random(seed)
+    return [generator.randrange(1, size + 1) for _ in range(count)]
+
+
+def run_repository_benchmarks(
+    db_path: str, size: int, iterations: int, warmup: int
+) -> List[BenchmarkResult]:
+    repository = SQLiteBookRepository(db_path=db_path)
+    ids = _random_ids(size, iterations + warmup)
+
+    def bench(name, fn):
+        return measure(f"repository.{name}", size, fn, iterations, warmup)
+
+    return [
+        bench("book", lambda i: repository.book(ids[i])),
+        bench("book_version", lambda i: repository.book_version(ids[i])),
+        bench("books_page", lambda i: repository.books_page(None, 100)),
+        bench(
+            "books_page_after_id",
+            lambda i: repository.books_page(ids[i], 100),
+        ),
+        bench(
+            "books_page_by_author",
+            lambda i: repository.books_page(None, 100, author=f"author {i % 100}"),
+        ),
+        bench(
+            "books_page_by_title",
+            lambda i: repository.books_page(ids[i], 100, sort="title"),
+        ),
+        bench(
+            "search_books",
+            lambda i: repository.search_books("dragon winter", 20, 0),
+        ),
+        bench(
+            "create_book",
+            lambda i: repository.create_book("Title", "Description", "Author"),
+        ),
+        bench(
+            "update_book",
+            lambda i: repository.update_book(ids[i], f"Title {i}", None, None),
+        ),
+    ]
+
+
+def run_service_benchmarks(
+    db_path: str, size: int, iterations: int, warmup: int
+) -> List[BenchmarkResult]:
+    service = BookService(book_repository=SQLiteBookRepository(db_path=db_path))
+    ids = _random_ids(size, iterations + warmup)
+
+    def bench(name, fn):
+        return measure(f"service.{name}", size, fn, iterations, warmup)
+
+    return [
+        bench("book", lambda i: service.book(id=ids[i])),
+        bench("books_page", lambda i: service.books_page(after_id=None, limit=100)),
+        bench(
+            "search_books",
+            lambda i: service.search_books(query="dragon winter", limit=20, offset=0),
+        ),
+        bench(
+            "new_book",
+            lambda i: service.new_book(title="Title", description=None, author="Author"),
+        ),
+    ]
+
+
+async def run_http_benchmarks(
+    db_path: str, size: int, iterations: int, warmup: int
+) -> List[BenchmarkResult]:
+    app.dependency_overrides[new_book_service] = lambda: BookService(
+        book_repository=SQLiteBookRepository(db_path=db_path)
+    )
+    ids = _random_ids(size, iterations + warmup)
+    transport = httpx.ASGITransport(app=app)
+    book_data = {"title": "Title", "description": "Description", "author": "Author"}
+
+    try:
+        async with httpx.AsyncClient(
+            transport=transport, base_url="http://benchmark"
+        ) as client:
+
+            async def bench(name, fn):
+                return await measure_async(
+                    f"http.{name}", size, fn, iterations, warmup
+                )
+
+            results = [
+                await bench(
+                    "get_book", lambda i: client.get(f"/api/v1/books/{ids[i]}")
+                ),
+                await bench(
+                    "get_books", lambda i: client.get("/api/v1/books/?limit=100")
+                ),
+                await bench(
+                    "get_books_by_author",
+                    lambda i: client.get(
+                        f"/api/v1/books/?limit=100&author=author%20{i % 100}"
+                    ),
+                ),
+                await bench(
+                    "search_books",
+                    lambda i: client.get("/api/v1/books/search?q=dragon+winter&limit=20"),
+                ),
+                await bench(
+                    "create_book",
+                    lambda i: client.post("/api/v1/books/", json=book_data),
+                ),
+            ]
+
+            page_cache = BookPageCache(max_entries=100)
+            app.dependency_overrides[new_book_service] = lambda: BookService(
+                book_repository=SQLiteBookRepository(db_path=db_path),
+                page_cache=page_cache,
+            )
+            gzip_headers = {"Accept-Encoding": "gzip"}
+            results += [
+                await bench(
+                    "get_books_cached_gzip",
+                    lambda i: client.get(
+                        "/api/v1/books/?limit=100", headers=gzip_headers
+                    ),
+                ),
+            ]
+            return results
+    finally:
+        app.dependency_overrides.clear()
+
+
+def _git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(
+    sizes: List[int],
+    layers: List[str],
+    iterations: int,
+    warmup: int,
+    data_dir: str,
+) -> List[BenchmarkResult]:
+    results = []
+    for size in sizes:
+        seeded_path = os.path.join(data_dir, f"books-{size}.db")
+        seed_database(seeded_path, size)
+        close_connection_pools()
+
+        # Writes must not leak into the seeded database between runs
+        work_dir = tempfile.mkdtemp()
+        db_path = os.path.join(work_dir, "books.db")
+        shutil.copyfile(seeded_path, db_path)
+        try:
+            if "repository" in layers:
+                results += run_repository_benchmarks(db_path, size, iterations, warmup)
+            if "service" in layers:
+                results += run_service_benchmarks(db_path, size, iterations, warmup)
+            if "http" in layers:
+                results += asyncio.run(
+                    run_http_benchmarks(db_path, size, iterations, warmup)
+                )
+        finally:
+            close_connection_pools()
+            shutil.rmtree(work_dir)
+    return results
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000])
+    parser.add_argument("--layers", nargs="+", choices=LAYERS, default=list(LAYERS))
+    parser.add_argument("--iterations", type=int, default=500)
+    parser.add_argument("--warmup", type=int, default=50)
+    parser.add_argument("--data-dir", default="benchmarks/.data")
+    parser.add_argument(
+        "--output",
+        default=f"benchmarks/results/{time.strftime('%Y%m%d-%H%M%S')}.json",
+    )
+    args = parser.parse_args()
+
+    results = run(args.sizes, args.layers, args.iterations, args.warmup, args.data_dir)
+    for result in results:
+        print(
+            f"{result.name:<40} {result.size:>9} "
+            f"{result.ops_per_sec:>10.0f} ops/s  "
+            f"p50 {result.p50_ms:8.3f}ms  "
+            f"p95 {result.p95_ms:8.3f}ms  "
+            f"p99 {result.p99_ms:8.3f}ms"
+        )
+
+    report = {
+        "metadata": {
+            "created_at": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            "git_commit": _git_commit(),
+            "python": platform.python_version(),
+            "sqlite": sqlite3.sqlite_version,
+            "iterations": args.iterations,
+            "warmup": args.warmup,
+        },
+        "results": [result.model_dump() for result in results],
+    }
+    os.makedirs(os.path.dirname(args.output) or ".", exist_ok=True)
+    with open(args.output, "w") as output:
+        json.dump(report, output, indent=2)
+    print(f"Saved results to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
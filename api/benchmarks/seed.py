@@ -0,0 +1,50 @@
+import os
+import random
+from typing import Iterator, Tuple
+
+from db.pool import get_connection_pool
+from db.setup import init_db
+
+AUTHORS = 1000
+WORDS = (
+    "dragon river empire shadow garden winter machine ocean silent crown "
+    "forest letter night harbor glass iron storm mirror paper stone"
+).split()
+
+
+def _books(size: int, seed: int) -> Iterator[Tuple[str, str, str, float]]:
+    generator = random.Random(seed)
+    for _ in range(size):
+        title = " ".join(generator.choices(WORDS, k=3)).title()
+        description = " ".join(generator.choices(WORDS, k=20))
+        author = f"Author {generator.randrange(AUTHORS)}"
+        yield title, description, author, 0.0
+
+
+def seed_database(
+    db_path: str,
+    size: int,
+    chunk_size: int = 10_000,
+    seed: int = 42,
+) -> None:
+    """Create db_path with size deterministic books, skipping if present"""
+    if os.path.exists(db_path):
+        return
+
+    os.makedirs(os.path.dirname(db_path) or ".", exist_ok=True)
+    init_db(db_path)
+    pool = get_connection_pool(db_path)
+    books = _books(size, seed)
+    insert_query = (
+        "INSERT INTO books (title, description, author, updated_at) "
+        "VALUES (?, ?, ?, ?)"
+    )
+    remaining = size
+    while remaining > 0:
+        chunk = [next(books) for _ in range(min(chunk_size, remaining))]
+        with pool.writer() as connection:
+            connection.executemany(insert_query, chunk)
+        remaining -= len(chunk)
+
+    with pool.writer() as connection:
+        connection.execute("ANALYZE")
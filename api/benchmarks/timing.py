@@ -0,0 +1,74 @@
+import statistics
+import time
+from typing import Awaitable, Callable, List
+
+from pydantic import BaseModel
+
+
+class BenchmarkResult(BaseModel):
+    name: str
+    size: int
+    iterations: int
+    ops_per_sec: float
+    mean_ms: float
+    p50_ms: float
+    p95_ms: float
+    p99_ms: float
+
+
+def _percentile(sorted_samples: List[float], percentile: float) -> float:
+    index = round(percentile / 100 * (len(sorted_samples) - 1))
+    return sorted_samples[index]
+
+
+def summarize(name: str, size: int, samples: List[float]) -> BenchmarkResult:
+    """Turn per-call durations in seconds into throughput and latency figures"""
+    sorted_samples = sorted(samples)
+    total = sum(samples)
+    return BenchmarkResult(
+        name=name,
+        size=size,
+        iterations=len(samples),
+        ops_per_sec=len(samples) / total if total else 0.0,
+        mean_ms=statistics.fmean(samples) * 1000,
+        p50_ms=_percentile(sorted_samples, 50) * 1000,
+        p95_ms=_percentile(sorted_samples, 95) * 1000,
+        p99_ms=_percentile(sorted_samples, 99) * 1000,
+    )
+
+
+def measure(
+    name: str,
+    size: int,
+    fn: Callable[[int], object],
+    iterations: int,
+    warmup: int,
+) -> BenchmarkResult:
+    """Call fn(iteration) repeatedly and time every call individually"""
+    for iteration in range(warmup):
+        fn(iteration)
+
+    samples = []
+    for iteration in range(iterations):
+        start = time.perf_counter()
+        fn(iteration)
+        samples.append(time.perf_counter() - start)
+    return summarize(name, size, samples)
+
+
+async def measure_async(
+    name: str,
+    size: int,
+    fn: Callable[[int], Awaitable[object]],
+    iterations: int,
+    warmup: int,
+) -> BenchmarkResult:
+    for iteration in range(warmup):
+        await fn(iteration)
+
+    samples = []
+    for iteration in range(iterations):
+        start = time.perf_counter()
+        await fn(iteration)
+        samples.append(time.perf_counter() - start)
+    return summarize(name, size, samples)
@@ -1,27 +1,156 @@
+"""
+Application logging.
+
+Log calls only put records on an in-memory queue. A QueueListener thread
+formats them and writes them to the file or stream, so slow log I/O never
+blocks a request. Records are tagged with the current request's id and
+route on the calling thread, before they are queued.
+"""
+
+import atexit
+import copy
+import json
 import logging
+import queue
+import sys
+from contextlib import contextmanager
+from contextvars import ContextVar
+from logging.handlers import QueueHandler, QueueListener
+from typing import Any, Dict, Iterator, MutableMapping, Optional
 
 from config.settings import get_settings
 
 app_settings = get_settings()
 _is_logging_configured = False
+_listener: Optional[QueueListener] = None
+
+_TEXT_FORMAT = "%(asctime)s - %(name)s - %(levelname)s - %(message)s"
+_DATE_FORMAT = "%Y-%m-%d %H:%M:%S"
+_exception_formatter = logging.Formatter()
+
+CONTEXT_FIELDS = ("request_id", "route", "duration_ms")
+
+
+class RequestLogContext:
+    """Identifies the request a log record was emitted from"""
+
+    __slots__ = ("request_id", "scope")
+
+    def __init__(self, request_id: str, scope: MutableMapping[str, Any]):
+        self.request_id = request_id
+        self.scope = scope
+
+    @property
+    def route(self) -> Optional[str]:
+        # Set by the router once the request has been matched
+        return getattr(self.scope.get("route"), "path", None)
+
+
+_request_context: ContextVar[Optional[RequestLogContext]] = ContextVar(
+    "request_log_context", default=None
+)
+
+
+@contextmanager
+def bind_request_context(
+    request_id: str,
+    scope: MutableMapping[str, Any],
+) -> Iterator[RequestLogContext]:
+    context = RequestLogContext(request_id, scope)
+    token = _request_context.set(context)
+    try:
+        yield context
+    finally:
+        _request_context.reset(token)
+
+
+class JSONFormatter(logging.Formatter):
+    """One JSON object per line, including the request context fields"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry: Dict[str, Any] = {
+            "timestamp": self.formatTime(record, self.datefmt),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        for field in CONTEXT_FIELDS:
+            value = getattr(record, field, None)
+            if value is not None:
+                entry[field] = value
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry["exception"] = record.exc_text
+        if record.stack_info:
+            entry["stack"] = self.formatStack(record.stack_info)
+        return json.dumps(entry, default=str)
+
+
+class ContextQueueHandler(QueueHandler):
+    """
+    Queues records for the listener thread after resolving everything that
+    depends on the calling thread: the message arguments, the exception and
+    the request context. Formatting is left to the listener's handler.
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            if not record.exc_text:
+                record.exc_text = _exception_formatter.formatException(
+                    record.exc_info
+                )
+            record.exc_info = None
+
+        context = _request_context.get()
+        if context is not None:
+            if getattr(record, "request_id", None) is None:
+                record.request_id = context.request_id
+            if getattr(record, "route", None) is None:
+                record.route = context.route
+        return record
+
+
+def _build_formatter() -> logging.Formatter:
+    if app_settings.log_format == "json":
+        return JSONFormatter(datefmt=_DATE_FORMAT)
+    return logging.Formatter(_TEXT_FORMAT, datefmt=_DATE_FORMAT)
+
+
+def _build_handler() -> logging.Handler:
+    if app_settings.log_path:
+        handler: logging.Handler = logging.FileHandler(app_settings.log_path)
+    else:
+        handler = logging.StreamHandler(sys.stderr)
+    handler.setFormatter(_build_formatter())
+    return handler
+
 
 def _configure_logging():
-    global _is_logging_configured
-    log_config = {
-        "level": app_settings.log_level,
-        "filepath": app_settings.log_path,
-        "format": "%(asctime)s - %(name)s - %(levelname)s - %(message)s",
-        "datefmt": "%Y-%m-%d %H:%M:%S",
-    }
+    global _is_logging_configured, _listener
     if not _is_logging_configured:
-        logging.basicConfig(
-            filename=log_config["filepath"],
-            level=log_config["level"],
-            format=log_config["format"],
-            datefmt=log_config["datefmt"],
-        )
+        log_queue: queue.SimpleQueue = queue.SimpleQueue()
+        _listener = QueueListener(log_queue, _build_handler())
+        _listener.start()
+        atexit.register(stop_logging)
+
+        root_logger = logging.getLogger()
+        root_logger.addHandler(ContextQueueHandler(log_queue))
+        root_logger.setLevel(app_settings.log_level)
         _is_logging_configured = True
 
+
+def stop_logging() -> None:
+    """Write out every queued record and stop the listener thread"""
+    global _listener
+    listener, _listener = _listener, None
+    if listener is not None:
+        listener.stop()
+
+
 def get_logger(name: str) -> logging.Logger:
     _configure_logging()
     logger = logging.getLogger(name)
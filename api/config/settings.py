@@ -4,15 +4,59 @@ from typing import Literal, Optional
 
 DEVELOPMENT_ENVIRONMENT = Literal["DEV", "PROD"]
 LOG_LEVEL = Literal["DEBUG", "INFO", "WARNING", "ERROR"]
+LOG_FORMAT = Literal["text", "json"]
+DB_JOURNAL_MODE = Literal["WAL", "DELETE", "TRUNCATE", "PERSIST", "MEMORY"]
+DB_SYNCHRONOUS = Literal["OFF", "NORMAL", "FULL", "EXTRA"]
 
 
 class Settings(BaseSettings):
     app_secret_key: str
     db_url: str = "db/dev.db"
+    db_journal_mode: DB_JOURNAL_MODE = "WAL"
+    db_synchronous: DB_SYNCHRONOUS = "NORMAL"
+    db_mmap_size: int = 256 * 1024 * 1024
+    db_cache_size: int = -64 * 1024  # Negative values are KiB, not pages
+    db_busy_timeout_ms: int = 5000
+    db_executor_workers: int = 8
+    db_init_on_startup: bool = True
+    db_migration_batch_size: int = 10000
+    db_query_tracing: bool = False
+    db_slow_query_ms: float = 100.0
+    db_query_stats_header: bool = False
+    books_page_default_limit: int = 100
+    books_page_max_limit: int = 1000
+    books_export_chunk_size: int = 1000
+    books_import_chunk_size: int = 50000
+    books_bulk_max_items: int = 1000
+    books_lookup_max_ids: int = 1000
+    book_cache_enabled: bool = False
+    book_cache_max_entries: int = 10000
+    book_cache_ttl_seconds: float = 60.0
+    book_snapshot_enabled: bool = False
+    book_list_cache_enabled: bool = False
+    book_list_cache_max_entries: int = 1000
+    book_write_batch_enabled: bool = True
+    book_write_batch_max_size: int = 64
+    book_write_batch_max_wait_ms: float = 0.0
+    metrics_enabled: bool = True
+    admission_enabled: bool = True
+    admission_read_limit: int = 64
+    admission_read_queue_depth: int = 256
+    admission_write_limit: int = 16
+    admission_write_queue_depth: int = 128
+    admission_queue_timeout_ms: float = 2000.0
+    admission_retry_after_seconds: int = 1
+    response_gzip_enabled: bool = True
+    response_gzip_min_size: int = 1000
+    response_gzip_level: int = 6
     server_port: str
+    server_host: str = "0.0.0.0"
+    server_workers: int = 1
     environment: DEVELOPMENT_ENVIRONMENT = "DEV"
     log_level: LOG_LEVEL = "INFO"
     log_path: Optional[str] = None
+    log_format: LOG_FORMAT = "text"
+    log_requests: bool = False
 
     model_config = SettingsConfigDict(env_file=".env")
 
@@ -0,0 +1,92 @@
+import asyncio
+import contextvars
+import functools
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import AsyncIterator, Callable, Iterator, Optional, TypeVar
+
+from config.settings import get_settings
+
+app_settings = get_settings()
+
+T = TypeVar("T")
+
+_EXHAUSTED = object()
+
+
+class DatabaseExecutor:
+    """
+    Dedicated thread pool for blocking database calls made from async code.
+
+    Request handlers await work submitted here instead of occupying one of
+    Starlette's shared threadpool slots, so concurrency is bounded by the
+    number of database workers rather than by the web server.
+    """
+
+    def __init__(self, max_workers: Optional[int] = None):
+        self.max_workers = max_workers or app_settings.db_executor_workers
+        self._lock = threading.Lock()
+        self._executor: Optional[ThreadPoolExecutor] = None
+
+    def _thread_pool(self) -> ThreadPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=self.max_workers,
+                    thread_name_prefix="db",
+                )
+            return self._executor
+
+    async def run(self, fn: Callable[..., T], /, *args, **kwargs) -> T:
+        loop = asyncio.get_running_loop()
+        # Context variables do not follow run_in_executor on their own
+        context = contextvars.copy_context()
+        call = functools.partial(context.run, fn, *args, **kwargs)
+        return await loop.run_in_executor(self._thread_pool(), call)
+
+    async def iterate(self, iterator: Iterator[T]) -> AsyncIterator[T]:
+        try:
+            while (item := await self.run(next, iterator, _EXHAUSTED)) is not _EXHAUSTED:
+                yield item
+        finally:
+            close = getattr(iterator, "close", None)
+            if close is not None:
+                await self.run(close)
+
+    def warm_up(self, fn: Callable[[], object], timeout: float = 30.0) -> None:
+        """
+        Start every worker thread and run fn once on each, so per-thread
+        state such as reader connections exists before the first request.
+        """
+        # Holding each task at the barrier keeps the pool from handing two
+        # of them to the same thread
+        barrier = threading.Barrier(self.max_workers, timeout=timeout)
+
+        def warm_up_thread() -> None:
+            fn()
+            barrier.wait()
+
+        thread_pool = self._thread_pool()
+        futures = [
+            thread_pool.submit(warm_up_thread) for _ in range(self.max_workers)
+        ]
+        for future in futures:
+            future.result()
+
+    def shutdown(self) -> None:
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=True)
+
+
+_executor: Optional[DatabaseExecutor] = None
+_executor_lock = threading.Lock()
+
+
+def get_database_executor() -> DatabaseExecutor:
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = DatabaseExecutor()
+        return _executor
@@ -0,0 +1,189 @@
+"""
+Versioned schema migrations keyed on PRAGMA user_version.
+
+A migration is an ordered list of steps. A SchemaStep runs in a single
+transaction. A BackfillStep works through books in id order, one batch per
+transaction, so other writers get the database between batches and a large
+table never holds the write lock for long. The position of an unfinished
+migration is committed with each step and batch, so an interrupted upgrade
+resumes where it stopped. user_version is only raised in the transaction
+that completes the migration's last step.
+
+Every transaction reads user_version and the committed position before it
+does anything, so processes that start up together can all call migrate:
+each step and batch is run by whichever of them gets the write lock next,
+and the others carry on from where it left off.
+
+While a backfill runs, triggers that maintain what it builds can be limited
+to rows it has already reached with BACKFILL_POSITION. Rows further on are
+picked up in their latest state when the backfill gets to them. The
+backfill's finish callback runs in the same transaction as the batch that
+found no rows left, which is where such triggers are swapped for their
+unrestricted versions.
+"""
+
+import sqlite3
+from typing import Callable, List, Optional
+
+from config.logging import get_logger
+from config.settings import get_settings
+from db.pool import get_connection_pool
+
+app_settings = get_settings()
+logger = get_logger(__name__)
+
+# Last books id reached by the running backfill, for use in trigger WHEN
+# clauses
+BACKFILL_POSITION = "(SELECT after_id FROM schema_migration_state)"
+
+
+class SchemaStep:
+    __slots__ = ("apply",)
+
+    def __init__(self, apply: Callable[[sqlite3.Cursor], None]):
+        self.apply = apply
+
+
+class BackfillStep:
+    """
+    batch(cursor, after_id, limit) processes up to limit books with ids
+    after after_id and returns the last id it processed, or None once there
+    are none left, at which point finish(cursor) is called.
+    """
+
+    __slots__ = ("batch", "finish")
+
+    def __init__(
+        self,
+        batch: Callable[[sqlite3.Cursor, int, int], Optional[int]],
+        finish: Callable[[sqlite3.Cursor], None],
+    ):
+        self.batch = batch
+        self.finish = finish
+
+
+class Migration:
+    __slots__ = ("version", "name", "steps")
+
+    def __init__(self, version: int, name: str, steps: List[object]):
+        self.version = version
+        self.name = name
+        self.steps = steps
+
+
+def schema_version(connection: sqlite3.Connection) -> int:
+    return connection.execute("PRAGMA user_version").fetchone()[0]
+
+
+def set_backfill_position(cursor: sqlite3.Cursor, after_id: int) -> None:
+    """Start the following backfill after after_id instead of from the start"""
+    cursor.execute("UPDATE schema_migration_state SET after_id = ?", (after_id,))
+
+
+def migrate(
+    migrations: List[Migration],
+    connection_string: Optional[str] = None,
+    batch_size: Optional[int] = None,
+) -> int:
+    """Apply every migration newer than the database and return its version"""
+    pool = get_connection_pool(connection_string)
+    latest = migrations[-1].version
+    with pool.reader() as connection:
+        current = schema_version(connection)
+    if current == latest:
+        return current
+    if current > latest:
+        logger.warning(
+            "Database schema version %d is newer than this code's %d",
+            current,
+            latest,
+        )
+        return current
+
+    batch_size = batch_size or app_settings.db_migration_batch_size
+    with pool.writer() as connection:
+        connection.execute(
+            """
+            CREATE TABLE IF NOT EXISTS schema_migration_state(
+                version INTEGER NOT NULL,
+                step INTEGER NOT NULL,
+                after_id INTEGER NOT NULL
+            );
+            """
+        )
+    for migration in migrations:
+        if migration.version > current:
+            _apply(pool, migration, batch_size)
+    return latest
+
+
+def _apply(pool, migration: Migration, batch_size: int) -> None:
+    started = False
+    while True:
+        with pool.writer() as connection:
+            cursor = connection.cursor()
+            # Another process may be running the same migrations, so what is
+            # left to do is read again under the write lock every time
+            if schema_version(connection) >= migration.version:
+                if not started:
+                    logger.info(
+                        "Database was migrated to version %d by another process",
+                        migration.version,
+                    )
+                return
+            state = cursor.execute(
+                "SELECT version, step, after_id FROM schema_migration_state"
+            ).fetchone()
+            if state is None or state[0] != migration.version:
+                cursor.execute("DELETE FROM schema_migration_state")
+                cursor.execute(
+                    "INSERT INTO schema_migration_state(version, step, after_id) "
+                    "VALUES (?, 0, 0)",
+                    (migration.version,),
+                )
+                step, after_id = 0, 0
+                logger.info(
+                    "Migrating database to version %d: %s",
+                    migration.version,
+                    migration.name,
+                )
+            else:
+                step, after_id = state[1], state[2]
+                if not started:
+                    logger.info(
+                        "Resuming migration to version %d at step %d after id %d",
+                        migration.version,
+                        step,
+                        after_id,
+                    )
+            started = True
+
+            if step < len(migration.steps):
+                current_step = migration.steps[step]
+                if isinstance(current_step, SchemaStep):
+                    current_step.apply(cursor)
+                    # Keeps any position the step set for the next backfill
+                    cursor.execute("UPDATE schema_migration_state SET step = step + 1")
+                    step += 1
+                else:
+                    last_id = current_step.batch(cursor, after_id, batch_size)
+                    if last_id is None:
+                        current_step.finish(cursor)
+                        cursor.execute(
+                            "UPDATE schema_migration_state "
+                            "SET step = step + 1, after_id = 0"
+                        )
+                        step += 1
+                    else:
+                        set_backfill_position(cursor, last_id)
+                        logger.debug(
+                            "Migration to version %d backfilled up to id %d",
+                            migration.version,
+                            last_id,
+                        )
+            if step == len(migration.steps):
+                cursor.execute("DELETE FROM schema_migration_state")
+                # PRAGMA does not take parameters, version is an int
+                cursor.execute(f"PRAGMA user_version = {int(migration.version)}")
+                break
+    logger.info("Database is at version %d", migration.version)
@@ -0,0 +1,216 @@
+import os
+import sqlite3
+import threading
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional
+from weakref import WeakSet
+
+from config.settings import get_settings
+from db.tracing import TracingConnection
+
+app_settings = get_settings()
+# Every pool, including those created outside get_connection_pool
+_all_pools: "WeakSet[ConnectionPool]" = WeakSet()
+
+
+class ConnectionPool:
+    """
+    Long lived, tuned SQLite connections for a single database file.
+
+    SQLite in WAL mode allows many concurrent readers but only one writer, so
+    every thread gets its own reader connection while all writes go through a
+    single connection serialized by a lock.
+
+    writer() can be nested on the thread that holds it. A nested block runs
+    in a savepoint of the open transaction, so it can fail and be rolled back
+    on its own while the outer transaction carries on.
+    """
+
+    def __init__(
+        self,
+        db_path: str,
+        journal_mode: Optional[str] = None,
+        synchronous: Optional[str] = None,
+        mmap_size: Optional[int] = None,
+        cache_size: Optional[int] = None,
+        busy_timeout_ms: Optional[int] = None,
+        query_tracing: Optional[bool] = None,
+    ):
+        self.db_path = db_path
+        self.journal_mode = journal_mode or app_settings.db_journal_mode
+        self.synchronous = synchronous or app_settings.db_synchronous
+        self.mmap_size = (
+            app_settings.db_mmap_size if mmap_size is None else mmap_size
+        )
+        self.cache_size = (
+            app_settings.db_cache_size if cache_size is None else cache_size
+        )
+        self.busy_timeout_ms = (
+            app_settings.db_busy_timeout_ms
+            if busy_timeout_ms is None
+            else busy_timeout_ms
+        )
+        # The query stats header is counted by the tracing cursor
+        self.query_tracing = (
+            app_settings.db_query_tracing or app_settings.db_query_stats_header
+            if query_tracing is None
+            else query_tracing
+        )
+        self._lock = threading.Lock()
+        self._writer_lock = threading.RLock()
+        self._local = threading.local()
+        self._writer: Optional[sqlite3.Connection] = None
+        self._connections: List[sqlite3.Connection] = []
+        _all_pools.add(self)
+
+    def _connect(self, read_only: bool) -> sqlite3.Connection:
+        # Autocommit mode, transactions are opened explicitly by writer()
+        connection = sqlite3.connect(
+            self.db_path,
+            isolation_level=None,
+            check_same_thread=False,
+            factory=(
+                TracingConnection if self.query_tracing else sqlite3.Connection
+            ),
+        )
+        connection.execute(f"PRAGMA busy_timeout = {int(self.busy_timeout_ms)}")
+        connection.execute(f"PRAGMA synchronous = {self.synchronous}")
+        connection.execute(f"PRAGMA mmap_size = {int(self.mmap_size)}")
+        connection.execute(f"PRAGMA cache_size = {int(self.cache_size)}")
+        if read_only:
+            connection.execute("PRAGMA query_only = ON")
+        return connection
+
+    def _writer_connection(self) -> sqlite3.Connection:
+        with self._lock:
+            if self._writer is None:
+                connection = self._connect(read_only=False)
+                # journal_mode is persistent and only needs to be set once
+                connection.execute(f"PRAGMA journal_mode = {self.journal_mode}")
+                self._writer = connection
+                self._connections.append(connection)
+            return self._writer
+
+    def _reader_connection(self) -> sqlite3.Connection:
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            self._writer_connection()
+            connection = self._connect(read_only=True)
+            with self._lock:
+                self._connections.append(connection)
+            self._local.connection = connection
+        return connection
+
+    @contextmanager
+    def reader(self) -> Iterator[sqlite3.Connection]:
+        yield self._reader_connection()
+
+    @contextmanager
+    def dedicated_reader(self) -> Iterator[sqlite3.Connection]:
+        """
+        Private reader connection for long running reads, such as streaming
+        a whole table, that must not tie up the calling thread's reader.
+        """
+        self._writer_connection()
+        connection = self._connect(read_only=True)
+        try:
+            yield connection
+        finally:
+            connection.close()
+
+    @contextmanager
+    def writer(self) -> Iterator[sqlite3.Connection]:
+        with self._writer_lock:
+            connection = self._writer_connection()
+            if connection.in_transaction:
+                with self._savepoint(connection):
+                    yield connection
+                return
+
+            connection.execute("BEGIN IMMEDIATE")
+            try:
+                yield connection
+                if connection.in_transaction:
+                    connection.execute("COMMIT")
+            except BaseException:
+                if connection.in_transaction:
+                    connection.execute("ROLLBACK")
+                raise
+
+    @staticmethod
+    @contextmanager
+    def _savepoint(connection: sqlite3.Connection) -> Iterator[None]:
+        connection.execute("SAVEPOINT nested_write")
+        try:
+            yield
+        except BaseException:
+            connection.execute("ROLLBACK TO nested_write")
+            connection.execute("RELEASE nested_write")
+            raise
+        connection.execute("RELEASE nested_write")
+
+    def warm_up(self) -> None:
+        with self.reader() as connection:
+            connection.execute("SELECT 1 FROM sqlite_master LIMIT 1").fetchall()
+
+    def _reset_after_fork(self) -> None:
+        self._lock = threading.Lock()
+        self._writer_lock = threading.RLock()
+        self._local = threading.local()
+        self._writer = None
+        self._connections = []
+
+    def close(self) -> None:
+        with self._writer_lock, self._lock:
+            for connection in self._connections:
+                connection.close()
+            self._connections = []
+            self._writer = None
+            self._local = threading.local()
+
+
+def is_database_busy(exc: sqlite3.OperationalError) -> bool:
+    """True for "database is locked" errors raised after busy_timeout ran out"""
+    error_code = getattr(exc, "sqlite_errorcode", None)
+    if error_code is None:
+        return "locked" in str(exc)
+    # Extended codes such as SQLITE_BUSY_SNAPSHOT keep the primary code in
+    # the low byte
+    return error_code & 0xFF in (sqlite3.SQLITE_BUSY, sqlite3.SQLITE_LOCKED)
+
+
+_pools: Dict[str, ConnectionPool] = {}
+_pools_lock = threading.Lock()
+
+
+def get_connection_pool(db_path: Optional[str] = None) -> ConnectionPool:
+    db_path = db_path or app_settings.db_url
+    with _pools_lock:
+        pool = _pools.get(db_path)
+        if pool is None:
+            pool = ConnectionPool(db_path)
+            _pools[db_path] = pool
+        return pool
+
+
+def close_connection_pools() -> None:
+    with _pools_lock:
+        pools = list(_pools.values())
+        _pools.clear()
+    for pool in pools:
+        pool.close()
+
+
+def _forget_connections_after_fork() -> None:
+    """
+    SQLite connections must not be used across fork, so a forked child drops
+    every inherited connection without closing it and opens its own. The
+    locks are replaced too, another thread may have held them at the fork.
+    """
+    global _pools_lock
+    _pools_lock = threading.Lock()
+    for pool in list(_all_pools):
+        pool._reset_after_fork()
+
+
+os.register_at_fork(after_in_child=_forget_connections_after_fork)
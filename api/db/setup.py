@@ -1,33 +1,411 @@
-import sqlite3
 from typing import Optional
 from contextlib import contextmanager
 
-from config.settings import get_settings
-
-app_settings = get_settings()
+from db.migrations import (
+    BACKFILL_POSITION,
+    BackfillStep,
+    Migration,
+    SchemaStep,
+    migrate,
+    set_backfill_position,
+)
+from db.pool import get_connection_pool
 
 @contextmanager
 def db_transaction(connection_string: Optional[str] = None):
-    connection = sqlite3.connect(connection_string or app_settings.db_url)
-    try:
+    with get_connection_pool(connection_string).writer() as connection:
         yield connection
-        connection.commit()
-    except Exception:
-        connection.rollback()
-        raise
-    finally:
-        connection.close()
-
-def init_db():
-    with db_transaction() as connection:
-        cursor = connection.cursor()
+
+def _create_books_table(cursor):
+    cursor.execute(
+        """
+        CREATE TABLE IF NOT EXISTS books(
+            id INTEGER PRIMARY KEY,
+            title TEXT,
+            description TEXT,
+            author TEXT,
+            version INTEGER NOT NULL DEFAULT 1,
+            updated_at REAL NOT NULL DEFAULT 0
+        );
+        """
+    )
+    # Books created before rows were versioned. Adding a column with a
+    # constant default does not rewrite the table
+    _add_column_if_missing(cursor, "books", "version", "INTEGER NOT NULL DEFAULT 1")
+    _add_column_if_missing(cursor, "books", "updated_at", "REAL NOT NULL DEFAULT 0")
+
+def _add_column_if_missing(cursor, table, column, definition):
+    columns = {row[1] for row in cursor.execute(f"PRAGMA table_info({table})")}
+    if column not in columns:
+        cursor.execute(f"ALTER TABLE {table} ADD COLUMN {column} {definition};")
+
+def _create_books_indexes(cursor):
+    # SQLite builds an index in one sorted pass over the table. Writers wait
+    # for it, readers carry on in WAL mode
+    cursor.execute(
+        "CREATE INDEX IF NOT EXISTS idx_books_title ON books(title);"
+    )
+    # Author lookups are case insensitive, the index has to match
+    cursor.execute(
+        "CREATE INDEX IF NOT EXISTS idx_books_author "
+        "ON books(author COLLATE NOCASE);"
+    )
+
+def _table_exists(cursor, name):
+    return cursor.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (name,)
+    ).fetchone() is not None
+
+def _last_id_in_batch(cursor, after_id, limit):
+    return cursor.execute(
+        "SELECT max(id) FROM (SELECT id FROM books WHERE id > ? ORDER BY id LIMIT ?)",
+        (after_id, limit),
+    ).fetchone()[0]
+
+def _last_book_id(cursor):
+    return cursor.execute("SELECT coalesce(max(id), 0) FROM books").fetchone()[0]
+
+def _backfill_guard(row, backfilling):
+    """
+    WHEN clause limiting a trigger to books the running backfill has
+    reached, row being new or old
+    """
+    if not backfilling:
+        return ""
+    return f"WHEN {row}.id <= {BACKFILL_POSITION}"
+
+def _drop_triggers(cursor, names):
+    for name in names:
+        cursor.execute(f"DROP TRIGGER IF EXISTS {name};")
+
+BOOKS_FTS_TRIGGERS = (
+    "books_fts_after_insert",
+    "books_fts_after_delete",
+    "books_fts_after_update",
+)
+
+def _create_books_fts(cursor):
+    """
+    External content FTS5 index over books, kept in sync by triggers so the
+    text is stored only once. Books are indexed by the backfill that
+    follows, with the triggers only keeping up rows it has reached.
+    """
+    fts_exists = _table_exists(cursor, "books_fts")
+    cursor.execute(
+        """
+        CREATE VIRTUAL TABLE IF NOT EXISTS books_fts USING fts5(
+            title,
+            description,
+            author,
+            content='books',
+            content_rowid='id'
+        );
+        """
+    )
+    if fts_exists:
+        # Created and kept up to date before migrations existed
+        set_backfill_position(cursor, _last_book_id(cursor))
+    _drop_triggers(cursor, BOOKS_FTS_TRIGGERS)
+    _create_books_fts_triggers(cursor, backfilling=True)
+
+def _index_books_for_search(cursor, after_id, limit):
+    last_id = _last_id_in_batch(cursor, after_id, limit)
+    if last_id is not None:
         cursor.execute(
             """
-            CREATE TABLE IF NOT EXISTS books(
-                id INTEGER PRIMARY KEY,
-                title TEXT,
-                description TEXT,
-                author TEXT
+            INSERT INTO books_fts(rowid, title, description, author)
+            SELECT id, title, description, author FROM books
+            WHERE id > ? AND id <= ?
+            """,
+            (after_id, last_id),
+        )
+    return last_id
+
+def _finish_books_fts(cursor):
+    _drop_triggers(cursor, BOOKS_FTS_TRIGGERS)
+    _create_books_fts_triggers(cursor)
+
+def _create_books_fts_triggers(cursor, backfilling=False):
+    cursor.execute(
+        f"""
+        CREATE TRIGGER IF NOT EXISTS books_fts_after_insert
+        AFTER INSERT ON books {_backfill_guard("new", backfilling)} BEGIN
+            INSERT INTO books_fts(rowid, title, description, author)
+            VALUES (new.id, new.title, new.description, new.author);
+        END;
+        """
+    )
+    cursor.execute(
+        f"""
+        CREATE TRIGGER IF NOT EXISTS books_fts_after_delete
+        AFTER DELETE ON books {_backfill_guard("old", backfilling)} BEGIN
+            INSERT INTO books_fts(books_fts, rowid, title, description, author)
+            VALUES ('delete', old.id, old.title, old.description, old.author);
+        END;
+        """
+    )
+    cursor.execute(
+        f"""
+        CREATE TRIGGER IF NOT EXISTS books_fts_after_update
+        AFTER UPDATE ON books {_backfill_guard("old", backfilling)} BEGIN
+            INSERT INTO books_fts(books_fts, rowid, title, description, author)
+            VALUES ('delete', old.id, old.title, old.description, old.author);
+            INSERT INTO books_fts(rowid, title, description, author)
+            VALUES (new.id, new.title, new.description, new.author);
+        END;
+        """
+    )
+
+BOOK_CHANGES_TRIGGERS = (
+    "book_changes_after_insert",
+    "book_changes_after_update",
+    "book_changes_after_delete",
+)
+
+def _create_book_changes(cursor):
+    """
+    Append-only log of every insert, update and delete on books, written by
+    triggers so no write path can forget it. AUTOINCREMENT keeps sequence
+    numbers from being reused, which consumers rely on to resume.
+    """
+    changes_exist = _table_exists(cursor, "book_changes")
+    cursor.execute(
+        """
+        CREATE TABLE IF NOT EXISTS book_changes(
+            seq INTEGER PRIMARY KEY AUTOINCREMENT,
+            book_id INTEGER NOT NULL,
+            operation TEXT NOT NULL,
+            changed_at REAL NOT NULL
+        );
+        """
+    )
+    if changes_exist:
+        # Created and seeded before migrations existed
+        set_backfill_position(cursor, _last_book_id(cursor))
+    _drop_triggers(cursor, BOOK_CHANGES_TRIGGERS)
+    _create_book_changes_triggers(cursor, backfilling=True)
+
+def _seed_book_changes(cursor, after_id, limit):
+    """
+    Books stored before the change log existed start out as inserts. Books
+    written before the backfill reaches them are logged once, in their
+    latest state, and books deleted before then not at all.
+    """
+    last_id = _last_id_in_batch(cursor, after_id, limit)
+    if last_id is not None:
+        cursor.execute(
+            """
+            INSERT INTO book_changes(book_id, operation, changed_at)
+            SELECT id, 'insert', updated_at FROM books
+            WHERE id > ? AND id <= ? ORDER BY id
+            """,
+            (after_id, last_id),
+        )
+    return last_id
+
+def _finish_book_changes(cursor):
+    _drop_triggers(cursor, BOOK_CHANGES_TRIGGERS)
+    _create_book_changes_triggers(cursor)
+
+def _create_book_changes_triggers(cursor, backfilling=False):
+    cursor.execute(
+        f"""
+        CREATE TRIGGER IF NOT EXISTS book_changes_after_insert
+        AFTER INSERT ON books {_backfill_guard("new", backfilling)} BEGIN
+            INSERT INTO book_changes(book_id, operation, changed_at)
+            VALUES (new.id, 'insert', new.updated_at);
+        END;
+        """
+    )
+    cursor.execute(
+        f"""
+        CREATE TRIGGER IF NOT EXISTS book_changes_after_update
+        AFTER UPDATE ON books {_backfill_guard("new", backfilling)} BEGIN
+            INSERT INTO book_changes(book_id, operation, changed_at)
+            VALUES (new.id, 'update', new.updated_at);
+        END;
+        """
+    )
+    # Deletes have no updated_at to copy. julianday gives unix time to the
+    # millisecond, kept from going back past the book's last write
+    cursor.execute(
+        f"""
+        CREATE TRIGGER IF NOT EXISTS book_changes_after_delete
+        AFTER DELETE ON books {_backfill_guard("old", backfilling)} BEGIN
+            INSERT INTO book_changes(book_id, operation, changed_at)
+            VALUES (
+                old.id,
+                'delete',
+                max(old.updated_at, (julianday('now') - 2440587.5) * 86400.0)
+            );
+        END;
+        """
+    )
+
+BOOKS_REBUILD_TRIGGERS = (
+    "books_rebuild_after_insert",
+    "books_rebuild_after_update",
+    "books_rebuild_after_delete",
+)
+
+def _create_books_autoincrement(cursor):
+    """
+    Without AUTOINCREMENT SQLite hands the id of the newest book out again
+    once that book is deleted, and ETags and the change log both take an id
+    to mean one book. SQLite cannot add AUTOINCREMENT to a table, so books
+    are copied into books_new by the backfill that follows, with triggers
+    mirroring writes to rows it has reached, and books_new then takes the
+    place of books.
+    """
+    cursor.execute(
+        """
+        CREATE TABLE IF NOT EXISTS books_new(
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            title TEXT,
+            description TEXT,
+            author TEXT,
+            version INTEGER NOT NULL DEFAULT 1,
+            updated_at REAL NOT NULL DEFAULT 0
+        );
+        """
+    )
+    _drop_triggers(cursor, BOOKS_REBUILD_TRIGGERS)
+    cursor.execute(
+        f"""
+        CREATE TRIGGER books_rebuild_after_insert
+        AFTER INSERT ON books {_backfill_guard("new", True)} BEGIN
+            INSERT INTO books_new(
+                id, title, description, author, version, updated_at
+            )
+            VALUES (
+                new.id,
+                new.title,
+                new.description,
+                new.author,
+                new.version,
+                new.updated_at
             );
+        END;
+        """
+    )
+    cursor.execute(
+        f"""
+        CREATE TRIGGER books_rebuild_after_update
+        AFTER UPDATE ON books {_backfill_guard("old", True)} BEGIN
+            UPDATE books_new SET
+                title = new.title,
+                description = new.description,
+                author = new.author,
+                version = new.version,
+                updated_at = new.updated_at
+            WHERE id = old.id;
+        END;
+        """
+    )
+    cursor.execute(
+        f"""
+        CREATE TRIGGER books_rebuild_after_delete
+        AFTER DELETE ON books {_backfill_guard("old", True)} BEGIN
+            DELETE FROM books_new WHERE id = old.id;
+        END;
+        """
+    )
+
+def _copy_books(cursor, after_id, limit):
+    last_id = _last_id_in_batch(cursor, after_id, limit)
+    if last_id is not None:
+        cursor.execute(
             """
+            INSERT INTO books_new(
+                id, title, description, author, version, updated_at
+            )
+            SELECT id, title, description, author, version, updated_at
+            FROM books WHERE id > ? AND id <= ?
+            """,
+            (after_id, last_id),
         )
+    return last_id
+
+def _finish_books_autoincrement(cursor):
+    """
+    Swap books_new in for books. Dropping books takes its indexes and
+    triggers with it, so they are created again on the new table. Those
+    index builds are the one part of the migration that holds the write
+    lock for a full pass over books.
+    """
+    cursor.execute("DROP TABLE books;")
+    cursor.execute("ALTER TABLE books_new RENAME TO books;")
+    # Ids deleted before the copy are only left in the change log, and
+    # must not be handed out again either
+    cursor.execute(
+        "DELETE FROM sqlite_sequence WHERE name IN ('books', 'books_new');"
+    )
+    cursor.execute(
+        """
+        INSERT INTO sqlite_sequence(name, seq) VALUES (
+            'books',
+            max(
+                (SELECT coalesce(max(id), 0) FROM books),
+                (SELECT coalesce(max(book_id), 0) FROM book_changes)
+            )
+        );
+        """
+    )
+    _create_books_indexes(cursor)
+    _create_books_fts_triggers(cursor)
+    _create_book_changes_triggers(cursor)
+
+# Append only. Changing a released migration leaves databases that already
+# ran it on a different schema
+MIGRATIONS = [
+    Migration(1, "books table", [SchemaStep(_create_books_table)]),
+    Migration(2, "books title and author indexes", [SchemaStep(_create_books_indexes)]),
+    Migration(
+        3,
+        "books full-text search",
+        [
+            SchemaStep(_create_books_fts),
+            BackfillStep(_index_books_for_search, _finish_books_fts),
+        ],
+    ),
+    Migration(
+        4,
+        "book change log",
+        [
+            SchemaStep(_create_book_changes),
+            BackfillStep(_seed_book_changes, _finish_book_changes),
+        ],
+    ),
+    Migration(
+        5,
+        "books ids never reused",
+        [
+            SchemaStep(_create_books_autoincrement),
+            BackfillStep(_copy_books, _finish_books_autoincrement),
+        ],
+    ),
+]
+
+def init_db(connection_string: Optional[str] = None, batch_size: Optional[int] = None):
+    """
+    Bring the database up to the latest schema version. Returns straight
+    away when it is already there.
+    """
+    return migrate(MIGRATIONS, connection_string, batch_size=batch_size)
+
+def drop_books_indexes(connection):
+    """
+    Drop the secondary indexes on books and stop new rows from being added
+    to the search index, so bulk inserts only write the table itself.
+    rebuild_books_indexes has to be called once the load is done.
+    """
+    connection.execute("DROP INDEX IF EXISTS idx_books_title;")
+    connection.execute("DROP INDEX IF EXISTS idx_books_author;")
+    connection.execute("DROP TRIGGER IF EXISTS books_fts_after_insert;")
+
+def rebuild_books_indexes(connection):
+    """Recreate what drop_books_indexes removed, each index built in one pass"""
+    cursor = connection.cursor()
+    _create_books_indexes(cursor)
+    cursor.execute("INSERT INTO books_fts(books_fts) VALUES ('rebuild')")
+    _create_books_fts_triggers(cursor)
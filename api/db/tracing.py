@@ -0,0 +1,195 @@
+"""
+Statement level tracing for pooled SQLite connections.
+
+Every statement is timed from execute until its rows have been consumed,
+then attributed to the method that opened the cursor, e.g.
+SQLiteBookRepository.books_page. Each statement is logged at DEBUG level,
+statements slower than Settings.db_slow_query_ms are logged as warnings, and
+the count and total time are added to the current request's QueryStats.
+Transaction control statements are logged apart from slow queries, as their
+time is mostly spent waiting for the write lock or syncing a commit.
+"""
+
+import logging
+import sqlite3
+import sys
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Iterator, Optional
+
+from config.logging import get_logger
+from config.settings import get_settings
+
+app_settings = get_settings()
+logger = get_logger("db.queries")
+
+_TRANSACTION_CONTROL = frozenset(
+    {"BEGIN", "COMMIT", "END", "ROLLBACK", "SAVEPOINT", "RELEASE"}
+)
+
+
+class QueryStats:
+    """Number of statements and total time spent in them for one request"""
+
+    __slots__ = ("count", "total_seconds")
+
+    def __init__(self):
+        self.count = 0
+        self.total_seconds = 0.0
+
+
+_query_stats: ContextVar[Optional[QueryStats]] = ContextVar(
+    "query_stats", default=None
+)
+
+
+@contextmanager
+def collect_query_stats() -> Iterator[QueryStats]:
+    """
+    Collect statements run from the current context, including database
+    executor threads, which receive a copy of the context.
+    """
+    stats = QueryStats()
+    token = _query_stats.set(stats)
+    try:
+        yield stats
+    finally:
+        _query_stats.reset(token)
+
+
+def _is_transaction_control(statement: str) -> bool:
+    words = statement.split(None, 1)
+    return bool(words) and words[0].upper() in _TRANSACTION_CONTROL
+
+
+def _record(operation: str, statement: str, seconds: float, rows: int) -> None:
+    stats = _query_stats.get()
+    if stats is not None:
+        stats.count += 1
+        stats.total_seconds += seconds
+
+    duration_ms = seconds * 1000
+    if duration_ms < app_settings.db_slow_query_ms:
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug(
+                "Query in %s took %.3f ms, %d rows: %s",
+                operation,
+                duration_ms,
+                rows,
+                " ".join(statement.split()),
+            )
+    elif _is_transaction_control(statement):
+        # Mostly BEGIN IMMEDIATE waiting for another writer or COMMIT
+        # syncing, not a slow query
+        logger.warning(
+            "Slow transaction control in %s took %.1f ms: %s",
+            operation,
+            duration_ms,
+            " ".join(statement.split()),
+        )
+    else:
+        logger.warning(
+            "Slow query in %s took %.1f ms, %d rows: %s",
+            operation,
+            duration_ms,
+            rows,
+            " ".join(statement.split()),
+        )
+
+
+class TracingCursor(sqlite3.Cursor):
+    """
+    Cursor that times each statement, including the time spent fetching its
+    rows. A statement is recorded once its rows are consumed: by fetchone,
+    fetchall, a short fetchmany, the next execute or close. Statements that
+    return no rows are recorded straight away with the affected row count.
+    """
+
+    operation = "unknown"
+    _statement: Optional[str] = None
+    _seconds = 0.0
+    _rows = 0
+
+    def _finish(self) -> None:
+        if self._statement is not None:
+            _record(self.operation, self._statement, self._seconds, self._rows)
+            self._statement = None
+
+    def _start(self, statement: str, seconds: float) -> None:
+        self._statement = statement
+        self._seconds = seconds
+        self._rows = 0
+        if self.description is None:
+            self._rows = max(self.rowcount, 0)
+            self._finish()
+
+    def execute(self, sql, parameters=(), /):
+        self._finish()
+        start = time.perf_counter()
+        super().execute(sql, parameters)
+        self._start(sql, time.perf_counter() - start)
+        return self
+
+    def executemany(self, sql, seq_of_parameters, /):
+        self._finish()
+        start = time.perf_counter()
+        super().executemany(sql, seq_of_parameters)
+        self._start(sql, time.perf_counter() - start)
+        return self
+
+    def fetchone(self):
+        start = time.perf_counter()
+        row = super().fetchone()
+        self._seconds += time.perf_counter() - start
+        if row is not None:
+            self._rows += 1
+        self._finish()
+        return row
+
+    def fetchmany(self, size=None):
+        size = self.arraysize if size is None else size
+        start = time.perf_counter()
+        rows = super().fetchmany(size)
+        self._seconds += time.perf_counter() - start
+        self._rows += len(rows)
+        if len(rows) < size:
+            self._finish()
+        return rows
+
+    def fetchall(self):
+        start = time.perf_counter()
+        rows = super().fetchall()
+        self._seconds += time.perf_counter() - start
+        self._rows += len(rows)
+        self._finish()
+        return rows
+
+    def close(self):
+        self._finish()
+        super().close()
+
+
+class TracingConnection(sqlite3.Connection):
+    """Connection whose cursors, including those behind execute, are traced"""
+
+    def _traced_cursor(self, caller_depth: int) -> TracingCursor:
+        cursor = super().cursor(TracingCursor)
+        # Attribute the statements to whoever asked for the cursor
+        cursor.operation = sys._getframe(caller_depth + 1).f_code.co_qualname
+        return cursor
+
+    def cursor(self, factory=TracingCursor):
+        if factory is not TracingCursor:
+            return super().cursor(factory)
+        return self._traced_cursor(caller_depth=1)
+
+    # The C implementations run the statement without going through
+    # Cursor.execute, so they would bypass tracing
+    def execute(self, sql, parameters=(), /):
+        return self._traced_cursor(caller_depth=1).execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters, /):
+        return self._traced_cursor(caller_depth=1).executemany(
+            sql, seq_of_parameters
+        )
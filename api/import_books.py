@@ -0,0 +1,101 @@
+"""
+Stream books from a CSV or JSON lines file into the database.
+
+    uv run python import_books.py books.csv --rebuild-indexes
+    uv run python import_books.py books.jsonl --resume
+"""
+
+import argparse
+import sys
+from typing import get_args
+
+from apps.books.exports import EXPORT_FORMAT
+from apps.books.imports import (
+    BookImportError,
+    BookImportProgressModel,
+    import_books,
+)
+from apps.books.memory import is_memory_url
+from apps.books.models import BookErrorModel
+from config.settings import get_settings
+from db.pool import close_connection_pools
+from db.setup import init_db
+
+app_settings = get_settings()
+
+
+def _print_progress(progress: BookImportProgressModel) -> None:
+    print(
+        f"{progress.rows:,} rows read, {progress.inserted:,} inserted, "
+        f"{progress.rejected:,} rejected, "
+        f"{progress.rows_per_second:,.0f} rows/s",
+        file=sys.stderr,
+    )
+
+
+def _print_error(error: BookErrorModel) -> None:
+    print(f"Row {error.index}: {error.message}", file=sys.stderr)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("path", help="CSV file with a header row, or JSON lines")
+    parser.add_argument(
+        "--format",
+        dest="import_format",
+        choices=get_args(EXPORT_FORMAT),
+        help="File format, by default taken from the file extension",
+    )
+    parser.add_argument("--db", default=app_settings.db_url)
+    parser.add_argument(
+        "--chunk-size",
+        type=int,
+        default=app_settings.books_import_chunk_size,
+        help="Rows per transaction",
+    )
+    parser.add_argument(
+        "--rebuild-indexes",
+        action="store_true",
+        help="Drop indexes for the load and rebuild them at the end",
+    )
+    parser.add_argument(
+        "--resume",
+        action="store_true",
+        help="Continue an interrupted import of the same file",
+    )
+    args = parser.parse_args()
+
+    if is_memory_url(args.db):
+        parser.error("books can only be imported into a SQLite database")
+    if args.chunk_size < 1:
+        parser.error("--chunk-size needs to be a positive integer")
+
+    init_db(args.db)
+    try:
+        progress = import_books(
+            args.path,
+            db_path=args.db,
+            import_format=args.import_format,
+            chunk_size=args.chunk_size,
+            rebuild_indexes=args.rebuild_indexes,
+            resume=args.resume,
+            on_progress=_print_progress,
+            on_error=_print_error,
+        )
+    except (BookImportError, OSError) as exc:
+        print(f"Import failed: {exc}", file=sys.stderr)
+        sys.exit(1)
+    finally:
+        close_connection_pools()
+
+    if progress.rows == progress.resumed_rows and progress.resumed_rows:
+        print(f"{args.path} was already imported", file=sys.stderr)
+    print(
+        f"Imported {progress.inserted:,} of {progress.rows:,} rows "
+        f"({progress.rejected:,} rejected) in {progress.seconds:.1f} s, "
+        f"{progress.rows_per_second:,.0f} rows/s"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -1,18 +1,65 @@
+import sqlite3
 from contextlib import asynccontextmanager
 from fastapi import FastAPI, Request
 from fastapi.responses import JSONResponse
 
-from apps.routes import api_v1_router
+from apps.admission.middleware import (
+    AdmissionControlMiddleware,
+    service_unavailable_response,
+)
+from apps.books.memory import is_memory_url, memory_source_path
+from apps.books.routes import get_book_repository
+from apps.books.snapshot import SnapshotBookRepository
+from apps.compression import NegotiatedGZipMiddleware
+from apps.routes import BOOKS_LIST_PATH, api_v1_router
 from apps.exceptions import BusinessRuleException
+from apps.health.routes import router as health_router
+from apps.metrics.middleware import (
+    MetricsMiddleware,
+    QueryStatsMiddleware,
+    RequestLoggingMiddleware,
+)
+from apps.metrics.routes import router as metrics_router
+from config.logging import get_logger
+from config.settings import get_settings
+from db.executor import get_database_executor
+from db.pool import close_connection_pools, get_connection_pool, is_database_busy
 from db.setup import init_db
 
+app_settings = get_settings()
+logger = get_logger(__name__)
+
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     """
     https://fastapi.tiangolo.com/advanced/events/#lifespan-events
+
+    With several workers, serve.py initializes the database once before
+    starting them and turns db_init_on_startup off, so workers never race
+    on the schema.
     """
-    init_db()
+    app.state.ready = False
+    if is_memory_url(app_settings.db_url):
+        source_path = memory_source_path(app_settings.db_url)
+        if source_path is not None and app_settings.db_init_on_startup:
+            init_db(source_path)
+        # Hydrates the in-memory repository before the first request
+        get_book_repository()
+    else:
+        if app_settings.db_init_on_startup:
+            init_db()
+        pool = get_connection_pool()
+        pool.warm_up()
+        # Opens a reader connection on every database thread
+        get_database_executor().warm_up(pool.warm_up)
+        book_repository = get_book_repository()
+        if isinstance(book_repository, SnapshotBookRepository):
+            book_repository.load()
+    app.state.ready = True
     yield
+    app.state.ready = False
+    get_database_executor().shutdown()
+    close_connection_pools()
 
 app = FastAPI(
     title="Book Warden API",
@@ -21,6 +68,30 @@ app = FastAPI(
     lifespan=lifespan
 )
 app.include_router(api_v1_router)
+app.include_router(health_router)
+
+if app_settings.admission_enabled:
+    # Innermost, so the metrics and logs of a request include its queue wait
+    app.add_middleware(AdmissionControlMiddleware)
+
+if app_settings.db_query_stats_header:
+    app.add_middleware(QueryStatsMiddleware)
+
+if app_settings.metrics_enabled:
+    app.add_middleware(MetricsMiddleware)
+    app.include_router(metrics_router)
+
+if app_settings.response_gzip_enabled:
+    # Responses under the minimum size gain little and cost a compression
+    app.add_middleware(
+        NegotiatedGZipMiddleware,
+        negotiated_paths=(BOOKS_LIST_PATH,),
+        minimum_size=app_settings.response_gzip_min_size,
+        compresslevel=app_settings.response_gzip_level,
+    )
+
+# Added last so it is outermost and every record it wraps gets the request id
+app.add_middleware(RequestLoggingMiddleware)
 
 @app.exception_handler(BusinessRuleException)
 async def business_rule_exception_handler(request: Request, exc: BusinessRuleException):
@@ -30,3 +101,15 @@ async def business_rule_exception_handler(request: Request, exc: BusinessRuleExc
             "message": str(exc)
         }
     )
+
+@app.exception_handler(sqlite3.OperationalError)
+async def database_operational_error_handler(request: Request, exc: sqlite3.OperationalError):
+    # Waited DB_BUSY_TIMEOUT_MS for another process holding the database,
+    # the request can be retried once it lets go
+    if not is_database_busy(exc):
+        raise exc
+    logger.warning("%s %s failed, database busy: %s", request.method, request.url.path, exc)
+    return service_unavailable_response(
+        "Database is busy, retry later",
+        app_settings.admission_retry_after_seconds,
+    )
@@ -0,0 +1,86 @@
+"""
+Run the API with SERVER_WORKERS processes sharing one SQLite database.
+
+    uv run python serve.py
+
+The database is initialized here, once, before any worker starts. Workers
+are started with DB_INIT_ON_STARTUP=false and only open their own
+connections. SQLite in WAL mode lets every worker read concurrently while
+writes from all workers take turns on the database's write lock, waiting
+up to DB_BUSY_TIMEOUT_MS for it.
+"""
+
+import os
+import sys
+from typing import List
+
+import uvicorn
+
+from apps.books.memory import is_memory_url
+from config.logging import get_logger
+from config.settings import Settings, get_settings
+from db.pool import close_connection_pools
+from db.setup import init_db
+
+logger = get_logger(__name__)
+
+
+def worker_setting_errors(settings: Settings) -> List[str]:
+    """Settings that cannot work when several processes serve the API"""
+    if settings.server_workers < 1:
+        return ["SERVER_WORKERS needs to be at least 1"]
+    if settings.server_workers == 1:
+        return []
+
+    errors = []
+    if is_memory_url(settings.db_url):
+        errors.append(
+            "DB_URL=memory:// gives every worker its own separate catalogue"
+        )
+    if settings.db_journal_mode != "WAL":
+        errors.append(
+            "DB_JOURNAL_MODE needs to be WAL for workers to read while "
+            "another one writes"
+        )
+    if settings.book_snapshot_enabled:
+        errors.append(
+            "BOOK_SNAPSHOT_ENABLED does not see writes made by other workers"
+        )
+    if settings.book_list_cache_enabled:
+        errors.append(
+            "BOOK_LIST_CACHE_ENABLED does not see writes made by other workers"
+        )
+    return errors
+
+
+def main() -> None:
+    app_settings = get_settings()
+    errors = worker_setting_errors(app_settings)
+    if errors:
+        for error in errors:
+            print(f"Cannot start workers: {error}", file=sys.stderr)
+        sys.exit(1)
+    if app_settings.server_workers > 1 and app_settings.book_cache_enabled:
+        logger.warning(
+            "Each worker has its own book cache, reads may be up to "
+            "BOOK_CACHE_TTL_SECONDS stale after writes through other workers"
+        )
+
+    init_db()
+    # Workers open their own connections, none are inherited
+    close_connection_pools()
+    # Workers are spawned with this environment and read it into Settings
+    os.environ["DB_INIT_ON_STARTUP"] = "false"
+
+    uvicorn.run(
+        "main:app",
+        host=app_settings.server_host,
+        port=int(app_settings.server_port),
+        workers=app_settings.server_workers,
+        # Requests are logged by the app itself when LOG_REQUESTS is set
+        access_log=False,
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,161 @@
+import asyncio
+
+import httpx
+import pytest
+from fastapi import FastAPI
+
+from apps.admission.middleware import (
+    AdmissionControlMiddleware,
+    AdmissionGate,
+    AdmissionRejected,
+)
+from apps.metrics.registry import MetricsRegistry
+
+
+def build_app(registry, release, read_gate, write_gate):
+    app = FastAPI()
+    app.add_middleware(
+        AdmissionControlMiddleware,
+        read_gate=read_gate,
+        write_gate=write_gate,
+        retry_after_seconds=3,
+        registry=registry,
+    )
+
+    @app.get("/api/books")
+    async def get_books():
+        await release.wait()
+        return []
+
+    @app.post("/api/books")
+    async def create_book():
+        return {"id": 1}
+
+    @app.get("/health/live")
+    async def get_liveness():
+        return {"status": "ok"}
+
+    return app
+
+
+class TestAdmissionGate:
+    def test_release_hands_slot_to_longest_waiting_request(self):
+        # Arrange
+        gate = AdmissionGate(limit=1, queue_depth=2, queue_timeout_seconds=5)
+        order = []
+
+        async def request(name):
+            await gate.acquire()
+            order.append(name)
+            await asyncio.sleep(0)
+            gate.release()
+
+        async def run():
+            await gate.acquire()
+            waiters = [asyncio.create_task(request(name)) for name in ("a", "b")]
+            await asyncio.sleep(0)
+            queued = gate.queued
+            gate.release()
+            await asyncio.gather(*waiters)
+            return queued
+
+        # Act
+        queued = asyncio.run(run())
+
+        # Assert
+        assert queued == 2
+        assert order == ["a", "b"]
+        assert gate.active == 0
+        assert gate.queued == 0
+
+    def test_acquire_with_full_queue_is_rejected(self):
+        # Arrange
+        gate = AdmissionGate(limit=1, queue_depth=0, queue_timeout_seconds=5)
+
+        async def run():
+            await gate.acquire()
+            await gate.acquire()
+
+        # Act and Assert
+        with pytest.raises(AdmissionRejected, match="queue_full"):
+            asyncio.run(run())
+
+    def test_acquire_waiting_past_queue_timeout_is_rejected(self):
+        # Arrange
+        gate = AdmissionGate(limit=1, queue_depth=1, queue_timeout_seconds=0.01)
+
+        async def run():
+            await gate.acquire()
+            await gate.acquire()
+
+        # Act
+        with pytest.raises(AdmissionRejected, match="timeout"):
+            asyncio.run(run())
+
+        # Assert
+        assert gate.queued == 0
+        assert gate.active == 1
+
+    def test_cancelled_waiter_leaves_the_queue(self):
+        # Arrange
+        gate = AdmissionGate(limit=1, queue_depth=1, queue_timeout_seconds=5)
+
+        async def run():
+            await gate.acquire()
+            waiter = asyncio.create_task(gate.acquire())
+            await asyncio.sleep(0)
+            waiter.cancel()
+            with pytest.raises(asyncio.CancelledError):
+                await waiter
+            gate.release()
+
+        # Act
+        asyncio.run(run())
+
+        # Assert
+        assert gate.queued == 0
+        assert gate.active == 0
+
+
+class TestAdmissionControlMiddleware:
+    def test_requests_over_limit_and_queue_get_503_with_retry_after(self):
+        # Arrange
+        registry = MetricsRegistry()
+
+        async def run():
+            release = asyncio.Event()
+            app = build_app(
+                registry,
+                release,
+                read_gate=AdmissionGate(limit=1, queue_depth=1, queue_timeout_seconds=5),
+                write_gate=AdmissionGate(limit=1, queue_depth=0, queue_timeout_seconds=5),
+            )
+            async with httpx.AsyncClient(
+                transport=httpx.ASGITransport(app=app), base_url="http://test"
+            ) as client:
+                running = asyncio.create_task(client.get("/api/books"))
+                queued = asyncio.create_task(client.get("/api/books"))
+                await asyncio.sleep(0.05)
+                rejected = await client.get("/api/books")
+                # Writes are admitted separately from the reads holding theirs
+                write = await client.post("/api/books")
+                health = await client.get("/health/live")
+                release.set()
+                return await running, await queued, rejected, write, health
+
+        # Act
+        running, queued, rejected, write, health = asyncio.run(run())
+
+        # Assert
+        assert running.status_code == 200
+        assert queued.status_code == 200
+        assert float(queued.headers["X-Queue-Wait-Ms"]) > 0
+        assert rejected.status_code == 503
+        assert rejected.headers["Retry-After"] == "3"
+        assert write.status_code == 200
+        assert health.status_code == 200
+        assert "X-Queue-Wait-Ms" not in health.headers
+        metrics = registry.render()
+        assert 'admission_rejected_total{class="read",reason="queue_full"} 1' in metrics
+        assert 'admission_queue_wait_seconds_count{class="read"} 2' in metrics
+        assert 'admission_in_flight{class="read"} 0' in metrics
@@ -1,13 +1,20 @@
+import csv
+import io
+import json
 import pytest
 import sqlite3
 import tempfile
 import os
 from fastapi.testclient import TestClient
+from unittest.mock import Mock
 
 from main import app
+from apps.books.page_cache import BookPageCache
 from apps.books.routes import new_book_service
 from apps.books.services import BookService
-from apps.books.repositories import SQLiteBookRepository
+from apps.books.repositories import BookRepository, SQLiteBookRepository
+from db.pool import close_connection_pools
+from db.setup import init_db
 
 
 @pytest.fixture
@@ -16,21 +23,14 @@ def temp_db():
     temp_dir = tempfile.mkdtemp()
     db_path = os.path.join(temp_dir, "test.db")
 
-    with sqlite3.connect(db_path) as conn:
-        conn.execute("""
-            CREATE TABLE books(
-                id INTEGER PRIMARY KEY,
-                title TEXT,
-                description TEXT,
-                author TEXT
-            )
-        """)
-        conn.commit()
+    init_db(db_path)
 
     yield db_path
 
-    if os.path.exists(db_path):
-        os.remove(db_path)
+    close_connection_pools()
+    for path in (db_path, f"{db_path}-wal", f"{db_path}-shm"):
+        if os.path.exists(path):
+            os.remove(path)
     os.rmdir(temp_dir)
 
 
@@ -49,6 +49,25 @@ def test_client(temp_db):
     app.dependency_overrides.clear()
 
 
+@pytest.fixture
+def cached_test_client(temp_db):
+    """Test client whose list pages are served from a BookPageCache"""
+    page_cache = BookPageCache(max_entries=10)
+
+    def override_book_service():
+        return BookService(
+            book_repository=SQLiteBookRepository(db_path=temp_db),
+            page_cache=page_cache,
+        )
+
+    app.dependency_overrides[new_book_service] = override_book_service
+
+    client = TestClient(app)
+    yield client
+
+    app.dependency_overrides.clear()
+
+
 class TestBooksAPIIntegration:
     
     def test_get_books_returns_empty_list_when_no_books(self, test_client):
@@ -108,6 +127,94 @@ class TestBooksAPIIntegration:
         # Assert
         assert response.status_code == 422
 
+    def test_create_books_in_bulk(self, test_client):
+        # Arrange
+        books_data = [
+            {"title": "Book 1", "description": "Description 1", "author": "Author 1"},
+            {"title": "Book 2", "description": None, "author": "Author 2"},
+        ]
+
+        # Act
+        response = test_client.post("/api/v1/books/bulk", json=books_data)
+
+        # Assert
+        assert response.status_code == 201
+        response_data = response.json()
+        assert response_data["errors"] == []
+        assert [book["title"] for book in response_data["created"]] == ["Book 1", "Book 2"]
+        assert response_data["created"][1]["description"] == ""
+        list_response = test_client.get("/api/v1/books/")
+        assert [book["id"] for book in list_response.json()] == [
+            book["id"] for book in response_data["created"]
+        ]
+
+    def test_create_books_in_bulk_reports_invalid_items_and_creates_the_rest(self, test_client):
+        # Arrange
+        books_data = [
+            {"title": "Book 1", "author": "Author 1"},
+            {"title": 42, "author": "Author 2"},
+            {"title": "Book 3"},
+            "Book 4",
+            {"title": "Book 5", "description": "Description", "author": "Author 5"},
+        ]
+
+        # Act
+        response = test_client.post("/api/v1/books/bulk", json=books_data)
+
+        # Assert
+        assert response.status_code == 201
+        response_data = response.json()
+        assert [book["title"] for book in response_data["created"]] == ["Book 1", "Book 5"]
+        assert response_data["errors"] == [
+            {"index": 1, "message": "Book title needs to be text"},
+            {"index": 2, "message": "Book author needs to be text"},
+            {"index": 3, "message": "Book needs to be a JSON object"},
+        ]
+        assert len(test_client.get("/api/v1/books/").json()) == 2
+
+    def test_create_books_in_bulk_with_non_list_body_returns_422(self, test_client):
+        # Act
+        response = test_client.post("/api/v1/books/bulk", json={"title": "Book"})
+
+        # Assert
+        assert response.status_code == 422
+
+    def test_create_books_in_bulk_with_empty_list_returns_400(self, test_client):
+        # Act
+        response = test_client.post("/api/v1/books/bulk", json=[])
+
+        # Assert
+        assert response.status_code == 400
+
+    def test_lookup_books_returns_books_in_requested_order(self, test_client):
+        # Arrange
+        first = test_client.post("/api/v1/books/", json={"title": "First", "author": "Author"}).json()
+        second = test_client.post("/api/v1/books/", json={"title": "Second", "author": "Author"}).json()
+
+        # Act
+        response = test_client.post(
+            "/api/v1/books/lookup",
+            json={"ids": [second["id"], 999, first["id"], second["id"]]},
+        )
+
+        # Assert
+        assert response.status_code == 200
+        assert response.json() == {"books": [second, first], "missing_ids": [999]}
+
+    def test_lookup_books_with_negative_id_returns_400(self, test_client):
+        # Act
+        response = test_client.post("/api/v1/books/lookup", json={"ids": [1, -1]})
+
+        # Assert
+        assert response.status_code == 400
+
+    def test_lookup_books_with_empty_list_returns_400(self, test_client):
+        # Act
+        response = test_client.post("/api/v1/books/lookup", json={"ids": []})
+
+        # Assert
+        assert response.status_code == 400
+
     def test_get_books_returns_created_books(self, test_client):
         # Arrange
         book1_data = {"title": "Book 1", "description": "Description 1", "author": "Author 1"}
@@ -131,6 +238,253 @@ class TestBooksAPIIntegration:
         assert book1_id in book_ids
         assert book2_id in book_ids
 
+    def test_get_books_paginates_with_next_cursor(self, test_client):
+        # Arrange
+        book_ids = [
+            test_client.post(
+                "/api/v1/books/",
+                json={"title": f"Book {i}", "description": "Description", "author": "Author"},
+            ).json()["id"]
+            for i in range(3)
+        ]
+
+        # Act
+        first_response = test_client.get("/api/v1/books/?limit=2")
+        next_cursor = first_response.headers["X-Next-Cursor"]
+        second_response = test_client.get(f"/api/v1/books/?limit=2&after_id={next_cursor}")
+
+        # Assert
+        assert first_response.status_code == 200
+        assert [book["id"] for book in first_response.json()] == book_ids[:2]
+        assert 'rel="next"' in first_response.headers["Link"]
+        assert second_response.status_code == 200
+        assert [book["id"] for book in second_response.json()] == book_ids[2:]
+        assert "X-Next-Cursor" not in second_response.headers
+
+    def test_get_books_next_link_survives_deleting_the_cursor_book(self, test_client):
+        # Arrange
+        for title in ["Charlie", "Alpha", "Bravo", "Delta"]:
+            test_client.post(
+                "/api/v1/books/",
+                json={"title": title, "description": "Description", "author": "Author"},
+            )
+        first_response = test_client.get("/api/v1/books/?limit=2&sort=title")
+        test_client.delete(f"/api/v1/books/{first_response.headers['X-Next-Cursor']}")
+
+        # Act
+        second_response = test_client.get(first_response.links["next"]["url"])
+
+        # Assert
+        assert first_response.headers["X-Next-Key"] == "Bravo"
+        assert second_response.status_code == 200
+        assert [book["title"] for book in second_response.json()] == ["Charlie", "Delta"]
+
+    def test_get_books_compresses_large_pages_for_clients_accepting_gzip(self, test_client):
+        # Arrange
+        for i in range(20):
+            test_client.post(
+                "/api/v1/books/",
+                json={"title": f"Book {i}", "description": "Description", "author": "Author"},
+            )
+
+        # Act
+        gzip_response = test_client.get("/api/v1/books/", headers={"Accept-Encoding": "gzip"})
+        identity_response = test_client.get("/api/v1/books/", headers={"Accept-Encoding": "identity"})
+        small_response = test_client.get("/api/v1/books/?limit=1", headers={"Accept-Encoding": "gzip"})
+
+        # Assert
+        assert gzip_response.headers["Content-Encoding"] == "gzip"
+        assert len(gzip_response.json()) == 20
+        assert gzip_response.headers["Vary"] == "Accept-Encoding"
+        assert "Content-Encoding" not in identity_response.headers
+        assert identity_response.headers["Vary"] == "Accept-Encoding"
+        assert identity_response.json() == gzip_response.json()
+        assert "Content-Encoding" not in small_response.headers
+        assert "Vary" not in small_response.headers
+
+    def test_get_books_serves_cached_page_until_a_book_changes(self, cached_test_client, temp_db):
+        # Arrange
+        for i in range(20):
+            cached_test_client.post(
+                "/api/v1/books/",
+                json={"title": f"Book {i}", "description": "Description", "author": "Author"},
+            )
+        first_response = cached_test_client.get("/api/v1/books/", headers={"Accept-Encoding": "gzip"})
+        # Written behind the service's back, so the cached page does not see it
+        with sqlite3.connect(temp_db) as connection:
+            connection.execute("UPDATE books SET title = 'Changed' WHERE id = 1")
+
+        # Act
+        cached_response = cached_test_client.get("/api/v1/books/", headers={"Accept-Encoding": "gzip"})
+        cached_test_client.delete("/api/v1/books/20")
+        fresh_response = cached_test_client.get("/api/v1/books/", headers={"Accept-Encoding": "identity"})
+
+        # Assert
+        assert cached_response.headers["Content-Encoding"] == "gzip"
+        assert cached_response.headers["Vary"] == "Accept-Encoding"
+        assert cached_response.headers["ETag"] == first_response.headers["ETag"]
+        assert cached_response.json() == first_response.json()
+        assert "Content-Encoding" not in fresh_response.headers
+        assert fresh_response.json()[0]["title"] == "Changed"
+        assert len(fresh_response.json()) == 19
+
+    def test_get_books_not_modified_varies_on_accept_encoding(self, cached_test_client):
+        # Arrange
+        for i in range(20):
+            cached_test_client.post(
+                "/api/v1/books/",
+                json={"title": f"Book {i}", "description": "Description", "author": "Author"},
+            )
+        etag = cached_test_client.get("/api/v1/books/").headers["ETag"]
+
+        # Act
+        identity_response = cached_test_client.get(
+            "/api/v1/books/", headers={"Accept-Encoding": "identity", "If-None-Match": etag}
+        )
+        gzip_response = cached_test_client.get(
+            "/api/v1/books/", headers={"Accept-Encoding": "gzip", "If-None-Match": etag}
+        )
+
+        # Assert
+        assert identity_response.status_code == 304
+        assert identity_response.headers["Vary"] == "Accept-Encoding"
+        assert gzip_response.status_code == 304
+        assert gzip_response.headers["Vary"] == "Accept-Encoding"
+
+    def test_get_books_filters_and_sorts(self, test_client):
+        # Arrange
+        for title, author in [("Beta", "Ann"), ("Alpha", "ann"), ("Gamma", "Bob")]:
+            test_client.post(
+                "/api/v1/books/",
+                json={"title": title, "description": "Description", "author": author},
+            )
+
+        # Act
+        response = test_client.get("/api/v1/books/?author=ANN&sort=title")
+        prefix_response = test_client.get("/api/v1/books/?title_prefix=Ga")
+
+        # Assert
+        assert response.status_code == 200
+        assert [book["title"] for book in response.json()] == ["Alpha", "Beta"]
+        assert [book["title"] for book in prefix_response.json()] == ["Gamma"]
+
+    def test_get_books_with_unknown_sort_returns_422(self, test_client):
+        # Act
+        response = test_client.get("/api/v1/books/?sort=description")
+
+        # Assert
+        assert response.status_code == 422
+
+    def test_get_books_with_invalid_limit_returns_422(self, test_client):
+        # Act
+        response = test_client.get("/api/v1/books/?limit=0")
+
+        # Assert
+        assert response.status_code == 422
+
+    def test_search_books_returns_ranked_pages(self, test_client):
+        # Arrange
+        for title in ["Dragons", "Dragon Riders", "Cooking"]:
+            test_client.post(
+                "/api/v1/books/",
+                json={"title": title, "description": "Dragons everywhere", "author": "Author"},
+            )
+
+        # Act
+        first_response = test_client.get("/api/v1/books/search?q=dragons&limit=1")
+        second_response = test_client.get(
+            f"/api/v1/books/search?q=dragons&limit=1&offset={first_response.headers['X-Next-Offset']}"
+        )
+
+        # Assert
+        assert first_response.status_code == 200
+        assert [book["title"] for book in first_response.json()] == ["Dragons"]
+        assert second_response.status_code == 200
+        assert len(second_response.json()) == 1
+        assert "X-Next-Offset" in second_response.headers
+
+    def test_search_books_with_blank_query_returns_400(self, test_client):
+        # Act
+        response = test_client.get("/api/v1/books/search?q=%20")
+
+        # Assert
+        assert response.status_code == 400
+
+    def test_search_books_without_query_returns_422(self, test_client):
+        # Act
+        response = test_client.get("/api/v1/books/search")
+
+        # Assert
+        assert response.status_code == 422
+
+    def test_book_changes_returns_changes_and_tombstones(self, test_client):
+        # Arrange
+        book_data = {"title": "Book", "description": "Description", "author": "Author"}
+        book_id = test_client.post("/api/v1/books/", json=book_data).json()["id"]
+        test_client.delete(f"/api/v1/books/{book_id}")
+
+        # Act
+        first_response = test_client.get("/api/v1/books/changes?limit=1")
+        second_response = test_client.get(
+            f"/api/v1/books/changes?since={first_response.json()['next_since']}"
+        )
+
+        # Assert
+        assert first_response.status_code == 200
+        first_page = first_response.json()
+        assert [change["operation"] for change in first_page["changes"]] == ["insert"]
+        assert first_page["changes"][0]["book"] is None
+        second_page = second_response.json()
+        assert [change["operation"] for change in second_page["changes"]] == ["delete"]
+        assert second_page["changes"][0]["id"] == book_id
+        assert second_page["next_since"] == second_page["changes"][0]["seq"]
+
+    def test_book_changes_with_negative_since_returns_422(self, test_client):
+        # Act
+        response = test_client.get("/api/v1/books/changes?since=-1")
+
+        # Assert
+        assert response.status_code == 422
+
+    def test_export_books_as_ndjson(self, test_client):
+        # Arrange
+        book_data = {"title": "Book", "description": "Description", "author": "Author"}
+        book_ids = [
+            test_client.post("/api/v1/books/", json=book_data).json()["id"]
+            for _ in range(3)
+        ]
+
+        # Act
+        response = test_client.get("/api/v1/books/export")
+
+        # Assert
+        assert response.status_code == 200
+        assert response.headers["content-type"] == "application/x-ndjson"
+        rows = [json.loads(line) for line in response.text.splitlines()]
+        assert [row["id"] for row in rows] == book_ids
+        assert rows[0] == {"id": book_ids[0], **book_data}
+
+    def test_export_books_as_csv(self, test_client):
+        # Arrange
+        book_data = {"title": "Book, Volume 1", "description": "Description", "author": "Author"}
+        book_id = test_client.post("/api/v1/books/", json=book_data).json()["id"]
+
+        # Act
+        response = test_client.get("/api/v1/books/export?format=csv")
+
+        # Assert
+        assert response.status_code == 200
+        assert response.headers["content-type"].startswith("text/csv")
+        rows = list(csv.DictReader(io.StringIO(response.text)))
+        assert rows == [{"id": str(book_id), **book_data}]
+
+    def test_export_books_with_unknown_format_returns_422(self, test_client):
+        # Act
+        response = test_client.get("/api/v1/books/export?format=xml")
+
+        # Assert
+        assert response.status_code == 422
+
     def test_get_book_by_id_returns_existing_book(self, test_client):
         # Arrange
         book_data = {"title": "Test Book", "description": "Test Description", "author": "Test Author"}
@@ -148,6 +502,100 @@ class TestBooksAPIIntegration:
         assert response_data["description"] == "Test Description"
         assert response_data["author"] == "Test Author"
 
+    def test_get_book_returns_validators(self, test_client):
+        # Arrange
+        book_data = {"title": "Test Book", "description": "Test Description", "author": "Test Author"}
+        book_id = test_client.post("/api/v1/books/", json=book_data).json()["id"]
+
+        # Act
+        response = test_client.get(f"/api/v1/books/{book_id}")
+
+        # Assert
+        assert response.headers["ETag"] == f'W/"{book_id}-1"'
+        assert response.headers["Last-Modified"].endswith("GMT")
+
+    def test_get_book_with_matching_etag_returns_304(self, test_client):
+        # Arrange
+        book_data = {"title": "Test Book", "description": "Test Description", "author": "Test Author"}
+        book_id = test_client.post("/api/v1/books/", json=book_data).json()["id"]
+        etag = test_client.get(f"/api/v1/books/{book_id}").headers["ETag"]
+
+        # Act
+        response = test_client.get(f"/api/v1/books/{book_id}", headers={"If-None-Match": etag})
+
+        # Assert
+        assert response.status_code == 304
+        assert response.content == b""
+        assert response.headers["ETag"] == etag
+
+    def test_get_book_after_update_returns_new_etag(self, test_client):
+        # Arrange
+        book_data = {"title": "Test Book", "description": "Test Description", "author": "Test Author"}
+        book_id = test_client.post("/api/v1/books/", json=book_data).json()["id"]
+        etag = test_client.get(f"/api/v1/books/{book_id}").headers["ETag"]
+        test_client.patch(f"/api/v1/books/{book_id}", json={"title": "New Title"})
+
+        # Act
+        response = test_client.get(f"/api/v1/books/{book_id}", headers={"If-None-Match": etag})
+
+        # Assert
+        assert response.status_code == 200
+        assert response.json()["title"] == "New Title"
+        assert response.headers["ETag"] == f'W/"{book_id}-2"'
+
+    def test_book_created_after_deleting_newest_does_not_match_its_etag(self, test_client):
+        # Arrange
+        book_data = {"title": "Old", "description": "Test Description", "author": "Test Author"}
+        old_id = test_client.post("/api/v1/books/", json=book_data).json()["id"]
+        etag = test_client.get(f"/api/v1/books/{old_id}").headers["ETag"]
+        test_client.delete(f"/api/v1/books/{old_id}")
+        new_id = test_client.post("/api/v1/books/", json={**book_data, "title": "New"}).json()["id"]
+
+        # Act
+        response = test_client.get(f"/api/v1/books/{old_id}", headers={"If-None-Match": etag})
+
+        # Assert
+        assert new_id != old_id
+        assert response.status_code == 404
+
+    def test_get_book_with_if_modified_since_returns_304(self, test_client):
+        # Arrange
+        book_data = {"title": "Test Book", "description": "Test Description", "author": "Test Author"}
+        book_id = test_client.post("/api/v1/books/", json=book_data).json()["id"]
+        last_modified = test_client.get(f"/api/v1/books/{book_id}").headers["Last-Modified"]
+
+        # Act
+        response = test_client.get(
+            f"/api/v1/books/{book_id}", headers={"If-Modified-Since": last_modified}
+        )
+
+        # Assert
+        assert response.status_code == 304
+
+    def test_get_book_with_etag_for_nonexistent_id_returns_404(self, test_client):
+        # Act
+        response = test_client.get("/api/v1/books/999", headers={"If-None-Match": 'W/"999-1"'})
+
+        # Assert
+        assert response.status_code == 404
+
+    def test_get_books_with_matching_etag_returns_304_until_page_changes(self, test_client):
+        # Arrange
+        book_data = {"title": "Test Book", "description": "Test Description", "author": "Test Author"}
+        test_client.post("/api/v1/books/", json=book_data)
+        etag = test_client.get("/api/v1/books/").headers["ETag"]
+
+        # Act
+        unchanged_response = test_client.get("/api/v1/books/", headers={"If-None-Match": etag})
+        test_client.post("/api/v1/books/", json=book_data)
+        changed_response = test_client.get("/api/v1/books/", headers={"If-None-Match": etag})
+
+        # Assert
+        assert unchanged_response.status_code == 304
+        assert changed_response.status_code == 200
+        assert len(changed_response.json()) == 2
+        assert changed_response.headers["ETag"] != etag
+
     def test_get_book_by_nonexistent_id_returns_404(self, test_client):
         # Act
         response = test_client.get("/api/v1/books/999")
@@ -244,12 +692,12 @@ class TestBooksAPIIntegration:
         get_response_after = test_client.get(f"/api/v1/books/{book_id}")
         assert get_response_after.status_code == 404
 
-    def test_delete_nonexistent_book_returns_204(self, test_client):
+    def test_delete_nonexistent_book_returns_404(self, test_client):
         # Act
         response = test_client.delete("/api/v1/books/999")
-        
+
         # Assert
-        assert response.status_code == 204  # Should not error
+        assert response.status_code == 404
 
     def test_delete_book_with_invalid_id_returns_422(self, test_client):
         # Act
@@ -257,3 +705,67 @@ class TestBooksAPIIntegration:
         
         # Assert
         assert response.status_code == 422
+
+    def test_openapi_schema_documents_response_dtos(self, test_client):
+        # Act
+        paths = test_client.get("/openapi.json").json()["paths"]
+
+        # Assert
+        def response_schema(path, method, status_code):
+            response = paths[path][method]["responses"][status_code]
+            return response["content"]["application/json"]["schema"]
+
+        assert response_schema("/api/v1/books/", "get", "200") == {
+            "type": "array",
+            "items": {"$ref": "#/components/schemas/ListBookResponseDto"},
+            "title": "Response Get Books Api V1 Books  Get",
+        }
+        assert response_schema("/api/v1/books/{book_id}", "get", "200") == {
+            "$ref": "#/components/schemas/GetBookResponseDto"
+        }
+        assert response_schema("/api/v1/books/", "post", "201") == {
+            "$ref": "#/components/schemas/CreateBookResponseDto"
+        }
+        assert response_schema("/api/v1/books/{book_id}", "patch", "200") == {
+            "$ref": "#/components/schemas/UpdateBookResponseDto"
+        }
+
+    def test_database_busy_returns_503_with_retry_after(self, test_client, temp_db):
+        # Arrange
+        locking = sqlite3.connect(temp_db, isolation_level=None)
+        blocked = sqlite3.connect(temp_db, timeout=0)
+        locking.execute("BEGIN IMMEDIATE")
+        with pytest.raises(sqlite3.OperationalError) as locked:
+            blocked.execute("INSERT INTO books (title) VALUES ('Title')")
+        locking.execute("ROLLBACK")
+        locking.close()
+        blocked.close()
+        book_repository = Mock(spec=BookRepository)
+        book_repository.create_book.side_effect = locked.value
+        app.dependency_overrides[new_book_service] = lambda: BookService(book_repository=book_repository)
+
+        # Act
+        response = test_client.post(
+            "/api/v1/books/",
+            json={"title": "Title", "description": "Description", "author": "Author"},
+        )
+
+        # Assert
+        assert response.status_code == 503
+        assert response.headers["Retry-After"] == "1"
+        assert response.json() == {"message": "Database is busy, retry later"}
+
+    def test_metrics_report_book_routes_by_template(self, test_client):
+        # Arrange
+        test_client.get("/api/v1/books/999")
+
+        # Act
+        response = test_client.get("/metrics")
+
+        # Assert
+        assert response.status_code == 200
+        assert response.headers["content-type"].startswith("text/plain")
+        assert (
+            'http_requests_total{method="GET",route="/api/v1/books/{book_id}",status="404"}'
+            in response.text
+        )
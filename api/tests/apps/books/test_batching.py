@@ -0,0 +1,176 @@
+import os
+import tempfile
+import threading
+
+import pytest
+
+from apps.books.batching import (
+    BatchingBookRepository,
+    write_batch_metrics_collector,
+)
+from apps.books.repositories import SQLiteBookRepository
+from db.pool import close_connection_pools, get_connection_pool
+from db.setup import init_db
+
+
+class FailingBookRepository(SQLiteBookRepository):
+    """Inserts the book and then fails for titles starting with Bad"""
+
+    def create_book(self, title, description, author):
+        book = super().create_book(title, description, author)
+        if title.startswith("Bad"):
+            raise ValueError(f"{title} rejected")
+        return book
+
+
+@pytest.fixture
+def temp_db():
+    temp_dir = tempfile.mkdtemp()
+    db_path = os.path.join(temp_dir, "test.db")
+    init_db(db_path)
+
+    yield db_path
+
+    close_connection_pools()
+    for path in (db_path, f"{db_path}-wal", f"{db_path}-shm"):
+        if os.path.exists(path):
+            os.remove(path)
+    os.rmdir(temp_dir)
+
+
+def run_concurrently(calls):
+    """Run every call on its own thread and collect results or errors"""
+    outcomes = [None] * len(calls)
+
+    def run(index, call):
+        try:
+            outcomes[index] = call()
+        except Exception as exc:
+            outcomes[index] = exc
+
+    threads = [
+        threading.Thread(target=run, args=(index, call))
+        for index, call in enumerate(calls)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return outcomes
+
+
+class TestBatchingBookRepository:
+    def test_concurrent_writes_are_committed_in_one_batch(self, temp_db):
+        # Arrange
+        # The leader waits until all four writes are queued
+        repository = BatchingBookRepository(
+            book_repository=SQLiteBookRepository(db_path=temp_db),
+            pool=get_connection_pool(temp_db),
+            max_batch_size=4,
+            max_wait_ms=5000,
+        )
+
+        # Act
+        books = run_concurrently(
+            [
+                lambda index=index: repository.create_book(
+                    f"Book {index}", "Description", "Author"
+                )
+                for index in range(4)
+            ]
+        )
+
+        # Assert
+        assert sorted(book.id for book in books) == [1, 2, 3, 4]
+        assert {book.title for book in books} == {f"Book {i}" for i in range(4)}
+        stats = repository.stats()
+        assert stats.batches == 1
+        assert stats.writes == 4
+        assert stats.largest_batch == 4
+
+    def test_failing_write_is_rolled_back_without_failing_the_batch(self, temp_db):
+        # Arrange
+        repository = BatchingBookRepository(
+            book_repository=FailingBookRepository(db_path=temp_db),
+            pool=get_connection_pool(temp_db),
+            max_batch_size=3,
+            max_wait_ms=5000,
+        )
+
+        # Act
+        outcomes = run_concurrently(
+            [
+                lambda: repository.create_book("Good 1", None, "Author"),
+                lambda: repository.create_book("Bad", None, "Author"),
+                lambda: repository.create_book("Good 2", None, "Author"),
+            ]
+        )
+
+        # Assert
+        assert outcomes[0].title == "Good 1"
+        assert isinstance(outcomes[1], ValueError)
+        assert str(outcomes[1]) == "Bad rejected"
+        assert outcomes[2].title == "Good 2"
+        titles = {book.title for book in repository.all_books()}
+        assert titles == {"Good 1", "Good 2"}
+        assert repository.stats().batches == 1
+
+    def test_batches_are_capped_at_max_batch_size(self, temp_db):
+        # Arrange
+        repository = BatchingBookRepository(
+            book_repository=SQLiteBookRepository(db_path=temp_db),
+            pool=get_connection_pool(temp_db),
+            max_batch_size=2,
+            max_wait_ms=0,
+        )
+
+        # Act
+        run_concurrently(
+            [
+                lambda: repository.create_book("Title", None, "Author")
+                for _ in range(6)
+            ]
+        )
+
+        # Assert
+        stats = repository.stats()
+        assert stats.writes == 6
+        assert stats.largest_batch <= 2
+        assert len(repository.all_books()) == 6
+
+    def test_update_and_delete_return_their_own_results(self, temp_db):
+        # Arrange
+        repository = BatchingBookRepository(
+            book_repository=SQLiteBookRepository(db_path=temp_db),
+            pool=get_connection_pool(temp_db),
+            max_batch_size=8,
+            max_wait_ms=0,
+        )
+        book = repository.create_book("Title", None, "Author")
+
+        # Act
+        updated_book = repository.update_book(book.id, "New", None, None)
+        deleted = repository.delete_book(book.id)
+        deleted_again = repository.delete_book(book.id)
+
+        # Assert
+        assert updated_book.title == "New"
+        assert deleted is True
+        assert deleted_again is False
+
+    def test_write_batch_metrics_collector_reports_batches(self, temp_db):
+        # Arrange
+        repository = BatchingBookRepository(
+            book_repository=SQLiteBookRepository(db_path=temp_db),
+            pool=get_connection_pool(temp_db),
+            max_batch_size=8,
+            max_wait_ms=0,
+        )
+        repository.create_book("Title", None, "Author")
+
+        # Act
+        lines = write_batch_metrics_collector(repository)()
+
+        # Assert
+        assert "book_write_batches_total 1" in lines
+        assert "book_batched_writes_total 1" in lines
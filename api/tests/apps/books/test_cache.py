@@ -0,0 +1,193 @@
+import pytest
+from unittest.mock import Mock
+
+from apps.books.cache import CachedBookRepository, cache_metrics_collector
+from apps.books.models import BookModel, NewBookModel
+from apps.books.repositories import BookRepository
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def make_book(id):
+    return BookModel(id=id, title=f"Title {id}", description="Description", author="Author")
+
+
+@pytest.fixture
+def clock():
+    return FakeClock()
+
+
+@pytest.fixture
+def book_repository():
+    book_repository = Mock(spec=BookRepository)
+    book_repository.book.side_effect = make_book
+    book_repository.books_by_ids.side_effect = lambda ids: [
+        make_book(id) for id in ids if id != 404
+    ]
+    return book_repository
+
+
+@pytest.fixture
+def cached_repository(book_repository, clock):
+    return CachedBookRepository(
+        book_repository=book_repository,
+        max_entries=2,
+        ttl_seconds=10,
+        clock=clock,
+    )
+
+
+class TestCachedBookRepository:
+    def test_book_is_read_through_once(self, cached_repository, book_repository):
+        # Act
+        first = cached_repository.book(id=1)
+        second = cached_repository.book(id=1)
+
+        # Assert
+        assert first == second == make_book(1)
+        book_repository.book.assert_called_once_with(id=1)
+        stats = cached_repository.stats()
+        assert stats.hits == 1
+        assert stats.misses == 1
+        assert stats.size == 1
+
+    def test_books_by_ids_only_fetches_uncached_books(self, cached_repository, book_repository):
+        # Arrange
+        cached_repository.book(id=1)
+
+        # Act
+        books = cached_repository.books_by_ids(ids=[2, 404, 1])
+
+        # Assert
+        assert books == [make_book(2), make_book(1)]
+        book_repository.books_by_ids.assert_called_once_with(ids=[2, 404])
+        assert cached_repository.book(id=2) == make_book(2)
+        book_repository.book.assert_called_once_with(id=1)
+
+    def test_missing_book_is_not_cached(self, cached_repository, book_repository):
+        # Arrange
+        book_repository.book.side_effect = None
+        book_repository.book.return_value = None
+
+        # Act
+        cached_repository.book(id=1)
+        cached_repository.book(id=1)
+
+        # Assert
+        assert book_repository.book.call_count == 2
+        assert cached_repository.stats().size == 0
+
+    def test_expired_entry_is_reloaded(self, cached_repository, book_repository, clock):
+        # Arrange
+        cached_repository.book(id=1)
+
+        # Act
+        clock.now = 11
+        cached_repository.book(id=1)
+
+        # Assert
+        assert book_repository.book.call_count == 2
+        assert cached_repository.stats().expirations == 1
+
+    def test_least_recently_used_entry_is_evicted(self, cached_repository, book_repository):
+        # Arrange
+        cached_repository.book(id=1)
+        cached_repository.book(id=2)
+        cached_repository.book(id=1)
+
+        # Act
+        cached_repository.book(id=3)
+        cached_repository.book(id=1)
+        cached_repository.book(id=2)
+
+        # Assert
+        assert [call.kwargs["id"] for call in book_repository.book.call_args_list] == [1, 2, 3, 2]
+        assert cached_repository.stats().evictions == 2
+
+    def test_update_book_invalidates_entry(self, cached_repository, book_repository):
+        # Arrange
+        cached_repository.book(id=1)
+
+        # Act
+        cached_repository.update_book(id=1, title="New Title", description=None, author=None)
+        cached_repository.book(id=1)
+
+        # Assert
+        book_repository.update_book.assert_called_once_with(
+            id=1, title="New Title", description=None, author=None
+        )
+        assert book_repository.book.call_count == 2
+        assert cached_repository.stats().invalidations == 1
+
+    def test_delete_book_invalidates_entry(self, cached_repository, book_repository):
+        # Arrange
+        cached_repository.book(id=1)
+
+        # Act
+        cached_repository.delete_book(id=1)
+        cached_repository.book(id=1)
+
+        # Assert
+        book_repository.delete_book.assert_called_once_with(id=1)
+        assert book_repository.book.call_count == 2
+
+    def test_create_books_invalidates_created_ids(self, cached_repository, book_repository):
+        # Arrange
+        cached_repository.book(id=1)
+        book_repository.create_books.return_value = [make_book(1)]
+        new_books = [NewBookModel(title="Title", description=None, author="Author")]
+
+        # Act
+        cached_repository.create_books(books=new_books)
+
+        # Assert
+        assert cached_repository.stats().size == 0
+
+    def test_lookup_racing_with_write_is_not_cached(self, cached_repository, book_repository):
+        # Arrange
+        def book_changed_during_lookup(id):
+            cached_repository.invalidate(id)
+            return make_book(id)
+
+        book_repository.book.side_effect = book_changed_during_lookup
+
+        # Act
+        cached_repository.book(id=1)
+
+        # Assert
+        assert cached_repository.stats().size == 0
+
+    def test_book_version_is_answered_from_cache(self, cached_repository, book_repository):
+        # Arrange
+        cached_repository.book(id=1)
+
+        # Act
+        version = cached_repository.book_version(id=1)
+        uncached_version = cached_repository.book_version(id=2)
+
+        # Assert
+        assert version.id == 1
+        assert version.version == 1
+        book_repository.book_version.assert_called_once_with(id=2)
+        assert uncached_version == book_repository.book_version.return_value
+
+    def test_metrics_collector_reports_cache_stats(self, cached_repository):
+        # Arrange
+        cached_repository.book(id=1)
+        cached_repository.book(id=1)
+
+        # Act
+        lines = cache_metrics_collector(cached_repository)()
+
+        # Assert
+        assert "# TYPE book_cache_hits_total counter" in lines
+        assert "book_cache_hits_total 1" in lines
+        assert "book_cache_misses_total 1" in lines
+        assert "book_cache_evictions_total 0" in lines
+        assert "book_cache_entries 1" in lines
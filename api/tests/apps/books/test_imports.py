@@ -0,0 +1,236 @@
+import json
+import os
+import sqlite3
+import tempfile
+
+import pytest
+
+from apps.books.imports import BookImportError, import_books
+from apps.books.repositories import SQLiteBookRepository
+from db.pool import close_connection_pools
+from db.setup import init_db
+
+
+class ImportInterrupted(Exception):
+    pass
+
+
+@pytest.fixture
+def temp_dir():
+    temp_dir = tempfile.mkdtemp()
+
+    yield temp_dir
+
+    close_connection_pools()
+    for name in os.listdir(temp_dir):
+        os.remove(os.path.join(temp_dir, name))
+    os.rmdir(temp_dir)
+
+
+@pytest.fixture
+def temp_db(temp_dir):
+    db_path = os.path.join(temp_dir, "test.db")
+    init_db(db_path)
+    return db_path
+
+
+def write_file(temp_dir, name, lines):
+    path = os.path.join(temp_dir, name)
+    with open(path, "w", encoding="utf-8") as file:
+        file.write("\n".join(lines) + "\n")
+    return path
+
+
+def jsonl_books(count):
+    return [
+        json.dumps(
+            {"title": f"Book {i}", "description": "Dragons", "author": "Author"}
+        )
+        for i in range(1, count + 1)
+    ]
+
+
+def interrupt_after_first_chunk(progress):
+    raise ImportInterrupted
+
+
+def index_names(db_path):
+    with sqlite3.connect(db_path) as connection:
+        return {
+            row[0]
+            for row in connection.execute(
+                "SELECT name FROM sqlite_master "
+                "WHERE type IN ('index', 'trigger') AND tbl_name = 'books'"
+            )
+        }
+
+
+class TestImportBooks:
+    def test_import_books_from_csv_inserts_valid_rows(self, temp_dir, temp_db):
+        # Arrange
+        path = write_file(
+            temp_dir,
+            "books.csv",
+            [
+                "id,title,description,author",
+                "7,Dune,Desert planet,Frank Herbert",
+                '8,"Hyperion, Book One",,Dan Simmons',
+            ],
+        )
+
+        # Act
+        progress = import_books(path, db_path=temp_db)
+
+        # Assert
+        books = SQLiteBookRepository(db_path=temp_db).all_books()
+        assert [(book.id, book.title) for book in books] == [
+            (1, "Dune"),
+            (2, "Hyperion, Book One"),
+        ]
+        assert books[1].description == ""
+        assert progress.rows == 2
+        assert progress.inserted == 2
+        assert progress.finished is True
+
+    def test_import_books_rejects_rows_new_book_would_reject(
+        self, temp_dir, temp_db
+    ):
+        # Arrange
+        path = write_file(
+            temp_dir,
+            "books.jsonl",
+            [
+                json.dumps({"title": "Dune", "author": "Frank Herbert"}),
+                json.dumps({"title": 3, "author": "Author"}),
+                "{not json",
+                json.dumps(["Dune", "Frank Herbert"]),
+                json.dumps({"title": "No author"}),
+            ],
+        )
+        errors = []
+
+        # Act
+        progress = import_books(path, db_path=temp_db, on_error=errors.append)
+
+        # Assert
+        assert [(error.index, error.message) for error in errors] == [
+            (2, "Book title needs to be text"),
+            (3, "Row needs to be valid JSON"),
+            (4, "Row needs to be a JSON object"),
+            (5, "Book author needs to be text"),
+        ]
+        assert progress.inserted == 1
+        assert progress.rejected == 4
+
+    def test_import_books_reports_progress_per_chunk(self, temp_dir, temp_db):
+        # Arrange
+        path = write_file(temp_dir, "books.jsonl", jsonl_books(5))
+        reported = []
+
+        # Act
+        import_books(
+            path,
+            db_path=temp_db,
+            chunk_size=2,
+            on_progress=lambda progress: reported.append(progress.rows),
+        )
+
+        # Assert
+        assert reported == [2, 4, 5]
+
+    def test_import_books_with_rebuild_indexes_restores_indexes_and_search(
+        self, temp_dir, temp_db
+    ):
+        # Arrange
+        path = write_file(temp_dir, "books.jsonl", jsonl_books(3))
+        indexes_before = index_names(temp_db)
+
+        # Act
+        import_books(path, db_path=temp_db, chunk_size=2, rebuild_indexes=True)
+
+        # Assert
+        repository = SQLiteBookRepository(db_path=temp_db)
+        assert index_names(temp_db) == indexes_before
+        assert len(repository.search_books("dragons", limit=10, offset=0)) == 3
+        assert len(repository.book_changes(since=0, limit=10)) == 3
+
+    def test_import_books_resumes_after_last_committed_chunk(
+        self, temp_dir, temp_db
+    ):
+        # Arrange
+        path = write_file(temp_dir, "books.jsonl", jsonl_books(5))
+        with pytest.raises(ImportInterrupted):
+            import_books(
+                path,
+                db_path=temp_db,
+                chunk_size=2,
+                on_progress=interrupt_after_first_chunk,
+            )
+
+        # Act
+        progress = import_books(path, db_path=temp_db, chunk_size=2, resume=True)
+
+        # Assert
+        books = SQLiteBookRepository(db_path=temp_db).all_books()
+        assert [book.title for book in books] == [f"Book {i}" for i in range(1, 6)]
+        assert progress.resumed_rows == 2
+        assert progress.rows == 5
+        assert progress.inserted == 5
+
+    def test_import_books_resume_rebuilds_indexes_dropped_by_interrupted_run(
+        self, temp_dir, temp_db
+    ):
+        # Arrange
+        path = write_file(temp_dir, "books.jsonl", jsonl_books(3))
+        indexes_before = index_names(temp_db)
+        with pytest.raises(ImportInterrupted):
+            import_books(
+                path,
+                db_path=temp_db,
+                chunk_size=2,
+                rebuild_indexes=True,
+                on_progress=interrupt_after_first_chunk,
+            )
+
+        # Act
+        import_books(path, db_path=temp_db, chunk_size=2, resume=True)
+
+        # Assert
+        repository = SQLiteBookRepository(db_path=temp_db)
+        assert index_names(temp_db) == indexes_before
+        assert len(repository.search_books("dragons", limit=10, offset=0)) == 3
+
+    def test_import_books_resume_of_finished_import_inserts_nothing(
+        self, temp_dir, temp_db
+    ):
+        # Arrange
+        path = write_file(temp_dir, "books.jsonl", jsonl_books(2))
+        import_books(path, db_path=temp_db)
+
+        # Act
+        progress = import_books(path, db_path=temp_db, resume=True)
+
+        # Assert
+        assert len(SQLiteBookRepository(db_path=temp_db).all_books()) == 2
+        assert progress.finished is True
+        assert progress.resumed_rows == 2
+
+    def test_import_books_with_csv_missing_author_column_raises_error(
+        self, temp_dir, temp_db
+    ):
+        # Arrange
+        path = write_file(temp_dir, "books.csv", ["title,description", "Dune,"])
+
+        # Act and Assert
+        with pytest.raises(BookImportError, match="missing the author column"):
+            import_books(path, db_path=temp_db)
+
+    def test_import_books_with_unknown_extension_raises_error(
+        self, temp_dir, temp_db
+    ):
+        # Arrange
+        path = write_file(temp_dir, "books.txt", jsonl_books(1))
+
+        # Act and Assert
+        with pytest.raises(BookImportError, match="Cannot tell the format"):
+            import_books(path, db_path=temp_db)
@@ -0,0 +1,161 @@
+import os
+import random
+import tempfile
+import threading
+
+import pytest
+
+from apps.books.memory import (
+    InMemoryBookRepository,
+    is_memory_url,
+    memory_source_path,
+)
+from apps.books.models import BookModel, NewBookModel
+from apps.books.repositories import SQLiteBookRepository
+from db.pool import close_connection_pools
+from db.setup import init_db
+
+
+@pytest.fixture
+def temp_db():
+    temp_dir = tempfile.mkdtemp()
+    db_path = os.path.join(temp_dir, "test.db")
+
+    init_db(db_path)
+
+    yield db_path
+
+    close_connection_pools()
+    for path in (db_path, f"{db_path}-wal", f"{db_path}-shm"):
+        if os.path.exists(path):
+            os.remove(path)
+    os.rmdir(temp_dir)
+
+
+def test_memory_url_parsing():
+    # Assert
+    assert is_memory_url("memory://")
+    assert not is_memory_url("db/dev.db")
+    assert memory_source_path("memory://") is None
+    assert memory_source_path("memory://db/dev.db") == "db/dev.db"
+
+
+class TestInMemoryBookRepository:
+    def test_load_keeps_ids_and_versions(self):
+        # Arrange
+        repository = InMemoryBookRepository()
+        book = BookModel(
+            id=41, title="Title", description="", author="Author", version=3, updated_at=1.5
+        )
+
+        # Act
+        repository.load([book])
+        created_book = repository.create_book("New", None, "Author")
+
+        # Assert
+        assert repository.book(41) == book
+        assert repository.book_version(41).version == 3
+        assert created_book.id == 42
+
+    def test_load_replaces_books_already_loaded(self):
+        # Arrange
+        repository = InMemoryBookRepository(
+            [
+                BookModel(id=2, title="Old", description="", author="Zed", version=1, updated_at=1.0),
+                BookModel(id=1, title="Other", description="", author="Amy", version=1, updated_at=1.0),
+            ]
+        )
+        replacement = BookModel(
+            id=2, title="New", description="", author="Amy", version=2, updated_at=2.0
+        )
+
+        # Act
+        repository.load([replacement])
+
+        # Assert
+        assert [book.id for book in repository.all_books()] == [1, 2]
+        assert [book.title for book in repository.books_page(None, 10, sort="title")] == ["New", "Other"]
+        assert [book.id for book in repository.books_page(None, 10, author="amy")] == [1, 2]
+        assert repository.search_books("old", limit=10, offset=0) == []
+        assert repository.search_books("new", limit=10, offset=0) == [replacement]
+        assert [change.operation for change in repository.book_changes(0, 10)] == [
+            "insert",
+            "insert",
+            "update",
+        ]
+
+    def test_can_be_hydrated_from_sqlite(self, temp_db):
+        # Arrange
+        sqlite_repository = SQLiteBookRepository(db_path=temp_db)
+        sqlite_repository.create_books(
+            [NewBookModel(title=f"Title {i}", author="Author") for i in range(5)]
+        )
+
+        # Act
+        repository = InMemoryBookRepository(sqlite_repository.iter_books(chunk_size=2))
+
+        # Assert
+        assert repository.all_books() == sqlite_repository.all_books()
+
+    def test_concurrent_writes_keep_indexes_consistent(self):
+        # Arrange
+        repository = InMemoryBookRepository()
+
+        def write(worker):
+            for i in range(200):
+                book = repository.create_book(f"Title {worker} {i}", None, f"Author {i % 3}")
+                if i % 2:
+                    repository.update_book(book.id, f"Renamed {worker} {i}", None, None)
+                if i % 5 == 0:
+                    repository.delete_book(book.id)
+
+        # Act
+        threads = [threading.Thread(target=write, args=(worker,)) for worker in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        # Assert
+        books = repository.all_books()
+        assert len(books) == 4 * 160
+        assert len({book.id for book in books}) == len(books)
+        by_title = repository.books_page(after_id=None, limit=10_000, sort="title")
+        assert sorted(book.id for book in by_title) == sorted(book.id for book in books)
+
+    def test_books_page_matches_sqlite_for_every_filter_and_sort(self, temp_db):
+        # Arrange
+        rng = random.Random(7)
+        new_books = [
+            NewBookModel(
+                title=rng.choice(["The ", "the ", "Tale ", ""]) + rng.choice("ABCab") * rng.randint(1, 3),
+                description="Description",
+                author=rng.choice(["Ann", "ann", "ANN", "Bob", "bob", "Carl"]),
+            )
+            for _ in range(120)
+        ]
+        sqlite_repository = SQLiteBookRepository(db_path=temp_db)
+        sqlite_repository.create_books(new_books)
+        repository = InMemoryBookRepository(sqlite_repository.all_books())
+
+        # Act & Assert
+        for sort in ["id", "title", "author"]:
+            for author in [None, "ann", "BOB"]:
+                for title_prefix in [None, "The", "Ta", "A"]:
+                    expected = []
+                    actual = []
+                    for repo, pages in ((sqlite_repository, expected), (repository, actual)):
+                        after_id = None
+                        while True:
+                            page = repo.books_page(
+                                after_id=after_id,
+                                limit=7,
+                                author=author,
+                                title_prefix=title_prefix,
+                                sort=sort,
+                            )
+                            pages.extend(book.id for book in page)
+                            if len(page) < 7:
+                                break
+                            after_id = page[-1].id
+                    assert actual == expected, (sort, author, title_prefix)
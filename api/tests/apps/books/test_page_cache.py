@@ -0,0 +1,121 @@
+import gzip
+
+from starlette.requests import Request
+
+from apps.books.models import BookModel, BookPageModel
+from apps.books.page_cache import (
+    BookPageCache,
+    accepts_gzip,
+    page_cache_metrics_collector,
+    render_books_page,
+)
+
+
+def make_page(count, next_after_id=None):
+    return BookPageModel(
+        books=[
+            BookModel(
+                id=id,
+                title=f"Title {id}",
+                description="Description",
+                author="Author",
+                version=1,
+                updated_at=float(id),
+            )
+            for id in range(1, count + 1)
+        ],
+        next_after_id=next_after_id,
+    )
+
+
+def request_accepting(accept_encoding):
+    return Request(
+        {
+            "type": "http",
+            "headers": [(b"accept-encoding", accept_encoding.encode())],
+        }
+    )
+
+
+class TestRenderBooksPage:
+    def test_render_books_page_compresses_bodies_over_min_size(self):
+        # Act
+        rendered = render_books_page(make_page(50, next_after_id=50), gzip_min_size=100)
+
+        # Assert
+        assert gzip.decompress(rendered.gzip_body) == rendered.body
+        assert len(rendered.gzip_body) < len(rendered.body)
+        assert rendered.updated_at == 50.0
+        assert rendered.next_after_id == 50
+        assert rendered.etag.startswith('W/"')
+
+    def test_render_books_page_leaves_small_bodies_uncompressed(self):
+        # Act
+        small = render_books_page(make_page(1), gzip_min_size=10_000)
+        uncompressed = render_books_page(make_page(50))
+
+        # Assert
+        assert small.gzip_body is None
+        assert uncompressed.gzip_body is None
+
+
+class TestAcceptsGzip:
+    def test_accepts_gzip_negotiates_accept_encoding(self):
+        # Act and Assert
+        assert accepts_gzip(request_accepting("gzip, deflate, br"))
+        assert accepts_gzip(request_accepting("br;q=1.0, GZIP;q=0.5"))
+        assert accepts_gzip(request_accepting("*"))
+        assert not accepts_gzip(request_accepting("gzip;q=0"))
+        assert not accepts_gzip(request_accepting("identity"))
+        assert not accepts_gzip(request_accepting(""))
+
+
+class TestBookPageCache:
+    def test_put_after_invalidate_is_ignored(self):
+        # Arrange
+        cache = BookPageCache(max_entries=10)
+        _, generation = cache.get("page")
+        cache.invalidate()
+
+        # Act
+        cache.put("page", render_books_page(make_page(1)), generation)
+
+        # Assert
+        page, _ = cache.get("page")
+        assert page is None
+        assert cache.stats().invalidations == 1
+
+    def test_least_recently_used_page_is_evicted(self):
+        # Arrange
+        cache = BookPageCache(max_entries=2)
+        rendered = render_books_page(make_page(1))
+        for key in ("first", "second"):
+            _, generation = cache.get(key)
+            cache.put(key, rendered, generation)
+        cache.get("first")
+
+        # Act
+        _, generation = cache.get("third")
+        cache.put("third", rendered, generation)
+
+        # Assert
+        assert cache.get("first")[0] is rendered
+        assert cache.get("second")[0] is None
+        assert cache.stats().size == 2
+
+    def test_metrics_collector_reports_page_cache_stats(self):
+        # Arrange
+        cache = BookPageCache(max_entries=10)
+        _, generation = cache.get("page")
+        cache.put("page", render_books_page(make_page(1)), generation)
+        cache.get("page")
+
+        # Act
+        lines = page_cache_metrics_collector(cache)()
+
+        # Assert
+        assert "# TYPE book_page_cache_hits_total counter" in lines
+        assert "book_page_cache_hits_total 1" in lines
+        assert "book_page_cache_misses_total 1" in lines
+        assert "book_page_cache_invalidations_total 0" in lines
+        assert "book_page_cache_entries 1" in lines
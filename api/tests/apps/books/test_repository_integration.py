@@ -3,41 +3,62 @@ import sqlite3
 import tempfile
 import os
 
-from apps.books.repositories import SQLiteBookRepository
+from apps.books.batching import BatchingBookRepository
+from apps.books.memory import InMemoryBookRepository
+from apps.books.models import NewBookModel
+from apps.books.repositories import SQLiteBookRepository, _books_page_query
+from apps.books.snapshot import SnapshotBookRepository
+from db.pool import close_connection_pools, get_connection_pool
+from db.setup import init_db
 
 @pytest.fixture
 def temp_db():
     temp_dir = tempfile.mkdtemp()
     db_path = os.path.join(temp_dir, "test.db")
 
-    with sqlite3.connect(db_path) as conn:
-        conn.execute("""
-            CREATE TABLE books(
-                id INTEGER PRIMARY KEY,
-                title TEXT,
-                description TEXT,
-                author TEXT
-            )
-        """)
-        conn.commit()
+    init_db(db_path)
 
     yield db_path
 
-    if os.path.exists(db_path):
-        os.remove(db_path)
+    close_connection_pools()
+    for path in (db_path, f"{db_path}-wal", f"{db_path}-shm"):
+        if os.path.exists(path):
+            os.remove(path)
     os.rmdir(temp_dir)
 
 
 @pytest.fixture
-def repository(temp_db):
+def sqlite_repository(temp_db):
     """Create a repository instance with temporary database"""
     return SQLiteBookRepository(db_path=temp_db)
 
 
-class TestSQLiteBookRepositoryIntegration:
-    def test_create_book_stores_in_database(self, repository, temp_db):
+@pytest.fixture(params=["sqlite", "memory", "snapshot", "batching"])
+def repository(request, temp_db):
+    """Every BookRepository implementation has to pass the same tests"""
+    if request.param == "memory":
+        return InMemoryBookRepository()
+    if request.param == "batching":
+        return BatchingBookRepository(
+            book_repository=SQLiteBookRepository(db_path=temp_db),
+            pool=get_connection_pool(temp_db),
+            max_batch_size=8,
+            max_wait_ms=0,
+        )
+    if request.param == "snapshot":
+        snapshot_repository = SnapshotBookRepository(
+            book_repository=SQLiteBookRepository(db_path=temp_db),
+            chunk_size=100,
+        )
+        snapshot_repository.load()
+        return snapshot_repository
+    return SQLiteBookRepository(db_path=temp_db)
+
+
+class TestBookRepositoryContract:
+    def test_create_book_stores_in_database(self, sqlite_repository, temp_db):
         # Act
-        book = repository.create_book(
+        book = sqlite_repository.create_book(
             title="Test Title",
             description="Test Description", 
             author="Test Author"
@@ -70,6 +91,45 @@ class TestSQLiteBookRepositoryIntegration:
         # Assert
         assert book.description == ""
 
+    def test_create_books_stores_all_books_in_one_call(self, repository):
+        # Arrange
+        existing_book = repository.create_book("Existing", "Description", "Author")
+        new_books = [
+            NewBookModel(title="Title 1", description="Description 1", author="Author 1"),
+            NewBookModel(title="Title 2", description=None, author="Author 2"),
+        ]
+
+        # Act
+        books = repository.create_books(new_books)
+
+        # Assert
+        assert [book.title for book in books] == ["Title 1", "Title 2"]
+        assert books[1].description == ""
+        assert all(book.id > existing_book.id for book in books)
+        assert len(repository.all_books()) == 3
+
+    def test_create_books_spanning_several_insert_batches_keeps_order(self, repository):
+        # Arrange
+        new_books = [
+            NewBookModel(title=f"Title {i}", description=None, author="Author")
+            for i in range(1203)
+        ]
+
+        # Act
+        books = repository.create_books(new_books)
+
+        # Assert
+        assert [book.title for book in books] == [book.title for book in new_books]
+        assert [book.id for book in books] == sorted(book.id for book in books)
+        assert len(repository.all_books()) == 1203
+
+    def test_create_books_with_empty_list_returns_empty_list(self, repository):
+        # Act
+        books = repository.create_books([])
+
+        # Assert
+        assert books == []
+
     def test_all_books_returns_empty_list_when_no_books(self, repository):
         # Act
         books = repository.all_books()
@@ -91,6 +151,200 @@ class TestSQLiteBookRepositoryIntegration:
         assert book1.id in book_ids
         assert book2.id in book_ids
 
+    def test_books_page_returns_books_after_id_in_order(self, repository):
+        # Arrange
+        books = [
+            repository.create_book(f"Title {i}", f"Description {i}", f"Author {i}")
+            for i in range(5)
+        ]
+
+        # Act
+        first_page = repository.books_page(after_id=None, limit=2)
+        second_page = repository.books_page(after_id=first_page[-1].id, limit=2)
+        last_page = repository.books_page(after_id=books[-1].id, limit=2)
+
+        # Assert
+        assert [book.id for book in first_page] == [books[0].id, books[1].id]
+        assert [book.id for book in second_page] == [books[2].id, books[3].id]
+        assert last_page == []
+
+    def test_books_page_filters_by_author_case_insensitively(self, repository):
+        # Arrange
+        book = repository.create_book("Title 1", "Description", "Ursula Le Guin")
+        other_book = repository.create_book("Title 2", "Description", "URSULA LE GUIN")
+        repository.create_book("Title 3", "Description", "Someone Else")
+
+        # Act
+        books = repository.books_page(after_id=None, limit=10, author="ursula le guin")
+
+        # Assert
+        assert [found.id for found in books] == [book.id, other_book.id]
+
+    def test_books_page_filters_by_title_prefix(self, repository):
+        # Arrange
+        book = repository.create_book("The Hobbit", "Description", "Author")
+        repository.create_book("Hobbit Tales", "Description", "Author")
+        repository.create_book("the lowercase", "Description", "Author")
+
+        # Act
+        books = repository.books_page(after_id=None, limit=10, title_prefix="The")
+
+        # Assert
+        assert [found.id for found in books] == [book.id]
+
+    def test_books_page_sorts_by_title_across_pages(self, repository):
+        # Arrange
+        for title in ["Charlie", "Alpha", "Bravo", "Alpha"]:
+            repository.create_book(title, "Description", "Author")
+
+        # Act
+        first_page = repository.books_page(after_id=None, limit=2, sort="title")
+        second_page = repository.books_page(after_id=first_page[-1].id, limit=2, sort="title")
+
+        # Assert
+        titles = [book.title for book in first_page + second_page]
+        assert titles == ["Alpha", "Alpha", "Bravo", "Charlie"]
+
+    def test_books_page_sorts_by_author_case_insensitively(self, repository):
+        # Arrange
+        for author in ["bob", "Alice", "carol"]:
+            repository.create_book("Title", "Description", author)
+
+        # Act
+        first_page = repository.books_page(after_id=None, limit=1, sort="author")
+        second_page = repository.books_page(after_id=first_page[-1].id, limit=5, sort="author")
+
+        # Assert
+        authors = [book.author for book in first_page + second_page]
+        assert authors == ["Alice", "bob", "carol"]
+
+    def test_books_page_continues_after_a_deleted_cursor_book(self, repository):
+        # Arrange
+        for title in ["Charlie", "Alpha", "Bravo", "Delta"]:
+            repository.create_book(title, "Description", "Author")
+        first_page = repository.books_page(after_id=None, limit=2, sort="title")
+        repository.delete_book(first_page[-1].id)
+
+        # Act
+        second_page = repository.books_page(
+            after_id=first_page[-1].id,
+            limit=5,
+            sort="title",
+            after_key=first_page[-1].title,
+        )
+
+        # Assert
+        assert [book.title for book in second_page] == ["Charlie", "Delta"]
+
+    def test_books_page_queries_never_scan_the_table(self, sqlite_repository, temp_db):
+        # Arrange
+        for i in range(50):
+            sqlite_repository.create_book(f"Title {i}", "Description", f"Author {i % 5}")
+        filters = [
+            {},
+            {"author": "author 1"},
+            {"title_prefix": "Title 1"},
+            {"author": "author 1", "title_prefix": "Title 1"},
+        ]
+
+        # Act
+        plans = []
+        with sqlite3.connect(temp_db) as conn:
+            for sort in ["id", "title", "author"]:
+                for filter in filters:
+                    for after_id in [None, 10]:
+                        query, params = _books_page_query(
+                            limit=10,
+                            after_id=after_id,
+                            after_key=None if sort == "id" else "Title 1",
+                            sort=sort,
+                            **filter,
+                        )
+                        plan = conn.execute(f"EXPLAIN QUERY PLAN {query}", params).fetchall()
+                        plans.append((query, [row[3] for row in plan]))
+
+        # Assert
+        for query, plan in plans:
+            assert "SCAN books" not in plan, query
+            if "title >= ?" in query:
+                assert "USING INTEGER PRIMARY KEY" not in plan[0], query
+
+    def test_iter_books_streams_all_books_in_chunks(self, repository):
+        # Arrange
+        books = [
+            repository.create_book(f"Title {i}", f"Description {i}", f"Author {i}")
+            for i in range(5)
+        ]
+
+        # Act
+        streamed_books = list(repository.iter_books(chunk_size=2))
+
+        # Assert
+        assert [book.id for book in streamed_books] == [book.id for book in books]
+
+    def test_search_books_ranks_best_matches_first(self, repository):
+        # Arrange
+        weak_match = repository.create_book("Cooking", "A chapter on dragons", "Author")
+        strong_match = repository.create_book("Dragons", "Dragons and more dragons", "Author")
+        repository.create_book("Gardening", "Nothing relevant", "Author")
+
+        # Act
+        books = repository.search_books("dragons", limit=10, offset=0)
+
+        # Assert
+        assert [book.id for book in books] == [strong_match.id, weak_match.id]
+
+    def test_search_books_matches_author_and_requires_all_words(self, repository):
+        # Arrange
+        book = repository.create_book("Title", "Description", "Ursula Le Guin")
+        repository.create_book("Title", "Description", "Ursula Someone")
+
+        # Act
+        books = repository.search_books("ursula guin", limit=10, offset=0)
+
+        # Assert
+        assert [found.id for found in books] == [book.id]
+
+    def test_search_books_follows_updates_and_deletes(self, repository):
+        # Arrange
+        updated_book = repository.create_book("Old Title", "Description", "Author")
+        deleted_book = repository.create_book("Old Title", "Description", "Author")
+
+        # Act
+        repository.update_book(updated_book.id, "New Title", None, None)
+        repository.delete_book(deleted_book.id)
+
+        # Assert
+        assert repository.search_books("old", limit=10, offset=0) == []
+        assert [book.id for book in repository.search_books("new", limit=10, offset=0)] == [updated_book.id]
+
+    def test_search_books_ignores_fts_syntax_in_query(self, repository):
+        # Arrange
+        book = repository.create_book("C++ Primer", "Description", "Author")
+
+        # Act
+        books = repository.search_books('primer" OR title:*', limit=10, offset=0)
+        no_words = repository.search_books("+-*", limit=10, offset=0)
+
+        # Assert
+        assert books == []
+        assert no_words == []
+        assert [found.id for found in repository.search_books("C++ primer", limit=10, offset=0)] == [book.id]
+
+    def test_search_books_paginates_with_offset(self, repository):
+        # Arrange
+        for i in range(3):
+            repository.create_book(f"Dragons {i}", "Description", "Author")
+
+        # Act
+        first_page = repository.search_books("dragons", limit=2, offset=0)
+        second_page = repository.search_books("dragons", limit=2, offset=2)
+
+        # Assert
+        assert len(first_page) == 2
+        assert len(second_page) == 1
+        assert {book.id for book in first_page}.isdisjoint(book.id for book in second_page)
+
     def test_book_returns_existing_book(self, repository):
         # Arrange
         created_book = repository.create_book("Test Title", "Test Description", "Test Author")
@@ -105,6 +359,25 @@ class TestSQLiteBookRepositoryIntegration:
         assert retrieved_book.description == created_book.description
         assert retrieved_book.author == created_book.author
 
+    def test_books_by_ids_keeps_requested_order_and_skips_missing(self, repository):
+        # Arrange
+        first = repository.create_book("First", "Description", "Author")
+        second = repository.create_book("Second", "Description", "Author")
+
+        # Act
+        books = repository.books_by_ids([second.id, 999, first.id])
+
+        # Assert
+        assert [book.id for book in books] == [second.id, first.id]
+        assert books[0].title == "Second"
+
+    def test_books_by_ids_with_empty_list_returns_empty_list(self, repository):
+        # Act
+        books = repository.books_by_ids([])
+
+        # Assert
+        assert books == []
+
     def test_book_returns_none_for_nonexistent_id(self, repository):
         # Act
         book = repository.book(999)
@@ -131,6 +404,38 @@ class TestSQLiteBookRepositoryIntegration:
         assert updated_book.description == "Updated Description"
         assert updated_book.author == "Updated Author"
 
+    def test_update_book_bumps_version(self, repository):
+        # Arrange
+        created_book = repository.create_book("Original Title", "Original Description", "Original Author")
+
+        # Act
+        updated_book = repository.update_book(
+            id=created_book.id,
+            title="Updated Title",
+            description=None,
+            author=None
+        )
+
+        # Assert
+        assert created_book.version == 1
+        assert created_book.updated_at > 0
+        assert updated_book.version == 2
+        assert updated_book.updated_at >= created_book.updated_at
+
+    def test_book_version_returns_version_without_row(self, repository):
+        # Arrange
+        created_book = repository.create_book("Test Title", "Test Description", "Test Author")
+
+        # Act
+        version = repository.book_version(created_book.id)
+        missing_version = repository.book_version(999)
+
+        # Assert
+        assert version.id == created_book.id
+        assert version.version == created_book.version
+        assert version.updated_at == created_book.updated_at
+        assert missing_version is None
+
     def test_update_book_updates_partial_fields(self, repository):
         # Arrange
         created_book = repository.create_book("Original Title", "Original Description", "Original Author")
@@ -177,18 +482,19 @@ class TestSQLiteBookRepositoryIntegration:
         # Assert
         assert result is None
 
-    def test_delete_book_removes_from_database(self, repository, temp_db):
+    def test_delete_book_removes_from_database(self, sqlite_repository, temp_db):
         # Arrange
-        created_book = repository.create_book("Test Title", "Test Description", "Test Author")
+        created_book = sqlite_repository.create_book("Test Title", "Test Description", "Test Author")
 
         # Verify book exists
-        assert repository.book(created_book.id) is not None
+        assert sqlite_repository.book(created_book.id) is not None
 
         # Act
-        repository.delete_book(created_book.id)
+        deleted = sqlite_repository.delete_book(created_book.id)
 
         # Assert
-        assert repository.book(created_book.id) is None
+        assert deleted is True
+        assert sqlite_repository.book(created_book.id) is None
 
         # Verify directly in database
         with sqlite3.connect(temp_db) as conn:
@@ -197,6 +503,78 @@ class TestSQLiteBookRepositoryIntegration:
             db_book = result.fetchone()
             assert db_book is None
 
-    def test_delete_book_with_nonexistent_id_does_not_error(self, repository):
-        # Act & Assert (should not raise exception)
-        repository.delete_book(999)
+    def test_delete_book_with_nonexistent_id_returns_false(self, repository):
+        # Act
+        deleted = repository.delete_book(999)
+
+        # Assert
+        assert deleted is False
+
+    def test_book_changes_records_every_write_in_order(self, repository):
+        # Arrange
+        book = repository.create_book("Dune", "Description", "Frank Herbert")
+        repository.update_book(book.id, "Dune Messiah", None, None)
+        repository.delete_book(book.id)
+
+        # Act
+        changes = repository.book_changes(since=0, limit=10)
+
+        # Assert
+        assert [change.seq for change in changes] == [1, 2, 3]
+        assert [change.operation for change in changes] == [
+            "insert",
+            "update",
+            "delete",
+        ]
+        assert all(change.id == book.id for change in changes)
+        assert changes[0].changed_at <= changes[2].changed_at
+
+    def test_book_changes_carry_current_book_or_none_once_deleted(self, repository):
+        # Arrange
+        kept = repository.create_book("Kept", "Description", "Author")
+        deleted = repository.create_book("Deleted", "Description", "Author")
+        repository.update_book(kept.id, "Kept Again", None, None)
+        repository.delete_book(deleted.id)
+
+        # Act
+        changes = repository.book_changes(since=0, limit=10)
+
+        # Assert
+        books_by_seq = {change.seq: change.book for change in changes}
+        assert books_by_seq[1].title == "Kept Again"
+        assert books_by_seq[1].version == 2
+        assert books_by_seq[2] is None
+        assert books_by_seq[4] is None
+
+    def test_book_changes_never_join_a_book_created_after_a_delete(self, repository):
+        # Arrange
+        old = repository.create_book("Old", "Description", "Author")
+        repository.delete_book(old.id)
+        new = repository.create_book("New", "Description", "Author")
+
+        # Act
+        changes = repository.book_changes(since=0, limit=10)
+
+        # Assert
+        assert new.id != old.id
+        assert [(change.id, change.operation) for change in changes] == [
+            (old.id, "insert"),
+            (old.id, "delete"),
+            (new.id, "insert"),
+        ]
+        assert [change.book for change in changes] == [None, None, new]
+
+    def test_book_changes_pages_with_since_and_limit(self, repository):
+        # Arrange
+        for index in range(5):
+            repository.create_book(f"Book {index}", "Description", "Author")
+
+        # Act
+        first_page = repository.book_changes(since=0, limit=2)
+        second_page = repository.book_changes(since=first_page[-1].seq, limit=10)
+        last_page = repository.book_changes(since=second_page[-1].seq, limit=10)
+
+        # Assert
+        assert [change.seq for change in first_page] == [1, 2]
+        assert [change.seq for change in second_page] == [3, 4, 5]
+        assert last_page == []
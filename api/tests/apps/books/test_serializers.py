@@ -0,0 +1,48 @@
+import json
+
+from apps.books.dtos import GetBookResponseDto, ListBookResponseDto
+from apps.books.models import BookModel
+from apps.books.serializers import render_book, render_books
+
+
+def make_book(id):
+    return BookModel(
+        id=id,
+        title=f"Title {id} ü",
+        description="Description",
+        author="Author",
+        version=3,
+        updated_at=1700000000.5,
+    )
+
+
+def test_render_book_matches_response_dto():
+    # Arrange
+    book = make_book(1)
+
+    # Act
+    rendered = render_book(book)
+
+    # Assert
+    assert rendered == GetBookResponseDto(**book.model_dump()).model_dump_json().encode()
+
+
+def test_render_books_matches_list_response_dtos():
+    # Arrange
+    books = [make_book(1), make_book(2)]
+
+    # Act
+    rendered = render_books(books)
+
+    # Assert
+    assert json.loads(rendered) == [
+        ListBookResponseDto(**book.model_dump()).model_dump() for book in books
+    ]
+
+
+def test_render_books_leaves_out_internal_fields():
+    # Act
+    rendered = json.loads(render_books([make_book(1)]))
+
+    # Assert
+    assert set(rendered[0]) == {"id", "title", "description", "author"}
@@ -1,12 +1,25 @@
+import asyncio
 import pytest
 
+from apps.books.models import BookChangeModel, BookModel, BookPageModel, NewBookModel
+from apps.books.page_cache import BookPageCache, render_books_page
 from apps.books.services import (
+    AsyncBookService,
     BookService,
+    InvalidBookBatchSizeValueError,
+    InvalidBookChangesSinceValueError,
     InvalidBookIdValueError,
+    InvalidBookPageLimitValueError,
+    InvalidBookSearchOffsetValueError,
+    InvalidBookSearchQueryValueError,
+    InvalidBookPageCursorValueError,
+    InvalidBookSortValueError,
     InvalidBookTitleValueError,
     InvalidBookDescriptionValueError,
     InvalidBookAuthorValueError,
 )
+from config.settings import get_settings
+from db.executor import DatabaseExecutor
 
 from tests.config import mock_book_repository
 
@@ -34,6 +47,61 @@ def test_book_with_invalid_id_raises_error(mock_book_repository):
         with pytest.raises(InvalidBookIdValueError, match="Book ID needs to be a non negative integer"):
             service.book(id=invalid_id)
 
+def test_lookup_books_deduplicates_ids_and_reports_missing(mock_book_repository):
+    # Arrange
+    service = BookService(book_repository=mock_book_repository)
+    book = BookModel(id=3, title="Title", description="Description", author="Author")
+    mock_book_repository.books_by_ids.return_value = [book]
+
+    # Act
+    result = service.lookup_books(ids=[3, 7, 3])
+
+    # Assert
+    mock_book_repository.books_by_ids.assert_called_once_with(ids=[3, 7])
+    assert result.books == [book]
+    assert result.missing_ids == [7]
+
+def test_lookup_books_with_invalid_id_raises_error(mock_book_repository):
+    # Arrange
+    service = BookService(book_repository=mock_book_repository)
+    invalid_ids = [-1, "string", None, 3.14, True, False]
+
+    # Act and Assert
+    for invalid_id in invalid_ids:
+        with pytest.raises(InvalidBookIdValueError, match="Book ID needs to be a non negative integer"):
+            service.lookup_books(ids=[1, invalid_id])
+    mock_book_repository.books_by_ids.assert_not_called()
+
+def test_lookup_books_with_empty_or_oversized_list_raises_error(mock_book_repository):
+    # Arrange
+    service = BookService(book_repository=mock_book_repository)
+    too_many_ids = list(range(get_settings().books_lookup_max_ids + 1))
+
+    # Act and Assert
+    for ids in ([], too_many_ids):
+        with pytest.raises(InvalidBookBatchSizeValueError):
+            service.lookup_books(ids=ids)
+
+def test_book_version_with_valid_id(mock_book_repository):
+    # Arrange
+    service = BookService(book_repository=mock_book_repository)
+
+    # Act
+    service.book_version(id=1)
+
+    # Assert
+    mock_book_repository.book_version.assert_called_once_with(id=1)
+
+def test_book_version_with_invalid_id_raises_error(mock_book_repository):
+    # Arrange
+    service = BookService(book_repository=mock_book_repository)
+    invalid_ids = [-1, "string", None, 3.14, True, False]
+
+    # Act and Assert
+    for invalid_id in invalid_ids:
+        with pytest.raises(InvalidBookIdValueError, match="Book ID needs to be a non negative integer"):
+            service.book_version(id=invalid_id)
+
 def test_new_book_with_valid_title_description_author(mock_book_repository):
     # Arrange
     service = BookService(book_repository=mock_book_repository)
@@ -53,6 +121,29 @@ def test_new_book_with_valid_title_description_author(mock_book_repository):
     # Assert
     mock_book_repository.create_book.call_count == len(valid_book_entries)
 
+def test_writes_invalidate_the_page_cache(mock_book_repository):
+    # Arrange
+    page_cache = BookPageCache(max_entries=10)
+    service = BookService(book_repository=mock_book_repository, page_cache=page_cache)
+    mock_book_repository.create_books.return_value = []
+    writes = [
+        lambda: service.new_book(title="Title", description=None, author="Author"),
+        lambda: service.new_books(books=[NewBookModel(title="Title", description=None, author="Author")]),
+        lambda: service.update_book(id=1, title="New", description=None, author=None),
+        lambda: service.remove_book(id=1),
+    ]
+
+    for write in writes:
+        _, generation = page_cache.get("page")
+        page_cache.put("page", render_books_page(BookPageModel(books=[])), generation)
+
+        # Act
+        write()
+
+        # Assert
+        assert page_cache.get("page")[0] is None
+    assert page_cache.stats().invalidations == len(writes)
+
 def test_new_book_with_invalid_title(mock_book_repository):
     # Arrange
     service = BookService(book_repository=mock_book_repository)
@@ -95,6 +186,73 @@ def test_new_book_with_invalid_author(mock_book_repository):
                 author=invalid_author
             )
 
+def test_new_books_creates_valid_books_in_one_call(mock_book_repository):
+    # Arrange
+    service = BookService(book_repository=mock_book_repository)
+    books = [
+        NewBookModel(title="Title 1", description="Description 1", author="Author 1"),
+        NewBookModel(title="Title 2", description=None, author="Author 2"),
+    ]
+    mock_book_repository.create_books.return_value = []
+
+    # Act
+    result = service.new_books(books=books)
+
+    # Assert
+    mock_book_repository.create_books.assert_called_once_with(books=books)
+    assert result.errors == []
+
+def test_new_books_reports_invalid_books_by_index(mock_book_repository):
+    # Arrange
+    service = BookService(book_repository=mock_book_repository)
+    valid_book = NewBookModel(title="Title", description=None, author="Author")
+    invalid_book = NewBookModel.model_construct(title=3, description=None, author="Author")
+    mock_book_repository.create_books.return_value = []
+
+    # Act
+    result = service.new_books(books=[valid_book, invalid_book])
+
+    # Assert
+    mock_book_repository.create_books.assert_called_once_with(books=[valid_book])
+    assert len(result.errors) == 1
+    assert result.errors[0].index == 1
+    assert result.errors[0].message == "Book title needs to be text"
+
+def test_new_books_validates_raw_items_one_by_one(mock_book_repository):
+    # Arrange
+    service = BookService(book_repository=mock_book_repository)
+    mock_book_repository.create_books.return_value = []
+    items = [
+        {"title": "Title", "author": "Author"},
+        "not a book",
+        {"title": "Title"},
+        {"title": "Title", "description": 5, "author": "Author"},
+    ]
+
+    # Act
+    result = service.new_books(books=items)
+
+    # Assert
+    mock_book_repository.create_books.assert_called_once_with(
+        books=[NewBookModel(title="Title", description=None, author="Author")]
+    )
+    assert [(error.index, error.message) for error in result.errors] == [
+        (1, "Book needs to be a JSON object"),
+        (2, "Book author needs to be text"),
+        (3, "Book description needs to be text"),
+    ]
+
+def test_new_books_with_invalid_batch_size_raises_error(mock_book_repository):
+    # Arrange
+    service = BookService(book_repository=mock_book_repository)
+    book = NewBookModel(title="Title", description=None, author="Author")
+    invalid_batches = [[], [book] * 100000]
+
+    # Act and Assert
+    for invalid_batch in invalid_batches:
+        with pytest.raises(InvalidBookBatchSizeValueError, match="Book batch needs to contain between 1 and"):
+            service.new_books(books=invalid_batch)
+
 def test_all_books(mock_book_repository):
     # Arrange
     service = BookService(book_repository=mock_book_repository)
@@ -105,6 +263,200 @@ def test_all_books(mock_book_repository):
     # Assert
     mock_book_repository.all_books.assert_called_once()
 
+def test_books_page_requests_one_extra_book(mock_book_repository):
+    # Arrange
+    service = BookService(book_repository=mock_book_repository)
+    mock_book_repository.books_page.return_value = []
+
+    # Act
+    service.books_page(after_id=10, limit=5, author="Author", title_prefix="The", sort="title")
+
+    # Assert
+    mock_book_repository.books_page.assert_called_once_with(
+        after_id=10, limit=6, author="Author", title_prefix="The", sort="title", after_key=None
+    )
+
+def test_books_page_sets_next_cursor_when_more_books_exist(mock_book_repository):
+    # Arrange
+    service = BookService(book_repository=mock_book_repository)
+    mock_book_repository.books_page.return_value = [
+        BookModel(id=i, title="Title", description="Description", author="Author")
+        for i in range(1, 4)
+    ]
+
+    # Act
+    page = service.books_page(after_id=None, limit=2)
+
+    # Assert
+    assert [book.id for book in page.books] == [1, 2]
+    assert page.next_after_id == 2
+
+def test_books_page_puts_the_sort_key_in_the_next_cursor(mock_book_repository):
+    # Arrange
+    service = BookService(book_repository=mock_book_repository)
+    mock_book_repository.books_page.return_value = [
+        BookModel(id=i, title=f"Title {i}", description="Description", author=f"Author {i}")
+        for i in range(1, 4)
+    ]
+
+    # Act
+    by_id = service.books_page(after_id=None, limit=2)
+    by_title = service.books_page(after_id=None, limit=2, sort="title")
+    by_author = service.books_page(after_id=None, limit=2, sort="author")
+
+    # Assert
+    assert by_id.next_after_key is None
+    assert by_title.next_after_key == "Title 2"
+    assert by_author.next_after_key == "Author 2"
+
+def test_books_page_with_invalid_cursor_key_raises_error(mock_book_repository):
+    # Arrange
+    service = BookService(book_repository=mock_book_repository)
+    invalid_cursors = [(None, "Title"), (10, 1)]
+
+    # Act and Assert
+    for after_id, after_key in invalid_cursors:
+        with pytest.raises(InvalidBookPageCursorValueError):
+            service.books_page(after_id=after_id, limit=10, sort="title", after_key=after_key)
+    mock_book_repository.books_page.assert_not_called()
+
+def test_books_page_has_no_next_cursor_on_last_page(mock_book_repository):
+    # Arrange
+    service = BookService(book_repository=mock_book_repository)
+    mock_book_repository.books_page.return_value = [
+        BookModel(id=1, title="Title", description="Description", author="Author")
+    ]
+
+    # Act
+    page = service.books_page(after_id=None, limit=2)
+
+    # Assert
+    assert len(page.books) == 1
+    assert page.next_after_id is None
+
+def test_books_page_with_invalid_sort_raises_error(mock_book_repository):
+    # Arrange
+    service = BookService(book_repository=mock_book_repository)
+    invalid_sorts = ["description", "", None, 1]
+
+    # Act and Assert
+    for invalid_sort in invalid_sorts:
+        with pytest.raises(InvalidBookSortValueError, match="Books can only be sorted by id, title, author"):
+            service.books_page(after_id=None, limit=10, sort=invalid_sort)
+
+def test_books_page_with_invalid_filters_raises_error(mock_book_repository):
+    # Arrange
+    service = BookService(book_repository=mock_book_repository)
+
+    # Act and Assert
+    with pytest.raises(InvalidBookAuthorValueError, match="Book author needs to be text"):
+        service.books_page(after_id=None, limit=10, author=3)
+    with pytest.raises(InvalidBookTitleValueError, match="Book title needs to be text"):
+        service.books_page(after_id=None, limit=10, title_prefix=["The"])
+
+def test_books_page_with_invalid_after_id_raises_error(mock_book_repository):
+    # Arrange
+    service = BookService(book_repository=mock_book_repository)
+    invalid_ids = [-1, "string", 3.14, True, False]
+
+    # Act and Assert
+    for invalid_id in invalid_ids:
+        with pytest.raises(InvalidBookIdValueError, match="Book ID needs to be a non negative integer"):
+            service.books_page(after_id=invalid_id, limit=10)
+
+def test_books_page_with_invalid_limit_raises_error(mock_book_repository):
+    # Arrange
+    service = BookService(book_repository=mock_book_repository)
+    invalid_limits = [0, -1, 100000, "10", None, 3.14, True]
+
+    # Act and Assert
+    for invalid_limit in invalid_limits:
+        with pytest.raises(InvalidBookPageLimitValueError, match="Page limit needs to be an integer"):
+            service.books_page(after_id=None, limit=invalid_limit)
+
+def test_search_books_sets_next_offset_when_more_books_exist(mock_book_repository):
+    # Arrange
+    service = BookService(book_repository=mock_book_repository)
+    mock_book_repository.search_books.return_value = [
+        BookModel(id=i, title="Title", description="Description", author="Author")
+        for i in range(1, 4)
+    ]
+
+    # Act
+    page = service.search_books(query="title", limit=2, offset=4)
+
+    # Assert
+    mock_book_repository.search_books.assert_called_once_with(query="title", limit=3, offset=4)
+    assert [book.id for book in page.books] == [1, 2]
+    assert page.next_offset == 6
+
+def test_search_books_with_invalid_query_raises_error(mock_book_repository):
+    # Arrange
+    service = BookService(book_repository=mock_book_repository)
+    invalid_queries = ["", "   ", None, 3, True]
+
+    # Act and Assert
+    for invalid_query in invalid_queries:
+        with pytest.raises(InvalidBookSearchQueryValueError, match="Search query needs to be non blank text"):
+            service.search_books(query=invalid_query, limit=10, offset=0)
+
+def test_search_books_with_invalid_offset_raises_error(mock_book_repository):
+    # Arrange
+    service = BookService(book_repository=mock_book_repository)
+    invalid_offsets = [-1, "0", None, 3.14, True]
+
+    # Act and Assert
+    for invalid_offset in invalid_offsets:
+        with pytest.raises(InvalidBookSearchOffsetValueError, match="Search offset needs to be a non negative integer"):
+            service.search_books(query="title", limit=10, offset=invalid_offset)
+
+def test_book_changes_sets_next_since_to_last_seq(mock_book_repository):
+    # Arrange
+    service = BookService(book_repository=mock_book_repository)
+    mock_book_repository.book_changes.return_value = [
+        BookChangeModel(seq=seq, id=1, operation="update", changed_at=0)
+        for seq in (6, 7)
+    ]
+
+    # Act
+    page = service.book_changes(since=5, limit=2)
+
+    # Assert
+    mock_book_repository.book_changes.assert_called_once_with(since=5, limit=2)
+    assert page.next_since == 7
+
+def test_book_changes_keeps_since_when_no_changes(mock_book_repository):
+    # Arrange
+    service = BookService(book_repository=mock_book_repository)
+    mock_book_repository.book_changes.return_value = []
+
+    # Act
+    page = service.book_changes(since=5, limit=2)
+
+    # Assert
+    assert page.changes == []
+    assert page.next_since == 5
+
+def test_book_changes_with_invalid_since_raises_error(mock_book_repository):
+    # Arrange
+    service = BookService(book_repository=mock_book_repository)
+    invalid_positions = [-1, "0", None, 3.14, True]
+
+    # Act and Assert
+    for invalid_position in invalid_positions:
+        with pytest.raises(InvalidBookChangesSinceValueError, match="Change feed position needs to be a non negative integer"):
+            service.book_changes(since=invalid_position, limit=10)
+
+def test_export_books(mock_book_repository):
+    # Arrange
+    service = BookService(book_repository=mock_book_repository)
+
+    # Act
+    service.export_books()
+
+    # Assert
+    mock_book_repository.iter_books.assert_called_once()
+
 def test_update_book_with_valid_id_and_fields(mock_book_repository):
     # Arrange
     service = BookService(book_repository=mock_book_repository)
@@ -188,10 +540,13 @@ def test_remove_book_with_valid_id(mock_book_repository):
     # Arrange
     service = BookService(book_repository=mock_book_repository)
 
+    mock_book_repository.delete_book.return_value = True
+
     # Act
-    service.remove_book(id=1)
+    result = service.remove_book(id=1)
 
     # Assert
+    assert result is True
     mock_book_repository.delete_book.assert_called_once_with(id=1)
 
 def test_remove_book_with_invalid_id_raises_error(mock_book_repository):
@@ -203,3 +558,35 @@ def test_remove_book_with_invalid_id_raises_error(mock_book_repository):
     for invalid_id in invalid_ids:
         with pytest.raises(InvalidBookIdValueError, match="Book ID needs to be a non negative integer"):
             service.remove_book(id=invalid_id)
+
+def test_async_book_service_runs_on_database_executor(mock_book_repository):
+    # Arrange
+    executor = DatabaseExecutor(max_workers=1)
+    service = AsyncBookService(
+        book_service=BookService(book_repository=mock_book_repository),
+        executor=executor,
+    )
+    mock_book_repository.book.return_value = BookModel(
+        id=1, title="Title", description="Description", author="Author"
+    )
+
+    # Act
+    book = asyncio.run(service.book(id=1))
+    executor.shutdown()
+
+    # Assert
+    assert book.id == 1
+    mock_book_repository.book.assert_called_once_with(id=1)
+
+def test_async_book_service_propagates_business_rule_errors(mock_book_repository):
+    # Arrange
+    executor = DatabaseExecutor(max_workers=1)
+    service = AsyncBookService(
+        book_service=BookService(book_repository=mock_book_repository),
+        executor=executor,
+    )
+
+    # Act and Assert
+    with pytest.raises(InvalidBookIdValueError, match="Book ID needs to be a non negative integer"):
+        asyncio.run(service.remove_book(id=-1))
+    executor.shutdown()
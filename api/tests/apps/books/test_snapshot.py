@@ -0,0 +1,304 @@
+import bisect
+import random
+import threading
+from unittest.mock import Mock
+
+import pytest
+
+from apps.books import snapshot as snapshot_module
+from apps.books.models import BookModel
+from apps.books.repositories import BookRepository
+from apps.books.snapshot import (
+    BookBuckets,
+    BookSnapshot,
+    SnapshotBookRepository,
+    SortedChunks,
+    snapshot_metrics_collector,
+)
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 100.0
+
+    def __call__(self):
+        return self.now
+
+
+def make_book(id, title="Title", version=1):
+    return BookModel(id=id, title=title, description="Description", author="Author", version=version)
+
+
+@pytest.fixture
+def clock():
+    return FakeClock()
+
+
+@pytest.fixture
+def book_repository():
+    book_repository = Mock(spec=BookRepository)
+    book_repository.iter_books.return_value = iter([make_book(1), make_book(2)])
+    return book_repository
+
+
+@pytest.fixture
+def snapshot_repository(book_repository, clock):
+    snapshot_repository = SnapshotBookRepository(
+        book_repository=book_repository, chunk_size=10, clock=clock
+    )
+    snapshot_repository.load()
+    return snapshot_repository
+
+
+class TestSortedChunks:
+    def test_changes_keep_order_across_chunk_splits_and_merges(self, monkeypatch):
+        # Arrange
+        monkeypatch.setattr(snapshot_module, "_CHUNK_SIZE", 4)
+        generator = random.Random(7)
+        expected = sorted(generator.sample(range(1000), 100))
+        chunks = SortedChunks.build(expected)
+
+        # Act
+        for _ in range(50):
+            removed = generator.sample(expected, 3) + [1000]
+            added = [value for value in generator.sample(range(1000), 5) if value not in expected]
+            chunks = chunks.with_changes(removed, added)
+            expected = sorted(set(expected) - set(removed) | set(added))
+
+        # Assert
+        assert list(chunks) == expected
+        assert len(chunks) == len(expected)
+        assert [chunks[position] for position in range(len(expected))] == expected
+        assert chunks[10:20] == expected[10:20]
+        assert chunks[-1] == expected[-1]
+        assert bisect.bisect_left(chunks, 500) == bisect.bisect_left(expected, 500)
+
+    def test_with_changes_shares_untouched_chunks(self, monkeypatch):
+        # Arrange
+        monkeypatch.setattr(snapshot_module, "_CHUNK_SIZE", 4)
+        chunks = SortedChunks.build(range(20))
+
+        # Act
+        changed = chunks.with_changes([18], [])
+
+        # Assert
+        assert list(chunks) == list(range(20))
+        assert all(old is new for old, new in zip(chunks.chunks[:-1], changed.chunks))
+
+
+def test_book_buckets_map_ids_to_books():
+    # Arrange
+    books = BookBuckets.build([make_book(1), make_book(5000)])
+
+    # Act
+    changed = books.with_changes([1], [make_book(2)])
+
+    # Assert
+    assert 1 in books and 1 not in changed
+    assert changed[2] == make_book(2)
+    assert changed.get(3) is None
+    assert sorted(changed) == [2, 5000]
+    assert len(books) == 2 and len(changed) == 2
+
+
+class TestBookSnapshot:
+    def test_with_changes_leaves_original_untouched(self):
+        # Arrange
+        snapshot = BookSnapshot.build([make_book(1), make_book(2)])
+
+        # Act
+        changed = snapshot.with_changes(upserted=[make_book(3), make_book(1, "New", 2)], deleted_ids=[2])
+
+        # Assert
+        assert list(snapshot.ids) == [1, 2]
+        assert snapshot.books[1].title == "Title"
+        assert list(changed.ids) == [1, 3]
+        assert changed.books[1].title == "New"
+        assert list(changed.titles) == [("New", 1), ("Title", 3)]
+
+    def test_with_changes_skips_upserts_older_than_the_book_held(self):
+        # Arrange
+        snapshot = BookSnapshot.build([make_book(1, "Current", 3)])
+
+        # Act
+        changed = snapshot.with_changes(upserted=[make_book(1, "Stale", 2)])
+        ignored = snapshot.with_changes(upserted=[make_book(2)], ignored_ids={2})
+
+        # Assert
+        assert changed is snapshot
+        assert ignored is snapshot
+        assert snapshot.books[1].title == "Current"
+
+    def test_memory_estimate_follows_changes(self):
+        # Arrange
+        snapshot = BookSnapshot.build([make_book(1)])
+
+        # Act
+        grown = snapshot.with_changes(upserted=[make_book(2)])
+        shrunk = grown.with_changes(deleted_ids=[2])
+
+        # Assert
+        assert snapshot.memory_bytes > 0
+        assert grown.memory_bytes > snapshot.memory_bytes
+        assert shrunk.memory_bytes == snapshot.memory_bytes
+
+
+class TestSnapshotBookRepository:
+    def test_reads_do_not_touch_wrapped_repository(self, snapshot_repository, book_repository):
+        # Act
+        page = snapshot_repository.books_page(after_id=None, limit=10)
+        book = snapshot_repository.book(id=2)
+        version = snapshot_repository.book_version(id=2)
+
+        # Assert
+        assert [found.id for found in page] == [1, 2]
+        assert book == make_book(2)
+        assert version.version == 1
+        book_repository.books_page.assert_not_called()
+        book_repository.book.assert_not_called()
+        book_repository.book_version.assert_not_called()
+
+    def test_reads_fall_back_until_loaded(self, book_repository):
+        # Arrange
+        snapshot_repository = SnapshotBookRepository(book_repository=book_repository, chunk_size=10)
+        book_repository.book.return_value = make_book(1)
+
+        # Act
+        book = snapshot_repository.book(id=1)
+
+        # Assert
+        assert book == make_book(1)
+        book_repository.book.assert_called_once_with(id=1)
+
+    def test_writes_swap_in_new_snapshot(self, snapshot_repository, book_repository):
+        # Arrange
+        book_repository.update_book.return_value = make_book(1, "Renamed", 2)
+        book_repository.delete_book.return_value = True
+        book_repository.create_book.return_value = make_book(3)
+
+        # Act
+        snapshot_repository.update_book(id=1, title="Renamed", description=None, author=None)
+        snapshot_repository.delete_book(id=2)
+        snapshot_repository.create_book(title="Title", description=None, author="Author")
+
+        # Assert
+        assert snapshot_repository.book(id=1).title == "Renamed"
+        assert snapshot_repository.book(id=2) is None
+        assert [book.id for book in snapshot_repository.all_books()] == [1, 3]
+
+    def test_failed_writes_leave_snapshot_unchanged(self, snapshot_repository, book_repository):
+        # Arrange
+        book_repository.update_book.return_value = None
+        book_repository.delete_book.return_value = False
+
+        # Act
+        snapshot_repository.update_book(id=9, title="Renamed", description=None, author=None)
+        snapshot_repository.delete_book(id=9)
+
+        # Assert
+        assert snapshot_repository.stats().updates == 0
+
+    def test_stats_report_size_and_age(self, snapshot_repository, book_repository, clock):
+        # Arrange
+        book_repository.delete_book.return_value = True
+        clock.now += 30
+        snapshot_repository.delete_book(id=1)
+        clock.now += 5
+
+        # Act
+        stats = snapshot_repository.stats()
+
+        # Assert
+        assert stats.books == 1
+        assert stats.memory_bytes > 0
+        assert stats.age_seconds == 35
+        assert stats.last_update_age_seconds == 5
+        assert stats.updates == 1
+
+    def test_metrics_collector_renders_gauges(self, snapshot_repository):
+        # Act
+        lines = snapshot_metrics_collector(snapshot_repository)()
+
+        # Assert
+        assert "# TYPE book_snapshot_books gauge" in lines
+        assert "book_snapshot_books 2" in lines
+        assert any(line.startswith("book_snapshot_memory_bytes ") for line in lines)
+
+    def test_writes_do_not_wait_for_each_other(self, snapshot_repository, book_repository):
+        # Arrange
+        started = threading.Event()
+        release = threading.Event()
+
+        def slow_create(title, description, author):
+            started.set()
+            release.wait(5)
+            return make_book(3)
+
+        book_repository.create_book.side_effect = slow_create
+        book_repository.delete_book.return_value = True
+        writer = threading.Thread(
+            target=snapshot_repository.create_book, args=("Title", None, "Author")
+        )
+        writer.start()
+        started.wait(5)
+
+        # Act
+        snapshot_repository.delete_book(id=2)
+        deleted_while_writing = snapshot_repository.book(id=2)
+        release.set()
+        writer.join(5)
+
+        # Assert
+        assert deleted_while_writing is None
+        assert [book.id for book in snapshot_repository.all_books()] == [1, 3]
+
+    def test_update_applied_after_a_later_delete_does_not_restore_book(
+        self, snapshot_repository, book_repository
+    ):
+        # Arrange
+        # The update commits first but is applied after the delete
+        committed = threading.Event()
+        release = threading.Event()
+
+        def update_then_stall(id, title, description, author):
+            committed.set()
+            release.wait(5)
+            return make_book(2, "Renamed", 2)
+
+        book_repository.update_book.side_effect = update_then_stall
+        book_repository.delete_book.return_value = True
+        updater = threading.Thread(
+            target=snapshot_repository.update_book, args=(2, "Renamed", None, None)
+        )
+        updater.start()
+        committed.wait(5)
+        snapshot_repository.delete_book(id=2)
+
+        # Act
+        release.set()
+        updater.join(5)
+
+        # Assert
+        assert snapshot_repository.book(id=2) is None
+        assert snapshot_repository.stats().books == 1
+
+    def test_writes_during_load_are_applied_to_new_snapshot(self, book_repository, clock):
+        # Arrange
+        snapshot_repository = SnapshotBookRepository(
+            book_repository=book_repository, chunk_size=10, clock=clock
+        )
+        book_repository.create_book.return_value = make_book(3)
+
+        def books_then_write(chunk_size):
+            yield make_book(1)
+            # Committed after the load read past it
+            snapshot_repository.create_book(title="Title", description=None, author="Author")
+            yield make_book(2)
+
+        book_repository.iter_books.side_effect = books_then_write
+
+        # Act
+        snapshot_repository.load()
+
+        # Assert
+        assert [book.id for book in snapshot_repository.all_books()] == [1, 2, 3]
@@ -0,0 +1,46 @@
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from apps.health.routes import router
+
+
+def health_client(ready):
+    app = FastAPI()
+    app.include_router(router)
+    app.state.ready = ready
+    return TestClient(app)
+
+
+class TestHealthRoutes:
+    def test_live_returns_ok(self):
+        # Arrange
+        client = health_client(ready=False)
+
+        # Act
+        response = client.get("/health/live")
+
+        # Assert
+        assert response.status_code == 200
+        assert response.json() == {"status": "ok"}
+
+    def test_ready_returns_503_until_app_is_ready(self):
+        # Arrange
+        client = health_client(ready=False)
+
+        # Act
+        response = client.get("/health/ready")
+
+        # Assert
+        assert response.status_code == 503
+        assert response.json() == {"status": "unavailable"}
+
+    def test_ready_returns_200_once_app_is_ready(self):
+        # Arrange
+        client = health_client(ready=True)
+
+        # Act
+        response = client.get("/health/ready")
+
+        # Assert
+        assert response.status_code == 200
+        assert response.json() == {"status": "ready"}
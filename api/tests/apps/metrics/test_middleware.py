@@ -0,0 +1,140 @@
+import logging
+import sqlite3
+
+from fastapi import FastAPI, HTTPException
+from fastapi.testclient import TestClient
+
+from apps.metrics.middleware import (
+    MetricsMiddleware,
+    QueryStatsMiddleware,
+    RequestLoggingMiddleware,
+    UNMATCHED_ROUTE,
+)
+from apps.metrics.registry import MetricsRegistry
+from db.tracing import TracingConnection
+
+
+def build_app(registry: MetricsRegistry) -> FastAPI:
+    app = FastAPI()
+    app.add_middleware(MetricsMiddleware, registry=registry)
+
+    @app.get("/books/{book_id}")
+    async def get_book(book_id: int):
+        if book_id == 0:
+            raise HTTPException(status_code=404)
+        return {"id": book_id}
+
+    return app
+
+
+class TestMetricsMiddleware:
+    def test_requests_are_labelled_by_route_template(self):
+        # Arrange
+        registry = MetricsRegistry()
+        client = TestClient(build_app(registry))
+
+        # Act
+        client.get("/books/1")
+        client.get("/books/2")
+        client.get("/books/0")
+
+        # Assert
+        requests = registry.counter("http_requests_total", "")
+        latency = registry.histogram("http_request_duration_seconds", "")
+        assert requests.value("GET", "/books/{book_id}", "200") == 2
+        assert requests.value("GET", "/books/{book_id}", "404") == 1
+        assert latency.count("GET", "/books/{book_id}") == 3
+
+    def test_unknown_paths_share_one_label(self):
+        # Arrange
+        registry = MetricsRegistry()
+        client = TestClient(build_app(registry))
+
+        # Act
+        client.get("/missing/1")
+        client.get("/missing/2")
+
+        # Assert
+        requests = registry.counter("http_requests_total", "")
+        assert requests.value("GET", UNMATCHED_ROUTE, "404") == 2
+
+    def test_in_progress_returns_to_zero(self):
+        # Arrange
+        registry = MetricsRegistry()
+        client = TestClient(build_app(registry))
+
+        # Act
+        client.get("/books/1")
+
+        # Assert
+        assert registry.gauge("http_requests_in_progress", "").value("GET") == 0
+
+
+class TestQueryStatsMiddleware:
+    def test_reports_query_count_and_time_headers(self):
+        # Arrange
+        app = FastAPI()
+        app.add_middleware(QueryStatsMiddleware)
+
+        @app.get("/titles")
+        def list_titles():
+            connection = sqlite3.connect(":memory:", factory=TracingConnection)
+            connection.execute("SELECT 1").fetchall()
+            connection.close()
+            return []
+
+        client = TestClient(app)
+
+        # Act
+        response = client.get("/titles")
+
+        # Assert
+        assert response.headers["x-db-query-count"] == "1"
+        assert float(response.headers["x-db-query-time-ms"]) >= 0
+
+
+class TestRequestLoggingMiddleware:
+    def build_app(self):
+        app = FastAPI()
+        app.add_middleware(RequestLoggingMiddleware, log_requests=True)
+
+        @app.get("/books/{book_id}")
+        async def get_book(book_id: int):
+            return {"id": book_id}
+
+        return app
+
+    def test_echoes_incoming_request_id(self):
+        # Arrange
+        client = TestClient(self.build_app())
+
+        # Act
+        response = client.get("/books/1", headers={"X-Request-ID": "abc123"})
+
+        # Assert
+        assert response.headers["x-request-id"] == "abc123"
+
+    def test_generates_request_id_when_missing(self):
+        # Arrange
+        client = TestClient(self.build_app())
+
+        # Act
+        first = client.get("/books/1")
+        second = client.get("/books/1")
+
+        # Assert
+        assert first.headers["x-request-id"]
+        assert first.headers["x-request-id"] != second.headers["x-request-id"]
+
+    def test_logs_completed_requests_with_duration(self, caplog):
+        # Arrange
+        client = TestClient(self.build_app())
+
+        # Act
+        with caplog.at_level(logging.INFO, logger="api.requests"):
+            client.get("/books/1")
+
+        # Assert
+        [record] = [r for r in caplog.records if r.name == "api.requests"]
+        assert record.getMessage() == "GET /books/1 200"
+        assert record.duration_ms >= 0
@@ -0,0 +1,105 @@
+import pytest
+
+from apps.metrics.registry import MetricsRegistry
+
+
+class TestMetricsRegistry:
+    def test_counter_renders_labelled_samples(self):
+        # Arrange
+        registry = MetricsRegistry()
+        counter = registry.counter("requests_total", "Requests.", ("route",))
+
+        # Act
+        counter.inc("/books")
+        counter.inc("/books", amount=2)
+        output = registry.render()
+
+        # Assert
+        assert "# HELP requests_total Requests." in output
+        assert "# TYPE requests_total counter" in output
+        assert 'requests_total{route="/books"} 3' in output
+
+    def test_gauge_goes_up_and_down(self):
+        # Arrange
+        registry = MetricsRegistry()
+        gauge = registry.gauge("in_progress", "In progress.")
+
+        # Act
+        gauge.inc()
+        gauge.inc()
+        gauge.dec()
+
+        # Assert
+        assert gauge.value() == 1
+        assert "in_progress 1" in registry.render()
+
+    def test_histogram_renders_cumulative_buckets(self):
+        # Arrange
+        registry = MetricsRegistry()
+        histogram = registry.histogram(
+            "latency_seconds", "Latency.", ("route",), buckets=(0.1, 1.0)
+        )
+
+        # Act
+        histogram.observe(0.05, "/books")
+        histogram.observe(0.5, "/books")
+        histogram.observe(5, "/books")
+        output = registry.render()
+
+        # Assert
+        assert 'latency_seconds_bucket{route="/books",le="0.1"} 1' in output
+        assert 'latency_seconds_bucket{route="/books",le="1"} 2' in output
+        assert 'latency_seconds_bucket{route="/books",le="+Inf"} 3' in output
+        assert 'latency_seconds_sum{route="/books"} 5.55' in output
+        assert 'latency_seconds_count{route="/books"} 3' in output
+
+    def test_same_name_returns_existing_metric(self):
+        # Arrange
+        registry = MetricsRegistry()
+
+        # Act
+        first = registry.counter("requests_total", "Requests.")
+        second = registry.counter("requests_total", "Requests.")
+
+        # Assert
+        assert first is second
+
+    def test_same_name_with_other_type_raises_error(self):
+        # Arrange
+        registry = MetricsRegistry()
+        registry.counter("requests_total", "Requests.")
+
+        # Act & Assert
+        with pytest.raises(ValueError):
+            registry.gauge("requests_total", "Requests.")
+
+    def test_wrong_label_count_raises_error(self):
+        # Arrange
+        registry = MetricsRegistry()
+        counter = registry.counter("requests_total", "Requests.", ("route",))
+
+        # Act & Assert
+        with pytest.raises(ValueError):
+            counter.inc()
+
+    def test_label_values_are_escaped(self):
+        # Arrange
+        registry = MetricsRegistry()
+        counter = registry.counter("requests_total", "Requests.", ("route",))
+
+        # Act
+        counter.inc('/a"b')
+
+        # Assert
+        assert 'requests_total{route="/a\\"b"} 1' in registry.render()
+
+    def test_collectors_are_rendered(self):
+        # Arrange
+        registry = MetricsRegistry()
+        registry.register_collector(lambda: ["custom_metric 7"])
+
+        # Act
+        output = registry.render()
+
+        # Assert
+        assert "custom_metric 7" in output
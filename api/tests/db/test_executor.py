@@ -0,0 +1,83 @@
+import asyncio
+import contextvars
+import threading
+
+from db.executor import DatabaseExecutor
+
+request_id = contextvars.ContextVar("request_id", default=None)
+
+
+class TestDatabaseExecutor:
+    def test_run_executes_on_database_thread(self):
+        # Arrange
+        executor = DatabaseExecutor(max_workers=2)
+
+        # Act
+        thread_name = asyncio.run(executor.run(lambda: threading.current_thread().name))
+        executor.shutdown()
+
+        # Assert
+        assert thread_name.startswith("db")
+
+    def test_run_propagates_context_variables(self):
+        # Arrange
+        executor = DatabaseExecutor(max_workers=1)
+
+        async def read_request_id():
+            request_id.set("abc")
+            return await executor.run(request_id.get)
+
+        # Act
+        result = asyncio.run(read_request_id())
+        executor.shutdown()
+
+        # Assert
+        assert result == "abc"
+
+    def test_iterate_yields_all_items_and_closes_iterator(self):
+        # Arrange
+        executor = DatabaseExecutor(max_workers=1)
+        closed = []
+
+        def numbers():
+            try:
+                yield from range(3)
+            finally:
+                closed.append(True)
+
+        async def collect():
+            return [item async for item in executor.iterate(numbers())]
+
+        # Act
+        result = asyncio.run(collect())
+        executor.shutdown()
+
+        # Assert
+        assert result == [0, 1, 2]
+        assert closed == [True]
+
+    def test_executor_can_be_reused_after_shutdown(self):
+        # Arrange
+        executor = DatabaseExecutor(max_workers=1)
+        asyncio.run(executor.run(lambda: None))
+        executor.shutdown()
+
+        # Act
+        result = asyncio.run(executor.run(lambda: 42))
+        executor.shutdown()
+
+        # Assert
+        assert result == 42
+
+    def test_warm_up_runs_once_on_every_database_thread(self):
+        # Arrange
+        executor = DatabaseExecutor(max_workers=3)
+        thread_names = []
+
+        # Act
+        executor.warm_up(lambda: thread_names.append(threading.current_thread().name))
+        executor.shutdown()
+
+        # Assert
+        assert len(thread_names) == 3
+        assert len(set(thread_names)) == 3
@@ -0,0 +1,312 @@
+import multiprocessing
+import os
+import sqlite3
+import tempfile
+
+import pytest
+
+from db.migrations import BackfillStep, Migration, SchemaStep, migrate
+from db.pool import close_connection_pools
+from db.setup import MIGRATIONS, init_db
+
+
+class MigrationInterrupted(Exception):
+    pass
+
+
+@pytest.fixture
+def db_path():
+    temp_dir = tempfile.mkdtemp()
+    db_path = os.path.join(temp_dir, "test.db")
+
+    yield db_path
+
+    close_connection_pools()
+    for path in (db_path, f"{db_path}-wal", f"{db_path}-shm"):
+        if os.path.exists(path):
+            os.remove(path)
+    os.rmdir(temp_dir)
+
+
+def create_books(db_path, count):
+    with sqlite3.connect(db_path) as connection:
+        connection.execute(
+            "CREATE TABLE IF NOT EXISTS books(id INTEGER PRIMARY KEY, title TEXT)"
+        )
+        connection.executemany(
+            "INSERT INTO books (title) VALUES (?)",
+            [(f"Book {i}",) for i in range(1, count + 1)],
+        )
+
+
+def user_version(db_path):
+    with sqlite3.connect(db_path) as connection:
+        return connection.execute("PRAGMA user_version").fetchone()[0]
+
+
+def init_db_when_released(db_path, start, batch_size):
+    """Runs in a separate process, the way each server process would"""
+    start.wait()
+    init_db(db_path, batch_size=batch_size)
+
+
+def copy_titles_migration(batches, fail_after_id=None):
+    """Copies book titles into book_titles, recording every batch it runs"""
+
+    def create_table(cursor):
+        cursor.execute("CREATE TABLE book_titles(id INTEGER PRIMARY KEY, title TEXT)")
+
+    def copy_titles(cursor, after_id, limit):
+        if fail_after_id is not None and after_id >= fail_after_id:
+            raise MigrationInterrupted
+        batches.append(after_id)
+        rows = cursor.execute(
+            "SELECT id, title FROM books WHERE id > ? ORDER BY id LIMIT ?",
+            (after_id, limit),
+        ).fetchall()
+        cursor.executemany("INSERT INTO book_titles VALUES (?, ?)", rows)
+        return rows[-1][0] if rows else None
+
+    def finish(cursor):
+        cursor.execute("CREATE INDEX idx_book_titles_title ON book_titles(title)")
+
+    return Migration(
+        1,
+        "book titles",
+        [SchemaStep(create_table), BackfillStep(copy_titles, finish)],
+    )
+
+
+class TestMigrate:
+    def test_migrate_runs_backfill_in_batches_and_sets_user_version(self, db_path):
+        # Arrange
+        create_books(db_path, 5)
+        batches = []
+
+        # Act
+        version = migrate(
+            [copy_titles_migration(batches)], db_path, batch_size=2
+        )
+
+        # Assert
+        assert version == 1
+        assert user_version(db_path) == 1
+        assert batches == [0, 2, 4, 5]
+        with sqlite3.connect(db_path) as connection:
+            count = connection.execute("SELECT count(*) FROM book_titles").fetchone()
+            index = connection.execute(
+                "SELECT 1 FROM sqlite_master WHERE name = 'idx_book_titles_title'"
+            ).fetchone()
+        assert count[0] == 5
+        assert index is not None
+
+    def test_migrate_skips_migrations_the_database_already_has(self, db_path):
+        # Arrange
+        create_books(db_path, 1)
+        migrate([copy_titles_migration([])], db_path)
+        batches = []
+
+        # Act
+        migrate([copy_titles_migration(batches)], db_path)
+
+        # Assert
+        assert batches == []
+
+    def test_migrate_resumes_interrupted_backfill_after_last_batch(self, db_path):
+        # Arrange
+        create_books(db_path, 5)
+        with pytest.raises(MigrationInterrupted):
+            migrate(
+                [copy_titles_migration([], fail_after_id=2)], db_path, batch_size=2
+            )
+        interrupted_version = user_version(db_path)
+        batches = []
+
+        # Act
+        migrate([copy_titles_migration(batches)], db_path, batch_size=2)
+
+        # Assert
+        assert interrupted_version == 0
+        assert batches == [2, 4, 5]
+        with sqlite3.connect(db_path) as connection:
+            ids = connection.execute("SELECT id FROM book_titles").fetchall()
+        assert ids == [(1,), (2,), (3,), (4,), (5,)]
+
+
+class TestMigrations:
+    def test_writes_during_search_backfill_are_indexed_once(self, db_path):
+        # Arrange
+        with sqlite3.connect(db_path) as connection:
+            connection.execute(
+                "CREATE TABLE books(id INTEGER PRIMARY KEY, title TEXT, description TEXT, author TEXT)"
+            )
+            connection.executemany(
+                "INSERT INTO books (title, description, author) VALUES (?, '', 'Author')",
+                [("Dune",), ("Emma",), ("Ulysses",)],
+            )
+        fts_backfill = MIGRATIONS[2].steps[1]
+
+        def write_then_index(cursor, after_id, limit):
+            # Runs between batches, the way another writer would
+            if after_id == 1:
+                cursor.execute("UPDATE books SET title = 'Arrakis' WHERE id = 1")
+                cursor.execute("UPDATE books SET title = 'Odyssey' WHERE id = 3")
+                cursor.execute("DELETE FROM books WHERE id = 2")
+                cursor.execute(
+                    "INSERT INTO books (title, description, author) "
+                    "VALUES ('Persuasion', '', 'Author')"
+                )
+            return fts_backfill.batch(cursor, after_id, limit)
+
+        migrations = list(MIGRATIONS)
+        migrations[2] = Migration(
+            3,
+            MIGRATIONS[2].name,
+            [
+                MIGRATIONS[2].steps[0],
+                BackfillStep(write_then_index, fts_backfill.finish),
+            ],
+        )
+
+        # Act
+        migrate(migrations, db_path, batch_size=1)
+
+        # Assert
+        with sqlite3.connect(db_path) as connection:
+            connection.execute("INSERT INTO books_fts(books_fts) VALUES ('integrity-check')")
+            matches = {
+                title: connection.execute(
+                    "SELECT rowid FROM books_fts WHERE books_fts MATCH ?", (title,)
+                ).fetchall()
+                for title in ("dune", "arrakis", "emma", "odyssey", "persuasion")
+            }
+            changes = connection.execute(
+                "SELECT book_id, operation FROM book_changes ORDER BY seq"
+            ).fetchall()
+        assert matches == {
+            "dune": [],
+            "arrakis": [(1,)],
+            "emma": [],
+            "odyssey": [(3,)],
+            "persuasion": [(4,)],
+        }
+        assert changes == [(1, "insert"), (3, "insert"), (4, "insert")]
+
+    def test_init_db_brings_database_to_latest_version(self, db_path):
+        # Act
+        init_db(db_path)
+
+        # Assert
+        assert user_version(db_path) == MIGRATIONS[-1].version
+        with sqlite3.connect(db_path) as connection:
+            state = connection.execute(
+                "SELECT count(*) FROM schema_migration_state"
+            ).fetchone()
+        assert state[0] == 0
+
+    def test_deleted_book_ids_are_not_reused(self, db_path):
+        # Arrange
+        init_db(db_path)
+        with sqlite3.connect(db_path) as connection:
+            connection.execute("INSERT INTO books (title) VALUES ('Old')")
+            connection.execute("DELETE FROM books WHERE title = 'Old'")
+
+            # Act
+            cursor = connection.execute("INSERT INTO books (title) VALUES ('New')")
+
+        # Assert
+        assert cursor.lastrowid == 2
+
+    def test_books_rebuild_keeps_writes_and_ids_deleted_before_it(self, db_path):
+        # Arrange
+        migrate(MIGRATIONS[:4], db_path)
+        with sqlite3.connect(db_path) as connection:
+            connection.executemany(
+                "INSERT INTO books (title, description, author) VALUES (?, '', 'Author')",
+                [("Dune",), ("Emma",), ("Ulysses",), ("Walden",)],
+            )
+            # Logged, so the rebuild knows id 4 was handed out
+            connection.execute("DELETE FROM books WHERE id = 4")
+        close_connection_pools()
+        copy = MIGRATIONS[4].steps[1]
+
+        def write_then_copy(cursor, after_id, limit):
+            # Runs between batches, the way another writer would
+            if after_id == 1:
+                cursor.execute("UPDATE books SET title = 'Arrakis' WHERE id = 1")
+                cursor.execute("UPDATE books SET title = 'Odyssey' WHERE id = 3")
+                cursor.execute("DELETE FROM books WHERE id = 2")
+            return copy.batch(cursor, after_id, limit)
+
+        migrations = list(MIGRATIONS)
+        migrations[4] = Migration(
+            5,
+            MIGRATIONS[4].name,
+            [MIGRATIONS[4].steps[0], BackfillStep(write_then_copy, copy.finish)],
+        )
+
+        # Act
+        migrate(migrations, db_path, batch_size=1)
+
+        # Assert
+        with sqlite3.connect(db_path) as connection:
+            titles = connection.execute("SELECT id, title FROM books ORDER BY id").fetchall()
+            new_id = connection.execute(
+                "INSERT INTO books (title, description, author) VALUES ('Emma', '', 'Author')"
+            ).lastrowid
+            connection.execute("INSERT INTO books_fts(books_fts) VALUES ('integrity-check')")
+            matches = connection.execute(
+                "SELECT rowid FROM books_fts WHERE books_fts MATCH 'emma'"
+            ).fetchall()
+            last_change = connection.execute(
+                "SELECT book_id, operation FROM book_changes ORDER BY seq DESC LIMIT 1"
+            ).fetchone()
+            indexes = connection.execute(
+                "SELECT name FROM sqlite_master WHERE type = 'index' AND tbl_name = 'books' "
+                "AND name LIKE 'idx_%' ORDER BY name"
+            ).fetchall()
+        assert titles == [(1, "Arrakis"), (3, "Odyssey")]
+        assert new_id == 5
+        assert matches == [(5,)]
+        assert last_change == (5, "insert")
+        assert indexes == [("idx_books_author",), ("idx_books_title",)]
+
+    def test_processes_starting_together_migrate_the_database_once(self, db_path):
+        # Arrange
+        with sqlite3.connect(db_path) as connection:
+            connection.execute(
+                "CREATE TABLE books(id INTEGER PRIMARY KEY, title TEXT, description TEXT, author TEXT)"
+            )
+            connection.executemany(
+                "INSERT INTO books (title, description, author) VALUES (?, '', 'Author')",
+                [(f"Book {i}",) for i in range(1, 5001)],
+            )
+        context = multiprocessing.get_context("fork")
+        start = context.Event()
+        processes = [
+            context.Process(target=init_db_when_released, args=(db_path, start, 10))
+            for _ in range(2)
+        ]
+        for process in processes:
+            process.start()
+
+        # Act
+        start.set()
+        for process in processes:
+            process.join(timeout=60)
+
+        # Assert
+        assert [process.exitcode for process in processes] == [0, 0]
+        assert user_version(db_path) == MIGRATIONS[-1].version
+        with sqlite3.connect(db_path) as connection:
+            connection.execute("INSERT INTO books_fts(books_fts) VALUES ('integrity-check')")
+            ids = connection.execute("SELECT id FROM books ORDER BY id").fetchall()
+            changes = connection.execute(
+                "SELECT count(*), count(DISTINCT book_id) FROM book_changes"
+            ).fetchone()
+            state = connection.execute(
+                "SELECT count(*) FROM schema_migration_state"
+            ).fetchone()
+        assert ids == [(i,) for i in range(1, 5001)]
+        assert changes == (5000, 5000)
+        assert state[0] == 0
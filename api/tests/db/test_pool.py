@@ -0,0 +1,192 @@
+import os
+import sqlite3
+import tempfile
+import threading
+
+import pytest
+
+from db.pool import ConnectionPool
+from db.tracing import TracingConnection
+
+
+@pytest.fixture
+def pool():
+    temp_dir = tempfile.mkdtemp()
+    db_path = os.path.join(temp_dir, "test.db")
+    pool = ConnectionPool(
+        db_path,
+        journal_mode="WAL",
+        synchronous="NORMAL",
+        mmap_size=1024 * 1024,
+        cache_size=-2048,
+        busy_timeout_ms=1234,
+    )
+    with pool.writer() as connection:
+        connection.execute("CREATE TABLE books(id INTEGER PRIMARY KEY, title TEXT)")
+
+    yield pool
+
+    pool.close()
+    for path in (db_path, f"{db_path}-wal", f"{db_path}-shm"):
+        if os.path.exists(path):
+            os.remove(path)
+    os.rmdir(temp_dir)
+
+
+class TestConnectionPool:
+    def test_connections_are_tuned(self, pool):
+        # Act
+        with pool.reader() as connection:
+            journal_mode = connection.execute("PRAGMA journal_mode").fetchone()
+            synchronous = connection.execute("PRAGMA synchronous").fetchone()
+            busy_timeout = connection.execute("PRAGMA busy_timeout").fetchone()
+            cache_size = connection.execute("PRAGMA cache_size").fetchone()
+
+        # Assert
+        assert journal_mode[0] == "wal"
+        assert synchronous[0] == 1  # NORMAL
+        assert busy_timeout[0] == 1234
+        assert cache_size[0] == -2048
+
+    def test_reader_connection_is_reused_within_a_thread(self, pool):
+        # Act
+        with pool.reader() as first:
+            pass
+        with pool.reader() as second:
+            pass
+
+        # Assert
+        assert first is second
+
+    def test_reader_connections_are_per_thread(self, pool):
+        # Arrange
+        connections = []
+
+        def read():
+            with pool.reader() as connection:
+                connections.append(connection)
+
+        # Act
+        read()
+        thread = threading.Thread(target=read)
+        thread.start()
+        thread.join()
+
+        # Assert
+        assert connections[0] is not connections[1]
+
+    def test_reader_connection_is_read_only(self, pool):
+        # Act & Assert
+        with pool.reader() as connection:
+            with pytest.raises(sqlite3.OperationalError):
+                connection.execute("INSERT INTO books (title) VALUES ('Title')")
+
+    def test_writer_commits_on_success(self, pool):
+        # Act
+        with pool.writer() as connection:
+            connection.execute("INSERT INTO books (title) VALUES ('Title')")
+
+        # Assert
+        with pool.reader() as connection:
+            count = connection.execute("SELECT count(*) FROM books").fetchone()
+        assert count[0] == 1
+
+    def test_writer_rolls_back_on_error(self, pool):
+        # Act
+        with pytest.raises(RuntimeError):
+            with pool.writer() as connection:
+                connection.execute("INSERT INTO books (title) VALUES ('Title')")
+                raise RuntimeError("boom")
+
+        # Assert
+        with pool.reader() as connection:
+            count = connection.execute("SELECT count(*) FROM books").fetchone()
+        assert count[0] == 0
+
+    def test_nested_writer_rolls_back_only_its_own_changes(self, pool):
+        # Act
+        with pool.writer() as connection:
+            connection.execute("INSERT INTO books (title) VALUES ('Kept')")
+            with pytest.raises(RuntimeError):
+                with pool.writer() as nested:
+                    nested.execute("INSERT INTO books (title) VALUES ('Dropped')")
+                    raise RuntimeError("boom")
+            with pool.writer() as nested:
+                nested.execute("INSERT INTO books (title) VALUES ('Also kept')")
+
+        # Assert
+        with pool.reader() as connection:
+            titles = connection.execute("SELECT title FROM books ORDER BY id").fetchall()
+        assert titles == [("Kept",), ("Also kept",)]
+
+    def test_nested_writer_changes_roll_back_with_outer_transaction(self, pool):
+        # Act
+        with pytest.raises(RuntimeError):
+            with pool.writer():
+                with pool.writer() as nested:
+                    nested.execute("INSERT INTO books (title) VALUES ('Title')")
+                raise RuntimeError("boom")
+
+        # Assert
+        with pool.reader() as connection:
+            count = connection.execute("SELECT count(*) FROM books").fetchone()
+        assert count[0] == 0
+
+    def test_close_allows_pool_to_be_reused(self, pool):
+        # Arrange
+        with pool.reader() as before_close:
+            pass
+
+        # Act
+        pool.close()
+        with pool.reader() as after_close:
+            count = after_close.execute("SELECT count(*) FROM books").fetchone()
+
+        # Assert
+        assert after_close is not before_close
+        assert count[0] == 0
+
+    def test_query_tracing_can_be_disabled(self, tmp_path):
+        # Arrange
+        traced_pool = ConnectionPool(str(tmp_path / "traced.db"), query_tracing=True)
+        plain_pool = ConnectionPool(str(tmp_path / "plain.db"), query_tracing=False)
+
+        # Act
+        with traced_pool.writer() as traced, plain_pool.writer() as plain:
+            traced_type = type(traced)
+            plain_type = type(plain)
+        traced_pool.close()
+        plain_pool.close()
+
+        # Assert
+        assert traced_type is TracingConnection
+        assert plain_type is sqlite3.Connection
+
+    @pytest.mark.skipif(not hasattr(os, "fork"), reason="needs os.fork")
+    def test_forked_child_opens_its_own_connections(self, pool):
+        # Arrange
+        with pool.reader() as parent_connection:
+            pass
+        read_fd, write_fd = os.pipe()
+
+        # Act
+        pid = os.fork()
+        if pid == 0:
+            try:
+                with pool.writer() as connection:
+                    connection.execute("INSERT INTO books (title) VALUES ('Child')")
+                with pool.reader() as connection:
+                    reused = connection is parent_connection
+                os.write(write_fd, b"reused" if reused else b"own")
+            finally:
+                os._exit(0)
+        os.close(write_fd)
+        with os.fdopen(read_fd, "rb") as pipe:
+            child_result = pipe.read()
+        os.waitpid(pid, 0)
+
+        # Assert
+        assert child_result == b"own"
+        with pool.reader() as connection:
+            titles = connection.execute("SELECT title FROM books").fetchall()
+        assert titles == [("Child",)]
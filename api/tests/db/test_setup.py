@@ -0,0 +1,117 @@
+import os
+import sqlite3
+import tempfile
+
+import pytest
+
+from db.pool import close_connection_pools
+from db.setup import init_db
+
+
+@pytest.fixture
+def db_path():
+    temp_dir = tempfile.mkdtemp()
+    db_path = os.path.join(temp_dir, "test.db")
+
+    yield db_path
+
+    close_connection_pools()
+    for path in (db_path, f"{db_path}-wal", f"{db_path}-shm"):
+        if os.path.exists(path):
+            os.remove(path)
+    os.rmdir(temp_dir)
+
+
+class TestInitDb:
+    def test_init_db_is_idempotent(self, db_path):
+        # Act
+        init_db(db_path)
+        init_db(db_path)
+
+        # Assert
+        with sqlite3.connect(db_path) as connection:
+            tables = {
+                row[0]
+                for row in connection.execute(
+                    "SELECT name FROM sqlite_master WHERE type = 'table'"
+                )
+            }
+        assert {"books", "books_fts"} <= tables
+
+    def test_init_db_indexes_existing_books_for_search(self, db_path):
+        # Arrange
+        with sqlite3.connect(db_path) as connection:
+            connection.execute(
+                "CREATE TABLE books(id INTEGER PRIMARY KEY, title TEXT, description TEXT, author TEXT)"
+            )
+            connection.execute(
+                "INSERT INTO books (title, description, author) VALUES ('Dune', '', 'Frank Herbert')"
+            )
+
+        # Act
+        init_db(db_path)
+
+        # Assert
+        with sqlite3.connect(db_path) as connection:
+            result = connection.execute(
+                "SELECT rowid FROM books_fts WHERE books_fts MATCH 'herbert'"
+            ).fetchall()
+        assert result == [(1,)]
+
+    def test_init_db_adds_version_columns_to_existing_books(self, db_path):
+        # Arrange
+        with sqlite3.connect(db_path) as connection:
+            connection.execute(
+                "CREATE TABLE books(id INTEGER PRIMARY KEY, title TEXT, description TEXT, author TEXT)"
+            )
+            connection.execute(
+                "INSERT INTO books (title, description, author) VALUES ('Dune', '', 'Frank Herbert')"
+            )
+
+        # Act
+        init_db(db_path)
+
+        # Assert
+        with sqlite3.connect(db_path) as connection:
+            result = connection.execute("SELECT version, updated_at FROM books").fetchall()
+        assert result == [(1, 0)]
+
+    def test_init_db_records_writes_in_book_changes(self, db_path):
+        # Arrange
+        init_db(db_path)
+
+        # Act
+        with sqlite3.connect(db_path) as connection:
+            connection.execute(
+                "INSERT INTO books (title, description, author) VALUES ('Dune', '', 'Frank Herbert')"
+            )
+            connection.execute("UPDATE books SET title = 'Dune Messiah' WHERE id = 1")
+            connection.execute("DELETE FROM books WHERE id = 1")
+
+        # Assert
+        with sqlite3.connect(db_path) as connection:
+            result = connection.execute(
+                "SELECT seq, book_id, operation FROM book_changes ORDER BY seq"
+            ).fetchall()
+        assert result == [(1, 1, "insert"), (2, 1, "update"), (3, 1, "delete")]
+
+    def test_init_db_seeds_book_changes_with_existing_books(self, db_path):
+        # Arrange
+        with sqlite3.connect(db_path) as connection:
+            connection.execute(
+                "CREATE TABLE books(id INTEGER PRIMARY KEY, title TEXT, description TEXT, author TEXT)"
+            )
+            connection.execute(
+                "INSERT INTO books (title, description, author) VALUES ('Dune', '', 'Frank Herbert')"
+            )
+
+        # Act
+        init_db(db_path)
+        init_db(db_path)
+
+        # Assert
+        with sqlite3.connect(db_path) as connection:
+            result = connection.execute(
+                "SELECT book_id, operation FROM book_changes"
+            ).fetchall()
+        assert result == [(1, "insert")]
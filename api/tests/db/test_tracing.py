@@ -0,0 +1,141 @@
+import asyncio
+import logging
+import sqlite3
+
+import pytest
+
+from db import tracing
+from db.executor import DatabaseExecutor
+from db.tracing import TracingConnection, collect_query_stats
+
+
+@pytest.fixture
+def connection():
+    connection = sqlite3.connect(
+        ":memory:",
+        isolation_level=None,
+        factory=TracingConnection,
+    )
+    connection.execute("CREATE TABLE books (id INTEGER PRIMARY KEY, title TEXT)")
+    connection.execute("INSERT INTO books (title) VALUES ('A'), ('B'), ('C')")
+    yield connection
+    connection.close()
+
+
+@pytest.fixture
+def recorded(monkeypatch):
+    records = []
+    monkeypatch.setattr(tracing, "_record", lambda *args: records.append(args))
+    return records
+
+
+class TestTracingCursor:
+    def test_statements_are_attributed_to_the_calling_method(self, connection, recorded):
+        # Arrange
+        def list_titles():
+            return connection.cursor().execute("SELECT title FROM books").fetchall()
+
+        # Act
+        list_titles()
+
+        # Assert
+        operation, statement, seconds, rows = recorded[-1]
+        assert operation.endswith("list_titles")
+        assert statement == "SELECT title FROM books"
+        assert seconds >= 0
+        assert rows == 3
+
+    def test_connection_execute_is_traced(self, connection, recorded):
+        # Act
+        connection.execute("SELECT id FROM books WHERE id = 1").fetchone()
+
+        # Assert
+        assert recorded[-1][1] == "SELECT id FROM books WHERE id = 1"
+        assert recorded[-1][3] == 1
+
+    def test_writes_are_recorded_with_affected_rows(self, connection, recorded):
+        # Act
+        connection.execute("DELETE FROM books WHERE id > 1")
+
+        # Assert
+        assert recorded[-1][1] == "DELETE FROM books WHERE id > 1"
+        assert recorded[-1][3] == 2
+
+    def test_fetchmany_records_once_rows_are_exhausted(self, connection, recorded):
+        # Arrange
+        cursor = connection.cursor()
+        cursor.execute("SELECT id FROM books")
+
+        # Act
+        cursor.fetchmany(2)
+        recorded_before_exhausted = len(recorded)
+        cursor.fetchmany(2)
+
+        # Assert
+        assert len(recorded) == recorded_before_exhausted + 1
+        assert recorded[-1][3] == 3
+
+
+class TestQueryLogging:
+    def test_slow_queries_are_logged_as_warnings(self, connection, monkeypatch, caplog):
+        # Arrange
+        monkeypatch.setattr(tracing.app_settings, "db_slow_query_ms", 0.0)
+
+        # Act
+        with caplog.at_level(logging.WARNING, logger="db.queries"):
+            connection.execute("SELECT title FROM books").fetchall()
+
+        # Assert
+        assert "Slow query" in caplog.text
+        assert "SELECT title FROM books" in caplog.text
+
+    def test_transaction_control_is_not_logged_as_slow_query(self, connection, monkeypatch, caplog):
+        # Arrange
+        monkeypatch.setattr(tracing.app_settings, "db_slow_query_ms", 0.0)
+
+        # Act
+        with caplog.at_level(logging.WARNING, logger="db.queries"):
+            connection.execute("BEGIN IMMEDIATE")
+            connection.execute("COMMIT")
+
+        # Assert
+        assert "Slow query" not in caplog.text
+        assert "Slow transaction control" in caplog.text
+        assert "BEGIN IMMEDIATE" in caplog.text
+
+    def test_fast_queries_are_not_logged_as_warnings(self, connection, monkeypatch, caplog):
+        # Arrange
+        monkeypatch.setattr(tracing.app_settings, "db_slow_query_ms", 10_000.0)
+
+        # Act
+        with caplog.at_level(logging.WARNING, logger="db.queries"):
+            connection.execute("SELECT title FROM books").fetchall()
+
+        # Assert
+        assert caplog.text == ""
+
+
+class TestCollectQueryStats:
+    def test_counts_statements_run_on_executor_threads(self, tmp_path):
+        # Arrange
+        db_path = str(tmp_path / "test.db")
+        executor = DatabaseExecutor(max_workers=1)
+
+        def run_queries():
+            connection = sqlite3.connect(db_path, factory=TracingConnection)
+            connection.execute("SELECT 1").fetchall()
+            connection.execute("SELECT 2").fetchall()
+            connection.close()
+
+        async def handle_request():
+            with collect_query_stats() as stats:
+                await executor.run(run_queries)
+            return stats
+
+        # Act
+        stats = asyncio.run(handle_request())
+        executor.shutdown()
+
+        # Assert
+        assert stats.count == 2
+        assert stats.total_seconds > 0
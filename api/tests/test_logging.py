@@ -0,0 +1,120 @@
+import json
+import logging
+import queue
+import threading
+from logging.handlers import QueueListener
+
+from config.logging import (
+    ContextQueueHandler,
+    JSONFormatter,
+    bind_request_context,
+)
+
+
+class RecordingHandler(logging.Handler):
+    def __init__(self):
+        super().__init__()
+        self.records = []
+        self.thread_names = []
+
+    def emit(self, record):
+        self.records.append(record)
+        self.thread_names.append(threading.current_thread().name)
+
+
+class Route:
+    path = "/api/v1/books/{book_id}"
+
+
+def make_logger(name, handler):
+    logger = logging.getLogger(name)
+    logger.propagate = False
+    logger.handlers = [handler]
+    logger.setLevel(logging.INFO)
+    return logger
+
+
+class TestContextQueueHandler:
+    def test_records_are_handled_on_the_listener_thread(self):
+        # Arrange
+        log_queue = queue.SimpleQueue()
+        recording = RecordingHandler()
+        listener = QueueListener(log_queue, recording)
+        logger = make_logger("tests.queue", ContextQueueHandler(log_queue))
+
+        # Act
+        listener.start()
+        logger.info("Book %d saved", 7)
+        listener.stop()
+
+        # Assert
+        assert recording.records[0].getMessage() == "Book 7 saved"
+        assert recording.thread_names[0] != "MainThread"
+
+    def test_records_carry_request_context(self):
+        # Arrange
+        log_queue = queue.SimpleQueue()
+        logger = make_logger("tests.context", ContextQueueHandler(log_queue))
+
+        # Act
+        with bind_request_context("abc123", {"route": Route()}):
+            logger.info("Inside request")
+        logger.info("Outside request")
+
+        # Assert
+        inside = log_queue.get_nowait()
+        outside = log_queue.get_nowait()
+        assert inside.request_id == "abc123"
+        assert inside.route == "/api/v1/books/{book_id}"
+        assert getattr(outside, "request_id", None) is None
+
+    def test_exceptions_are_rendered_before_queueing(self):
+        # Arrange
+        log_queue = queue.SimpleQueue()
+        logger = make_logger("tests.exception", ContextQueueHandler(log_queue))
+
+        # Act
+        try:
+            raise ValueError("boom")
+        except ValueError:
+            logger.exception("Failed")
+
+        # Assert
+        record = log_queue.get_nowait()
+        assert record.exc_info is None
+        assert "ValueError: boom" in record.exc_text
+
+
+class TestJSONFormatter:
+    def test_formats_context_fields_as_json(self):
+        # Arrange
+        record = logging.LogRecord(
+            "api.requests", logging.INFO, __file__, 1, "GET %s", ("/books",), None
+        )
+        record.request_id = "abc123"
+        record.route = "/api/v1/books/"
+        record.duration_ms = 1.5
+
+        # Act
+        entry = json.loads(JSONFormatter().format(record))
+
+        # Assert
+        assert entry["message"] == "GET /books"
+        assert entry["level"] == "INFO"
+        assert entry["logger"] == "api.requests"
+        assert entry["request_id"] == "abc123"
+        assert entry["route"] == "/api/v1/books/"
+        assert entry["duration_ms"] == 1.5
+
+    def test_omits_missing_context_fields(self):
+        # Arrange
+        record = logging.LogRecord(
+            "db.queries", logging.WARNING, __file__, 1, "Slow", None, None
+        )
+
+        # Act
+        entry = json.loads(JSONFormatter().format(record))
+
+        # Assert
+        assert "request_id" not in entry
+        assert "duration_ms" not in entry
@@ -0,0 +1,55 @@
+from config.settings import Settings
+from serve import worker_setting_errors
+
+
+def make_settings(**overrides):
+    return Settings(app_secret_key="test", server_port="8000", **overrides)
+
+
+class TestWorkerSettingErrors:
+    def test_single_worker_accepts_any_database(self):
+        # Arrange
+        settings = make_settings(
+            server_workers=1, db_url="memory://", db_journal_mode="DELETE"
+        )
+
+        # Act
+        errors = worker_setting_errors(settings)
+
+        # Assert
+        assert errors == []
+
+    def test_several_workers_on_wal_database_are_accepted(self):
+        # Arrange
+        settings = make_settings(server_workers=4, db_url="db/dev.db")
+
+        # Act
+        errors = worker_setting_errors(settings)
+
+        # Assert
+        assert errors == []
+
+    def test_several_workers_reject_settings_that_are_per_process(self):
+        # Arrange
+        settings = make_settings(
+            server_workers=2,
+            db_url="memory://",
+            db_journal_mode="DELETE",
+            book_snapshot_enabled=True,
+        )
+
+        # Act
+        errors = worker_setting_errors(settings)
+
+        # Assert
+        assert len(errors) == 3
+        assert errors[0].startswith("DB_URL=memory://")
+        assert errors[1].startswith("DB_JOURNAL_MODE needs to be WAL")
+        assert errors[2].startswith("BOOK_SNAPSHOT_ENABLED")
+
+    def test_zero_workers_is_rejected(self):
+        # Act
+        errors = worker_setting_errors(make_settings(server_workers=0))
+
+        # Assert
+        assert errors == ["SERVER_WORKERS needs to be at least 1"]